@@ -220,7 +220,8 @@ def build_from_document(
   document that is it given, as opposed to retrieving one over HTTP.
 
   Args:
-    service: string, discovery document.
+    service: string or object, discovery document, or the deserialized
+      discovery document.
     base: string, base URI for all HTTP requests, usually the discovery URI.
     future: string, discovery document with future capabilities (deprecated).
     http: httplib2.Http, An instance of httplib2.Http or something that acts
@@ -238,7 +239,8 @@ def build_from_document(
   # future is no longer used.
   future = {}
 
-  service = simplejson.loads(service)
+  if isinstance(service, basestring):
+    service = simplejson.loads(service)
   base = urlparse.urljoin(base, service['basePath'])
   schema = Schemas(service)
 
@@ -330,9 +332,12 @@ def _createResource(http, baseUrl, model, requestBuilder,
 
   Returns:
     An instance of Resource with all the methods attached for interacting with
-    that resource.
+    that resource. The methods are attached the first time they are looked up.
   """
 
+  # A map from method name to the (function, args) that attaches the method.
+  lazyMethods = {}
+
   class Resource(object):
     """A class for interacting with a resource."""
 
@@ -343,6 +348,29 @@ def _createResource(http, baseUrl, model, requestBuilder,
       self._developerKey = developerKey
       self._requestBuilder = requestBuilder
 
+    def __getattr__(self, name):
+      # Only called for attributes not found otherwise, so each method is
+      # attached once, on first use, instead of all of them up front.
+      if name not in lazyMethods:
+        raise AttributeError(name)
+      create, args = lazyMethods[name]
+      create(*args)
+      return getattr(self, name)
+
+  def addLazyMethod(create, theclass, methodName, methodDesc, rootDesc):
+    """Arranges for a method to be attached to a Resource when first used.
+
+    Args:
+      create: function, the function that attaches the method.
+      theclass: type, the class to attach methods to.
+      methodName: string, name of the method to use.
+      methodDesc: object, fragment of deserialized discovery document that
+        describes the method.
+      rootDesc: object, the entire deserialized discovery document.
+    """
+    lazyMethods[fix_method_name(methodName)] = (
+        create, (theclass, methodName, methodDesc, rootDesc))
+
   def createMethod(theclass, methodName, methodDesc, rootDesc):
     """Creates a method for attaching to a Resource.
 
@@ -690,11 +718,12 @@ def _createResource(http, baseUrl, model, requestBuilder,
   # Add basic methods to Resource
   if 'methods' in resourceDesc:
     for methodName, methodDesc in resourceDesc['methods'].iteritems():
-      createMethod(Resource, methodName, methodDesc, rootDesc)
+      addLazyMethod(createMethod, Resource, methodName, methodDesc, rootDesc)
       # Add in _media methods. The functionality of the attached method will
       # change when it sees that the method name ends in _media.
       if methodDesc.get('supportsMediaDownload', False):
-        createMethod(Resource, methodName + '_media', methodDesc, rootDesc)
+        addLazyMethod(createMethod, Resource, methodName + '_media',
+                      methodDesc, rootDesc)
 
   # Add in nested resources
   if 'resources' in resourceDesc:
@@ -736,8 +765,8 @@ def _createResource(http, baseUrl, model, requestBuilder,
                                                                  {})
         hasPageToken = 'pageToken' in methodDesc.get('parameters', {})
         if hasNextPageToken and hasPageToken:
-          createNextMethod(Resource, methodName + '_next',
-                           resourceDesc['methods'][methodName],
-                           methodName)
+          addLazyMethod(createNextMethod, Resource, methodName + '_next',
+                        resourceDesc['methods'][methodName],
+                        methodName)
 
   return Resource()
@@ -27,6 +27,7 @@ import httplib2
 import logging
 import os
 import sys
+import threading
 import time
 import urllib
 import urlparse
@@ -52,6 +53,10 @@ logger = logging.getLogger(__name__)
 # Expiry is stored in RFC3339 UTC format
 EXPIRY_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
+# How long before its expiry an access_token is refreshed, so that it does
+# not expire while a request using it is on its way.
+TOKEN_EXPIRY_MARGIN = datetime.timedelta(seconds=60)
+
 # Which certs to use to validate id_tokens received.
 ID_TOKEN_VERIFICATON_CERTS = 'https://www.googleapis.com/oauth2/v1/certs'
 
@@ -118,7 +123,7 @@ class Credentials(object):
   string as input and returns an instaniated Credentials object.
   """
 
-  NON_SERIALIZED_MEMBERS = ['store']
+  NON_SERIALIZED_MEMBERS = ['store', '_refresh_lock']
 
   def authorize(self, http):
     """Take an httplib2.Http instance (or equivalent) and
@@ -359,6 +364,10 @@ class OAuth2Credentials(Credentials):
     self.token_uri = token_uri
     self.user_agent = user_agent
     self.id_token = id_token
+    # Held while refreshing, so that threads needing a refresh of this
+    # credential at the same time wait for a single refresh instead of
+    # each making one.
+    self._refresh_lock = threading.RLock()
 
     # True if the credentials have been revoked or expired and can't be
     # refreshed.
@@ -369,7 +378,9 @@ class OAuth2Credentials(Credentials):
 
     The modified http.request method will add authentication headers to each
     request and will refresh access_tokens when a 401 is received on a
-    request. In addition the http.request method has a credentials property,
+    request, or before a request if the access_token is about to expire.
+    Threads sending requests with the same credentials share a refresh.
+    In addition the http.request method has a credentials property,
     http.request.credentials, which is the Credentials object that authorized
     it.
 
@@ -399,7 +410,10 @@ class OAuth2Credentials(Credentials):
                     connection_type=None):
       if not self.access_token:
         logger.info('Attempting refresh to obtain initial access_token')
-        self._refresh(request_orig)
+        self._refresh_once(request_orig)
+      elif self._access_token_expiring():
+        logger.info('Refreshing access_token before it expires')
+        self._refresh_once(request_orig)
 
       # Modify the request headers to add the appropriate
       # Authorization header.
@@ -418,7 +432,7 @@ class OAuth2Credentials(Credentials):
 
       if resp.status == 401:
         logger.info('Refreshing due to a 401')
-        self._refresh(request_orig)
+        self._refresh_once(request_orig, headers['Authorization'])
         self.apply(headers)
         return request_orig(uri, method, body, headers,
                             redirections, connection_type)
@@ -503,6 +517,16 @@ class OAuth2Credentials(Credentials):
       return True
     return False
 
+  def _access_token_expiring(self):
+    """True if the access_token expires within TOKEN_EXPIRY_MARGIN.
+
+    If the token_expiry isn't set, we assume the token doesn't expire.
+    """
+    if not self.token_expiry:
+      return False
+    return (datetime.datetime.utcnow() + TOKEN_EXPIRY_MARGIN >=
+            self.token_expiry)
+
   def set_store(self, store):
     """Set the Storage for the credential.
 
@@ -523,12 +547,14 @@ class OAuth2Credentials(Credentials):
     """Trim the state down to something that can be pickled."""
     d = copy.copy(self.__dict__)
     del d['store']
+    d.pop('_refresh_lock', None)
     return d
 
   def __setstate__(self, state):
     """Reconstitute the state of the object from being pickled."""
     self.__dict__.update(state)
     self.store = None
+    self._refresh_lock = threading.RLock()
 
   def _generate_refresh_request_body(self):
     """Generate the body that will be used in the refresh request."""
@@ -551,6 +577,40 @@ class OAuth2Credentials(Credentials):
 
     return headers
 
+  def _refresh_once(self, http_request, rejected_token=None):
+    """Refreshes the access_token unless another thread just did.
+
+    Only one thread refreshes at a time.  A thread that waited for another
+    to refresh uses the access_token the other thread got, instead of
+    refreshing it again.
+
+    Args:
+      http_request: callable, a callable that matches the method signature of
+        httplib2.Http.request, used to make the refresh request.
+      rejected_token: string, the Authorization header of a request that
+        was rejected with a 401, if the refresh is due to one.
+
+    Raises:
+      AccessTokenRefreshError: When the refresh fails.
+    """
+    access_token = self.access_token
+    self._refresh_lock.acquire()
+    try:
+      if self.access_token != access_token:
+        logger.info('Using access_token refreshed by another thread')
+        return
+      if rejected_token is not None:
+        headers = {}
+        self.apply(headers)
+        if headers['Authorization'] != rejected_token:
+          logger.info('Using access_token refreshed since the request')
+          return
+      elif access_token and not self._access_token_expiring():
+        return
+      self._refresh(http_request)
+    finally:
+      self._refresh_lock.release()
+
   def _refresh(self, http_request):
     """Refreshes the access_token.
 
@@ -36,6 +36,7 @@ import errno
 import logging
 import os
 import threading
+import time
 
 from anyjson import simplejson
 from client import Storage as BaseStorage
@@ -48,6 +49,10 @@ logger = logging.getLogger(__name__)
 _multistores = {}
 _multistores_lock = threading.Lock()
 
+# The coarsest modification time resolution of the file systems the
+# multistore file may be on, in seconds.
+_STAT_RESOLUTION = 2
+
 
 class Error(Exception):
   """Base error for this module."""
@@ -110,6 +115,11 @@ class _MultiStore(object):
     # If this is None, then the store hasn't been read yet.
     self._data = None
 
+    # The (inode, modification time, change time, size) of the file when
+    # _data was last read from or written to it.  The file is only read
+    # again once they change.
+    self._data_stat = None
+
   class _Storage(BaseStorage):
     """A Storage object that knows how to read/write a single credential."""
 
@@ -197,12 +207,14 @@ class _MultiStore(object):
       # The multistore is empty so write out an empty file.
       self._data = {}
       self._write()
-    elif not self._read_only or self._data is None:
-      # Only refresh the data if we are read/write or we haven't
-      # cached the data yet.  If we are readonly, we assume is isn't
-      # changing out from under us and that we only have to read it
-      # once.  This prevents us from whacking any new access keys that
-      # we have cached in memory but were unable to write out.
+    elif self._data is None:
+      self._refresh_data_cache()
+    elif not self._read_only and self._locked_file_changed():
+      # Only refresh the data if we are read/write and another process
+      # has written the file since we read it.  If we are readonly, we
+      # assume is isn't changing out from under us and that we only have
+      # to read it once.  This prevents us from whacking any new access
+      # keys that we have cached in memory but were unable to write out.
       self._refresh_data_cache()
 
   def _unlock(self):
@@ -210,6 +222,27 @@ class _MultiStore(object):
     self._file.unlock_and_close()
     self._thread_lock.release()
 
+  def _locked_stat(self):
+    """Get the (inode, modification time, change time, size) of the file.
+
+    The multistore must be locked when this is called.
+    """
+    stat = os.fstat(self._file.file_handle().fileno())
+    return (stat.st_ino, stat.st_mtime, stat.st_ctime, stat.st_size)
+
+  def _locked_file_changed(self):
+    """True if the file may have been written since _data was last synced.
+
+    A rewrite of the file by another process with the same size within the
+    timestamp resolution of the file system leaves its stat unchanged, so a
+    file modified that recently is always considered changed.
+
+    The multistore must be locked when this is called.
+    """
+    stat = self._locked_stat()
+    return (stat != self._data_stat or
+            time.time() - stat[1] < _STAT_RESOLUTION)
+
   def _locked_json_read(self):
     """Get the raw content of the multistore file.
 
@@ -236,6 +269,8 @@ class _MultiStore(object):
     self._file.file_handle().seek(0)
     simplejson.dump(data, self._file.file_handle(), sort_keys=True, indent=2)
     self._file.file_handle().truncate()
+    self._file.file_handle().flush()
+    self._data_stat = self._locked_stat()
 
   def _refresh_data_cache(self):
     """Refresh the contents of the multistore.
@@ -247,6 +282,7 @@ class _MultiStore(object):
         store.
     """
     self._data = {}
+    self._data_stat = self._locked_stat()
     try:
       raw_data = self._locked_json_read()
     except Exception:
@@ -98,14 +98,17 @@ class Credentials(oauth2client.OAuth2Credentials):
     self.invalid = False
 
   def _refresh(self, _):
-    (self.access_token, self.token_expiry) = self._InternalRefresh()
+    # The token being refreshed may have been rejected, so the metadata
+    # client must not return it from its cache.
+    (self.access_token, self.token_expiry) = self._InternalRefresh(
+        use_cache=False)
 
-  def _InternalRefresh(self):
+  def _InternalRefresh(self, use_cache=True):
     try:
       self.invalid = False
       return self._metadata.GetAccessToken(
           self.requested_scopes, service_account=self.service_account,
-          any_available=self.any_available)
+          any_available=self.any_available, use_cache=use_cache)
     except metadata_lib.MetadataError:
       self.invalid = True
       return (None, None)
@@ -110,7 +110,7 @@ class GetVersion(command_base.GoogleComputeCommand):
   def __init__(self, name, flag_values):
     super(GetVersion, self).__init__(name, flag_values)
 
-  def Run(self, unused_argv):
+  def Run(self, unused_argv, unused_flag_values=None):
     """Return the current version information.
 
     Args:
@@ -0,0 +1,345 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Command for running many gcutil commands in a single process."""
+
+from __future__ import with_statement
+
+
+
+import collections
+import copy
+import os
+import shlex
+import StringIO
+import sys
+import threading
+import traceback
+
+
+from google.apputils import appcommands
+import gflags as flags
+
+from gcutil import command_base
+from gcutil import command_registry
+from gcutil import gcutil_logging
+from gcutil import http_cache
+from gcutil import thread_pool
+
+
+FLAGS = flags.FLAGS
+LOGGER = gcutil_logging.LOGGER
+
+# Commands that cannot run in a batch, as they replace the gcutil process
+# or interact with the user.
+UNSUPPORTED_COMMANDS = frozenset(['auth', 'batch', 'pull', 'push', 'ssh'])
+
+# A line holding only this word waits for the commands before it.
+WAIT_COMMAND = 'wait'
+
+
+class _ThreadOutput(object):
+  """A stream sending the output of each thread to a stream of its own.
+
+  Threads that have not set a stream of their own write to the default
+  stream.
+  """
+
+  def __init__(self, default_stream):
+    self._default_stream = default_stream
+    self._local = threading.local()
+
+  def SetThreadStream(self, stream):
+    """Sets the stream of the current thread, or resets it if None."""
+    self._local.stream = stream
+
+  def _GetStream(self):
+    stream = getattr(self._local, 'stream', None)
+    if stream is None:
+      return self._default_stream
+    return stream
+
+  def write(self, data):
+    self._GetStream().write(data)
+
+  def flush(self):
+    self._GetStream().flush()
+
+  def __getattr__(self, name):
+    return getattr(self._GetStream(), name)
+
+
+class _CommandOperation(thread_pool.Operation):
+  """Runs a command of a batch, capturing its output."""
+
+  def __init__(self, batch, line_number, line, argv):
+    super(_CommandOperation, self).__init__()
+    self.line_number = line_number
+    self.line = line
+    self.argv = argv
+    self.output = StringIO.StringIO()
+    self.exit_code = None
+    self.done = threading.Event()
+    self._batch = batch
+
+  def Run(self):
+    self._batch.SetThreadOutput(self.output)
+    try:
+      self.exit_code = int(self._batch.RunCommand(self.argv))
+    except Exception as e:  # pylint: disable-msg=W0703
+      self.output.write('%s\n' % e)
+      LOGGER.debug(traceback.format_exc())
+      self.exit_code = 1
+    finally:
+      self._batch.SetThreadOutput(None)
+      self.done.set()
+    return self.exit_code
+
+
+class RunBatch(command_base.GoogleComputeCommand):
+  """Run the gcutil commands read from a file or the standard input.
+
+  Each line holds a command with its arguments and flags as they would
+  follow "gcutil" on the command line, for example:
+
+    getinstance my-instance --zone=us-central1-a
+
+  The commands run in this process and share the credential, the API and
+  its connections instead of each setting them up again. Global flags
+  given to batch, such as --project, apply to every command that does not
+  set them itself; --api_host, --service_version and the logging flags
+  apply to the whole batch.
+
+  With --max_concurrent_commands greater than 1 the commands run
+  concurrently. A line holding only "wait" waits for all of the commands
+  before it to complete, for later commands that depend on earlier ones.
+  The output of each command is printed once it completes, in the order
+  of the commands, after a line giving the command and whether it failed.
+
+  Commands cannot prompt, so commands that ask for confirmation need
+  --force. The auth, batch, pull, push and ssh commands are not supported.
+  Blank lines and text following a "#" are ignored.
+  """
+
+  def __init__(self, name, flag_values):
+    super(RunBatch, self).__init__(name, flag_values)
+    flags.DEFINE_string('commands_file',
+                        '-',
+                        'The file to read the commands from, or "-" for '
+                        'the standard input.',
+                        flag_values=flag_values)
+    flags.DEFINE_integer('max_concurrent_commands',
+                         1,
+                         'The maximum number of commands to run at once.',
+                         lower_bound=1,
+                         flag_values=flag_values)
+    self._command_lock = threading.Lock()
+    self._credential_lock = threading.Lock()
+    self._thread_apis = threading.local()
+    self._stdout = None
+    self._stderr = None
+
+  def Run(self, argv, flag_values=None):
+    """Run the commands, printing the result of each.
+
+    Args:
+      argv: The arguments to the command. None are expected.
+      flag_values: The parsed FlagValues instance of the batch (default is
+          the global FLAGS).
+
+    Returns:
+      0 if all of the commands complete successfully, otherwise 1.
+    """
+    if len(argv) > 1:
+      sys.stderr.write('Unknown argument: %s\n' % ', '.join(argv[1:]))
+      return 1
+    if flag_values is None:
+      flag_values = FLAGS
+    self._flags = flag_values
+    gcutil_logging.SetupLogging()
+    if self._flags.cache_api_responses:
+      self._http_cache = http_cache.MemoryCache()
+    # Created before the commands run, as they share it between threads.
+    self.GetRateLimiter()
+
+    if self._flags.commands_file == '-':
+      commands_file = sys.stdin
+    else:
+      try:
+        commands_file = open(self._flags.commands_file)
+      except IOError as e:
+        sys.stderr.write('%s\n' % e)
+        return 1
+
+    stdin, stdout, stderr = sys.stdin, sys.stdout, sys.stderr
+    self._stdout = _ThreadOutput(stdout)
+    self._stderr = _ThreadOutput(stderr)
+    sys.stdout, sys.stderr = self._stdout, self._stderr
+    # Keeps commands from reading the commands that follow them.
+    sys.stdin = open(os.devnull)
+    try:
+      # readline() returns each line as soon as it is available, which
+      # iterating over the file does not.
+      failures = self._RunCommands(iter(commands_file.readline, ''), stdout)
+    finally:
+      sys.stdin.close()
+      sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+      if commands_file is not stdin:
+        commands_file.close()
+
+    if self._http_cache is not None:
+      self._http_cache.LogStatistics()
+    if failures:
+      LOGGER.error('%d of the commands failed.', failures)
+    return int(bool(failures))
+
+  def _RunCommands(self, lines, output):
+    """Runs the commands on the given lines.
+
+    Args:
+      lines: An iterable over the lines holding the commands.
+      output: The stream to print the results of the commands to.
+
+    Returns:
+      The number of commands that failed.
+    """
+    pool = None
+    if self._flags.max_concurrent_commands > 1:
+      pool = thread_pool.ThreadPool(self._flags.max_concurrent_commands)
+
+    pending = collections.deque()
+    failures = 0
+    try:
+      for line_number, line in enumerate(lines, 1):
+        try:
+          argv = shlex.split(line, comments=True)
+        except ValueError as e:
+          output.write('# [%d] %s: FAILED\n%s\n' % (
+              line_number, line.strip(), e))
+          failures += 1
+          continue
+
+        if not argv:
+          continue
+        if argv == [WAIT_COMMAND]:
+          failures += self._PrintResults(pending, output, wait=True)
+          continue
+
+        operation = _CommandOperation(self, line_number, line.strip(), argv)
+        pending.append(operation)
+        if pool:
+          pool.Add(operation)
+        else:
+          operation.Run()
+        failures += self._PrintResults(pending, output, wait=False)
+
+      failures += self._PrintResults(pending, output, wait=True)
+    finally:
+      if pool:
+        pool.WaitShutdown()
+    return failures
+
+  @staticmethod
+  def _PrintResults(pending, output, wait):
+    """Prints the results of commands in the order of the commands.
+
+    Args:
+      pending: The deque of _CommandOperations whose results have not been
+          printed. The printed ones are removed from it.
+      output: The stream to print to.
+      wait: If True, waits for and prints all of the pending commands.
+          Otherwise only prints those up to the first incomplete one.
+
+    Returns:
+      The number of printed commands that failed.
+    """
+    failures = 0
+    while pending and (wait or pending[0].done.isSet()):
+      operation = pending.popleft()
+      # Waiting with a timeout keeps the wait interruptible.
+      while not operation.done.wait(0.2):
+        pass
+      status = 'FAILED' if operation.exit_code else 'OK'
+      output.write('# [%d] %s: %s\n' % (
+          operation.line_number, operation.line, status))
+      output.write(operation.output.getvalue())
+      output.flush()
+      if operation.exit_code:
+        failures += 1
+    return failures
+
+  def SetThreadOutput(self, stream):
+    """Sends the output of the current thread to the given stream.
+
+    Args:
+      stream: The stream to write to, or None for the standard streams.
+    """
+    self._stdout.SetThreadStream(stream)
+    self._stderr.SetThreadStream(stream)
+
+  def RunCommand(self, argv):
+    """Runs a command of the batch on the current thread.
+
+    Args:
+      argv: The name of the command followed by its arguments and flags.
+
+    Returns:
+      The exit code of the command.
+
+    Raises:
+      CommandError: If the command cannot be run in a batch.
+    """
+    command_name = argv[0]
+    if command_name in UNSUPPORTED_COMMANDS:
+      raise command_base.CommandError(
+          'The %s command cannot be run in a batch.' % command_name)
+    if command_name not in command_registry.COMMAND_MODULES:
+      raise command_base.CommandError('Unknown command: %s' % command_name)
+
+    with self._command_lock:
+      if not appcommands.GetCommandByName(command_name):
+        command_registry.AddCommands(['gcutil', command_name])
+      command_class = type(appcommands.GetCommandByName(command_name))
+      # Importing a command module may define more global flags, so the
+      # flags are copied after it.
+      flag_values = copy.deepcopy(FLAGS)
+
+    # Each command gets an instance and flags of its own, since commands
+    # keep their state in both.
+    command = command_class(command_name, flag_values)
+    command.UseApiOf(self)
+    return command.Run(['gcutil'] + argv[1:], flag_values)
+
+  def _AuthenticateWrapper(self, http):
+    # The credential is loaded by whichever thread needs it first.
+    with self._credential_lock:
+      return super(RunBatch, self)._AuthenticateWrapper(http)
+
+  def _GetComputeApi(self):
+    """Returns the API of the current thread, building it on first use.
+
+    Each thread has an API of its own since the API, and the httplib2.Http
+    object it makes requests with, are not thread-safe.  The API uses the
+    Http object of the thread, so it shares its connections with the other
+    requests the thread makes.
+    """
+    compute_api = getattr(self._thread_apis, 'compute_api', None)
+    if compute_api is None:
+      compute_api = self._BuildComputeApi(self.GetHttp())
+      self._thread_apis.compute_api = compute_api
+    return compute_api
+
+
+def AddCommands():
+  appcommands.AddCmd('batch', RunBatch)
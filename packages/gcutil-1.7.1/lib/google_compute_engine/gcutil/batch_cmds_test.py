@@ -0,0 +1,141 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the batch command."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import copy
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import threading
+
+import gflags as flags
+import unittest
+
+from gcutil import batch_cmds
+from gcutil import mock_api
+from gcutil import version
+
+FLAGS = flags.FLAGS
+
+
+class BatchCmdsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.old_stdout = sys.stdout
+    self.old_flag_values = dict(
+        (name, FLAGS[name].value)
+        for name in ('cache_resources', 'cached_flags_file'))
+    FLAGS.cache_resources = False
+    FLAGS.cached_flags_file = os.path.join(self.temp_dir, 'flags')
+
+  def tearDown(self):
+    sys.stdout = self.old_stdout
+    for name, value in self.old_flag_values.iteritems():
+      setattr(FLAGS, name, value)
+    shutil.rmtree(self.temp_dir)
+
+  def _RunBatch(self, commands, max_concurrent_commands=1, api=None):
+    """Runs a batch of commands, returning its exit code and output."""
+    commands_file = os.path.join(self.temp_dir, 'commands')
+    with open(commands_file, 'w') as f:
+      f.write(commands)
+
+    flag_values = copy.deepcopy(FLAGS)
+    command = batch_cmds.RunBatch('batch', flag_values)
+    flag_values.commands_file = commands_file
+    flag_values.max_concurrent_commands = max_concurrent_commands
+    if api:
+      command._GetComputeApi = lambda: api
+
+    sys.stdout = StringIO.StringIO()
+    try:
+      exit_code = command.Run(['gcutil'], flag_values)
+      return exit_code, sys.stdout.getvalue()
+    finally:
+      sys.stdout = self.old_stdout
+
+  def testResultsArePrintedInOrder(self):
+    for max_concurrent_commands in (1, 4):
+      exit_code, output = self._RunBatch(
+          'version\n'
+          '# A comment.\n'
+          '\n'
+          'nosuchcommand\n'
+          'ssh my-instance\n'
+          'wait\n'
+          'version  # Another comment.\n',
+          max_concurrent_commands)
+
+      self.assertEqual(1, exit_code)
+      self.assertEqual(
+          '# [1] version: OK\n'
+          '%(version)s\n'
+          '# [4] nosuchcommand: FAILED\n'
+          'Unknown command: nosuchcommand\n'
+          '# [5] ssh my-instance: FAILED\n'
+          'The ssh command cannot be run in a batch.\n'
+          '# [7] version  # Another comment.: OK\n'
+          '%(version)s\n' % {'version': version.__version__},
+          output)
+
+  def testCommandsShareTheApiOfTheBatch(self):
+    zones_api = mock_api.MockZonesApi()
+    api = mock_api.MockApi()
+    api.zones = lambda: zones_api
+    exit_code, output = self._RunBatch(
+        'getzone zone-a --project=my-project\n'
+        'getzone zone-b --project=my-project\n',
+        max_concurrent_commands=2,
+        api=api)
+
+    self.assertEqual(0, exit_code)
+    self.assertTrue(output.startswith(
+        '# [1] getzone zone-a --project=my-project: OK\n'))
+    self.assertTrue('# [2] getzone zone-b --project=my-project: OK\n' in output)
+    self.assertEqual(
+        ['zone-a', 'zone-b'],
+        sorted(request.request_payload['zone']
+               for request in zones_api.requests))
+
+  def testThreadApisAreBuiltOncePerThread(self):
+    command = batch_cmds.RunBatch('batch', copy.deepcopy(FLAGS))
+    built = []
+    command.CreateHttp = object
+    command._BuildComputeApi = lambda http: built.append(1) or object()
+
+    main_api = command._GetComputeApi()
+    self.assertTrue(main_api is command._GetComputeApi())
+
+    thread_apis = []
+    thread = threading.Thread(
+        target=lambda: thread_apis.append(command._GetComputeApi()))
+    thread.start()
+    thread.join()
+    self.assertFalse(thread_apis[0] is main_api)
+    self.assertEqual(2, len(built))
+
+
+if __name__ == '__main__':
+  unittest.main()
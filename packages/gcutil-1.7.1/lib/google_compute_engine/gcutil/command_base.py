@@ -17,8 +17,10 @@
 
 
 import datetime
+import heapq
 import httplib
 import inspect
+import itertools
 import json
 import os
 import re
@@ -29,6 +31,7 @@ import traceback
 
 from apiclient import discovery
 from apiclient import errors
+from apiclient import http as apiclient_http
 from apiclient import model
 import httplib2
 import iso8601
@@ -40,9 +43,13 @@ from google.apputils import appcommands
 import gflags as flags
 
 from gcutil import auth_helper
+from gcutil import discovery_cache
 from gcutil import flags_cache
 from gcutil import gcutil_logging
+from gcutil import http_cache
+from gcutil import http_pool
 from gcutil import metadata_lib
+from gcutil import resource_cache
 from gcutil import scopes
 from gcutil import thread_pool
 from gcutil import utils
@@ -62,6 +69,28 @@ GLOBAL_ZONE_NAME = 'global'
 # a machine type choice.
 MACHINE_TYPE_ORDERING = ['standard', 'highcpu', 'highmem']
 
+# The maximum number of calls the API server accepts in one batch request.
+MAX_BATCH_SIZE = 1000
+
+# The shortest time, in seconds, to sleep between polls of pending
+# operations.
+MIN_POLL_INTERVAL = 1
+
+# Polling backs off as operations age: the time to sleep before the next
+# poll is this fraction of the time spent waiting so far, between
+# MIN_POLL_INTERVAL and --sleep_between_polls.
+POLL_BACKOFF_FACTOR = 0.5
+
+# The number of times a rate limited request is retried.
+RATE_LIMIT_RETRIES = 5
+
+# The time, in seconds, to wait before retrying a rate limited request
+# whose response gives no Retry-After header.  It doubles on each retry.
+RATE_LIMIT_INITIAL_DELAY = 1
+
+# The reasons given by 403 responses to rate limited requests.
+RATE_LIMIT_REASONS = frozenset(['rateLimitExceeded', 'userRateLimitExceeded'])
+
 
 flags.DEFINE_enum(
     'service_version',
@@ -110,7 +139,7 @@ flags.DEFINE_bool(
 flags.DEFINE_integer(
     'sleep_between_polls',
     3,
-    'The time to sleep between polls to the server in seconds.',
+    'The maximum time to sleep between polls to the server in seconds.',
     1, 600)
 flags.DEFINE_integer(
     'max_wait_time',
@@ -128,6 +157,17 @@ flags.DEFINE_integer(
     'The maximum number of concurrent operations to have in progress at once. '
     'Increasing this number will probably result in hitting rate limits.',
     1, 20)
+flags.DEFINE_bool(
+    'batch_requests',
+    True,
+    'If true, send multiple API requests together in batch HTTP requests '
+    'instead of one HTTP request each.')
+flags.DEFINE_float(
+    'max_requests_per_second',
+    0,
+    'The maximum number of concurrent operations to start per second, to '
+    'stay within the API rate limit quota. 0 means no limit.',
+    0)
 
 
 class Error(Exception):
@@ -143,36 +183,43 @@ class TracedApi(object):
   """Wrap an Api to add a trace keyword argument."""
 
   def __init__(self, obj, trace_token):
-    def Wrap(func):
-      def _Wrapped(*args, **kwargs):
-        # Add a trace= URL parameter to the method call.
-        if trace_token:
-          kwargs['trace'] = trace_token
-        return func(*args, **kwargs)
-      return _Wrapped
+    self._obj = obj
+    self._trace_token = trace_token
+
+  def __getattr__(self, name):
+    # Public methods are interposed as they are looked up, as API methods
+    # are only created on first use.
+    attr = getattr(self._obj, name)
+    if name.startswith('__') or not inspect.ismethod(attr):
+      return attr
 
-    # Find all public methods and interpose them.
-    for method in inspect.getmembers(obj, (inspect.ismethod)):
-      if not method[0].startswith('__'):
-        setattr(self, method[0], Wrap(method[1]))
+    def _Wrapped(*args, **kwargs):
+      # Add a trace= URL parameter to the method call.
+      if self._trace_token:
+        kwargs['trace'] = self._trace_token
+      return attr(*args, **kwargs)
+    return _Wrapped
 
 
 class TracedComputeApi(object):
   """Wrap a ComputeApi object to return TracedApis."""
 
   def __init__(self, obj, trace_token):
-    def Wrap(func):
-      def _Wrapped(*args, **kwargs):
-        ret = func(*args, **kwargs)
-        if ret:
-          ret = TracedApi(ret, trace_token)
-        return ret
-      return _Wrapped
+    self._obj = obj
+    self._trace_token = trace_token
 
-    # Find all our public methods and interpose them.
-    for method in inspect.getmembers(obj, (inspect.ismethod)):
-      if not method[0].startswith('__'):
-        setattr(self, method[0], Wrap(method[1]))
+  def __getattr__(self, name):
+    # Interpose our public methods as they are looked up.
+    attr = getattr(self._obj, name)
+    if name.startswith('__') or not inspect.ismethod(attr):
+      return attr
+
+    def _Wrapped(*args, **kwargs):
+      ret = attr(*args, **kwargs)
+      if ret:
+        ret = TracedApi(ret, self._trace_token)
+      return ret
+    return _Wrapped
 
 
 class ApiThreadPoolOperation(thread_pool.Operation):
@@ -183,20 +230,41 @@ class ApiThreadPoolOperation(thread_pool.Operation):
   """
 
   def __init__(self, request, command, wait_for_operation,
-               collection_name=None):
+               collection_name=None, rate_limiter=None):
     """Initializer."""
     super(ApiThreadPoolOperation, self).__init__()
     self._request = request
     self._command = command
     self._wait_for_operation = wait_for_operation
     self._collection_name = collection_name
+    self._rate_limiter = rate_limiter or thread_pool.RateLimiter()
 
   def Run(self):
-    """Execute the request on a separate thread."""
+    """Execute the request on a separate thread.
+
+    Rate limited requests are retried after the time the server asks
+    for, or after a delay that doubles on each retry.  The rate limiter
+    is paused meanwhile, so that the other operations back off too.
+    """
     # Note that the httplib2.Http command isn't thread safe.  As such,
-    # we need to create a new Http object here.
-    http = self._command.CreateHttp()
-    result = self._request.execute(http=http)
+    # we need to use the Http object of this thread here.
+    http = self._command.GetHttp()
+    delay = RATE_LIMIT_INITIAL_DELAY
+    for retry in range(RATE_LIMIT_RETRIES + 1):
+      try:
+        result = self._request.execute(http=http)
+        break
+      except errors.HttpError, e:
+        retry_after = GetRetryAfter(e)
+        if retry_after is None or retry == RATE_LIMIT_RETRIES:
+          raise
+        if retry_after == 0:
+          retry_after = delay
+          delay *= 2
+        LOGGER.info('The request was rate limited, retrying in %s seconds.',
+                    retry_after)
+        self._rate_limiter.Pause(retry_after)
+        self._rate_limiter.Acquire()
     if self._wait_for_operation:
       result = self._command.WaitForOperation(
           self._command.GetFlags(), time, result, http=http,
@@ -204,6 +272,40 @@ class ApiThreadPoolOperation(thread_pool.Operation):
     return result
 
 
+def GetRetryAfter(http_error):
+  """Returns the time to wait before retrying a rate limited request.
+
+  Args:
+    http_error: The HttpError the request failed with.
+
+  Returns:
+    None if the request was not rate limited, otherwise the number of
+    seconds the Retry-After header of the response asks to wait for, or
+    0 if it gives none.
+  """
+  status = http_error.resp.status
+  if status == 403:
+    try:
+      error = json.loads(http_error.content).get('error', {})
+      reasons = set(e.get('reason') for e in error.get('errors', []))
+    except (ValueError, AttributeError):
+      return None
+    if not reasons & RATE_LIMIT_REASONS:
+      return None
+  elif status not in (429, 503):
+    return None
+
+  # The headers of the responses to the calls of a batch request keep the
+  # case they were sent with.
+  headers = dict((name.lower(), value)
+                 for name, value in http_error.resp.iteritems())
+  try:
+    return max(int(headers.get('retry-after', 0)), 0)
+  except ValueError:
+    # Retry-After may also be an HTTP date, which is not worth parsing.
+    return 0
+
+
 class GoogleComputeCommand(appcommands.Cmd):
   """Base class for commands that interact with the Google Compute Engine API.
 
@@ -266,6 +368,12 @@ class GoogleComputeCommand(appcommands.Cmd):
     """
     super(GoogleComputeCommand, self).__init__(name, flag_values)
     self._credential = None
+    self._resource_cache = None
+    self._http_cache = None
+    self._rate_limiter = None
+    self._compute_api = None
+    self._api_source = None
+    self._http_pool = http_pool.HttpPool(lambda: self.CreateHttp())
     self.supported_versions = SUPPORTED_VERSIONS
 
     if hasattr(self, 'safety_prompt'):
@@ -288,7 +396,7 @@ class GoogleComputeCommand(appcommands.Cmd):
 
   def _PromptForEntry(self, collection_api, collection_name, project=None,
                       auto_select=True, extract_resource_prompt=None,
-                      additional_key_func=None):
+                      additional_key_func=None, cached_collection=None):
     """Prompt the user to select an entry from an API collection.
 
     Args:
@@ -302,12 +410,19 @@ class GoogleComputeCommand(appcommands.Cmd):
         going to be used as the default prompt text.
       additional_key_func: Lambda resource_name -> int. If supplied, this
         function will be used as the first sort key of the name.
+      cached_collection: The name of the collection in the resource cache, if
+        the entries may be read from the cache.
 
     Returns:
       A collection entry as selected by the user or None if the collection is
         empty;
     """
-    choices = utils.All(collection_api.list, project or self._project)['items']
+    if cached_collection:
+      choices = self._ListCachedCollection(
+          cached_collection, collection_api.list, project)
+    else:
+      choices = utils.All(collection_api.list,
+                          project or self._project)['items']
     return self._PromptForChoice(
         choices, collection_name, auto_select, extract_resource_prompt,
         additional_key_func)
@@ -396,11 +511,14 @@ class GoogleComputeCommand(appcommands.Cmd):
 
     return self._PromptForEntry(
         self._kernels_api, 'kernel', 'google',
-        extract_resource_prompt=ExtractKernelPrompt)
+        extract_resource_prompt=ExtractKernelPrompt,
+        cached_collection='kernels')
 
   def _PromptForImage(self):
-    choices = (utils.All(self._images_api.list, 'google')['items'] +
-               utils.All(self._images_api.list, self._project)['items'])
+    choices = (
+        self._ListCachedCollection('images', self._images_api.list,
+                                   'google') +
+        self._ListCachedCollection('images', self._images_api.list))
 
     def ExtractImagePrompt(image):
       return self._PresentElement(image['selfLink'])
@@ -447,7 +565,8 @@ class GoogleComputeCommand(appcommands.Cmd):
       return name
 
     return self._PromptForEntry(self._zones_api, 'zone',
-                                extract_resource_prompt=ExtractZonePrompt)
+                                extract_resource_prompt=ExtractZonePrompt,
+                                cached_collection='zones')
 
   def _PromptForDisk(self):
     """Prompt the user to select a disk from the current list.
@@ -482,7 +601,8 @@ class GoogleComputeCommand(appcommands.Cmd):
     """
     return self._PromptForEntry(
         self._machine_types_api, 'machine type',
-        additional_key_func=self._GetMachineTypeSecondarySortScore)
+        additional_key_func=self._GetMachineTypeSecondarySortScore,
+        cached_collection='machineTypes')
 
   @staticmethod
   def _GetNextMaintenanceStart(zone, now=None):
@@ -535,8 +655,15 @@ class GoogleComputeCommand(appcommands.Cmd):
       zone = zone_resource['name']
     else:
       zone = zone.split('/')[-1]
-      zone_resource = self._zones_api.get(
-          project=self._project, zone=zone).execute()
+      zone_resource = None
+      if self._resource_cache:
+        for cached_zone in (self._resource_cache.GetCollection(
+            self._project, 'zones') or []):
+          if cached_zone['name'] == zone:
+            zone_resource = cached_zone
+      if zone_resource is None:
+        zone_resource = self._zones_api.get(
+            project=self._project, zone=zone).execute()
 
       # Warns the user if there is an upcoming maintenance for the
       # chosen zone. Times returned from the server are in UTC.
@@ -568,7 +695,43 @@ class GoogleComputeCommand(appcommands.Cmd):
     Returns:
       List of zones available to this project.
     """
-    return utils.AllNames(self._zones_api.list, self._project)
+    return [zone.get('name') for zone in
+            self._ListCachedCollection('zones', self._zones_api.list)]
+
+  def _ListCachedCollection(self, collection, list_func, project=None):
+    """Lists all the resources of a slowly changing collection.
+
+    The resources are read from the resource cache when it holds a fresh
+    list, and stored in it otherwise.
+
+    Args:
+      collection: The name of the collection, e.g. 'zones'.
+      list_func: The list function of the collection.
+      project: A project whose collection to list. Defaults to self._project.
+
+    Returns:
+      The list of resources.
+    """
+    project = project or self._project
+    if self._resource_cache:
+      items = self._resource_cache.GetCollection(project, collection)
+      if items is not None:
+        return items
+    items = utils.All(list_func, project)['items']
+    if self._resource_cache:
+      self._resource_cache.SetCollection(project, collection, items)
+    return items
+
+  def _RecordResourceZones(self, resources):
+    """Adds the zones of the given resources to the resource cache."""
+    if not self._resource_cache:
+      return
+    for resource in resources:
+      self_link = resource.get('selfLink')
+      zone = self_link and self._GetZoneFromSelfLink(self_link)
+      if zone:
+        self._resource_cache.SetResourceZone(
+            self._project, resource['name'], zone)
 
   def _AuthenticateWrapper(self, http):
     """Adds the OAuth token into http request.
@@ -582,6 +745,8 @@ class GoogleComputeCommand(appcommands.Cmd):
     Raises:
       CommandError: If the credentials can't be found.
     """
+    if self._api_source:
+      return self._api_source._AuthenticateWrapper(http)
     if not self._credential:
       self._credential = auth_helper.GetCredentialFromStore(
           self.__GetRequiredAuthScopes())
@@ -687,15 +852,16 @@ class GoogleComputeCommand(appcommands.Cmd):
     json_model = (model.LoggingJsonModel()
                   if 'LoggingJsonModel' in dir(model)
                   else model.JsonModel())
+    start_time = time.time()
     if FLAGS.fetch_discovery:
       discovery_uri = (FLAGS.api_host +
                        'discovery/v1/apis/{api}/{apiVersion}/rest')
-      return self.WrapApiIfNeeded(discovery.build(
+      api = discovery.build(
           'compute',
           FLAGS.service_version,
           http=http,
           discoveryServiceUrl=discovery_uri,
-          model=json_model))
+          model=json_model)
     else:
       discovery_file_name = os.path.join(
           os.path.dirname(__file__),
@@ -709,11 +875,37 @@ class GoogleComputeCommand(appcommands.Cmd):
             'Could not load discovery document from disk. Perhaps try '
             '--fetch_discovery. \nFile: %s' % discovery_file_name)
 
-      return self.WrapApiIfNeeded(discovery.build_from_document(
-          discovery_doc,
+      service = discovery_cache.LoadDiscoveryDocument(
+          discovery_doc, FLAGS.service_version)
+      LOGGER.debug('Loaded the discovery document in %.3fs.',
+                   time.time() - start_time)
+      api = discovery.build_from_document(
+          service,
           base=FLAGS.api_host,
           http=http,
-          model=json_model))
+          model=json_model)
+
+    LOGGER.debug('Built the compute API in %.3fs.', time.time() - start_time)
+    return self.WrapApiIfNeeded(api)
+
+  def _GetComputeApi(self):
+    """Returns the Google Compute Engine API, building it on first use."""
+    if self._api_source:
+      return self._api_source._GetComputeApi()
+    if self._compute_api is None:
+      self._compute_api = self._BuildComputeApi(self.GetHttp())
+    return self._compute_api
+
+  def UseApiOf(self, command):
+    """Makes this command use the credential and API of another command.
+
+    Commands run in the same process use this to share the credential and
+    API instead of each loading and building their own.
+
+    Args:
+      command: The GoogleComputeCommand to get the credential and API from.
+    """
+    self._api_source = command
 
   @staticmethod
   def WrapApiIfNeeded(api):
@@ -924,19 +1116,26 @@ class GoogleComputeCommand(appcommands.Cmd):
     if self._flags.zone:
       return self._flags.zone
 
-    filter_expression = utils.RegexesToFilterExpression(
-        [self.DenormalizeResourceName(resource_name)])
+    name = self.DenormalizeResourceName(resource_name)
+    filter_expression = utils.RegexesToFilterExpression([name])
 
+    # Limiting the number of results to 2, since anything other than one
+    # is an error.
     items = []
-    for zone in self._GetZones():
-      # Limiting the number of results to 2, since anything other than one
-      # is an error.
-      sub_result = utils.All(api.list,
-                             self._project,
-                             max_results=2,
-                             filter=filter_expression,
-                             zone=zone)
-      items.extend(sub_result.get('items', []))
+    # Look in the zone the resource was last seen in first.
+    cached_zone = (self._resource_cache and
+                   self._resource_cache.GetResourceZone(self._project, name))
+    if cached_zone:
+      items = self.ListInZones([(api.list, cached_zone)],
+                               max_results=2,
+                               filter=filter_expression)[0]['items']
+    if len(items) != 1:
+      items = []
+      for sub_result in self.ListInZones(
+          [(api.list, zone) for zone in self._GetZones()],
+          max_results=2,
+          filter=filter_expression):
+        items.extend(sub_result.get('items', []))
 
     if len(items) == 1:
       zone = self._GetZoneFromSelfLink(items[0]['selfLink'])
@@ -953,6 +1152,88 @@ class GoogleComputeCommand(appcommands.Cmd):
     else:
       return None
 
+  def ListInZones(self, list_funcs, max_results=None, filter=None):
+    """Calls several list functions at once while taking care of paging.
+
+    This is like calling utils.All for each list function, except that
+    the pages are fetched in rounds: each round asks for the next page
+    of every listing that has more, in a single batch request where
+    possible.
+
+    Args:
+      list_funcs: A list of (list function, zone) tuples.  The zone is
+          None for list functions that do not take a zone.
+      max_results: The maximum number of items to return for each list
+          function.
+      filter: The filter expression to plumb through.
+
+    Returns:
+      A list with a {'kind': ..., 'items': [...]} result for each list
+      function, in order.
+    """
+    results = [{'kind': None, 'items': []} for _ in list_funcs]
+    for index, res in self._IterPagesInZones(list_funcs, max_results, filter):
+      results[index]['kind'] = res.get('kind')
+      results[index]['items'].extend(res.get('items', []))
+    return results
+
+  def _IterPagesInZones(self, list_funcs, max_results=None, filter=None):
+    """Yields the pages of several list functions as they are fetched.
+
+    The pages are fetched in rounds as in ListInZones, and each round is
+    only fetched once the pages of the round before it have been consumed.
+
+    Args:
+      list_funcs: A list of (list function, zone) tuples.  The zone is
+          None for list functions that do not take a zone.
+      max_results: The maximum number of items to yield for each list
+          function.
+      filter: The filter expression to plumb through.
+
+    Yields:
+      (index, list resource) tuples for each page, where index is that of
+      the list function the page is a result of.
+    """
+    params = []
+    for _, zone in list_funcs:
+      zone_params = {
+          'project': self._project,
+          'maxResults': max_results,
+          'filter': filter}
+      if zone:
+        zone_params['zone'] = zone
+      params.append(zone_params)
+
+    remaining = [max_results] * len(list_funcs)
+    pending = range(len(list_funcs))
+    while pending:
+      requests = [(index, list_funcs[index][0](**params[index]))
+                  for index in pending]
+      if (self._flags.batch_requests and len(requests) > 1 and
+          all(self._IsBatchable(request) for _, request in requests)):
+        outcomes = self._ExecuteBatchRequests(requests)
+      else:
+        outcomes = dict((index, (False, request.execute()))
+                        for index, request in requests)
+
+      next_pending = []
+      for index in pending:
+        raised_exception, res = outcomes[index]
+        if raised_exception:
+          raise res
+        items = res.get('items', [])
+        if max_results is not None:
+          items = items[:remaining[index]]
+          remaining[index] -= len(items)
+        self._RecordResourceZones(items)
+        yield index, dict(res, items=items)
+
+        next_page_token = res.get('nextPageToken')
+        if next_page_token and remaining[index] != 0:
+          params[index]['pageToken'] = next_page_token
+          next_pending.append(index)
+      pending = next_pending
+
   def _GetZoneFromSelfLink(self, self_link):
     """Parses the given self-link and returns per-project zone name."""
     resource_name = self._StripBaseUrl(self_link)
@@ -1045,27 +1326,37 @@ class GoogleComputeCommand(appcommands.Cmd):
         return True
     return False
 
-  def Run(self, argv):
+  def Run(self, argv, flag_values=None):
     """Run the command, printing the result.
 
     Args:
       argv: The arguments to the command.
+      flag_values: The FlagValues instance to parse the flags of the
+          command into (default is the global FLAGS).
 
     Returns:
       0 if the command completes successfully, otherwise 1.
     """
+    if flag_values is None:
+      flag_values = FLAGS
     try:
-      pos_arg_values = self._ParseArgumentsAndFlags(FLAGS, argv)
+      pos_arg_values = self._ParseArgumentsAndFlags(flag_values, argv)
       gcutil_logging.SetupLogging()
 
       # Synchronize the flags with any cached values present.
       flags_cache_obj = flags_cache.FlagsCache()
-      flags_cache_obj.SynchronizeFlags()
+      flags_cache_obj.SynchronizeFlags(flag_values)
 
 
-      self.SetFlagDefaults()
-      self.DenormalizeProjectName(FLAGS)
-      self.SetFlags(FLAGS)
+      self.SetFlagDefaults(flag_values)
+      self.DenormalizeProjectName(flag_values)
+      self.SetFlags(flag_values)
+
+      if flag_values.cache_resources:
+        self._resource_cache = resource_cache.ResourceCache(
+            flag_values.service_version)
+      if flag_values.cache_api_responses:
+        self._http_cache = http_cache.MemoryCache()
 
       auth_retry = True
       error_in_result = False
@@ -1102,6 +1393,9 @@ class GoogleComputeCommand(appcommands.Cmd):
           LOGGER.info('OAuth2 token refresh error (%s), retrying.\n', str(e))
           auth_retry = False
 
+      self._http_pool.LogStatistics()
+      if self._http_cache is not None:
+        self._http_cache.LogStatistics()
       has_errors = bool(exceptions or error_in_result)
 
       # Updates the flags cache file only when the command exits with
@@ -1109,6 +1403,15 @@ class GoogleComputeCommand(appcommands.Cmd):
       if not has_errors:
         flags_cache_obj.UpdateCacheFile()
 
+      if self._resource_cache:
+        # Commands on a cached collection may have changed it.
+        collection_name = getattr(self, 'resource_collection_name', None)
+        if (collection_name in resource_cache.CACHED_COLLECTIONS and
+            not isinstance(self, GoogleComputeListCommand)):
+          self._resource_cache.InvalidateCollection(self._project,
+                                                    collection_name)
+        self._resource_cache.Save()
+
       return has_errors
     except errors.HttpError, http_error:
       self.LogHttpError(http_error)
@@ -1127,13 +1430,48 @@ class GoogleComputeCommand(appcommands.Cmd):
     This is useful when doing multithreaded work as httplib2 Http
     objects aren't threadsafe.
 
+    With --cache_api_responses, the HTTP objects of a command share a
+    cache of the responses to GET requests, which they revalidate instead
+    of fetching again.
+
     Returns:
       An object that implements the httplib2.Http interface
     """
-    http = httplib2.Http()
+    http = httplib2.Http(cache=self._http_cache)
     http = self._AuthenticateWrapper(http)
     return http
 
+  def GetHttp(self):
+    """Get the HTTP object of the current thread to use with API calls.
+
+    Unlike CreateHttp, this returns the same object each time it is called
+    on a thread, so that the API calls made by a thread reuse its
+    connections.
+
+    Returns:
+      An object that implements the httplib2.Http interface
+    """
+    if self._api_source:
+      return self._api_source.GetHttp()
+    return self._http_pool.GetHttp()
+
+  def GetRateLimiter(self):
+    """Get the rate limiter shared by the operations of this command.
+
+    The limiter starts operations at most --max_requests_per_second
+    apart, and is paused for the operations to back off when one of them
+    is rate limited.
+
+    Returns:
+      A thread_pool.RateLimiter.
+    """
+    if self._api_source:
+      return self._api_source.GetRateLimiter()
+    if self._rate_limiter is None:
+      self._rate_limiter = thread_pool.RateLimiter(
+          self._flags.max_requests_per_second or None)
+    return self._rate_limiter
+
   def RunWithFlagsAndPositionalArgs(self, flag_values, pos_arg_values):
     """Run the command with the parsed flags and positional arguments.
 
@@ -1153,8 +1491,7 @@ class GoogleComputeCommand(appcommands.Cmd):
       JSON-serializable result and exceptions is a list of exceptions
       that were thrown when running this command.
     """
-    http = self.CreateHttp()
-    compute_api = self._BuildComputeApi(http)
+    compute_api = self._GetComputeApi()
     if self._IsUsingAtLeastApiVersion('v1beta14'):
       self._zone_operations_api = compute_api.zoneOperations()
       self._global_operations_api = compute_api.globalOperations()
@@ -1211,7 +1548,12 @@ class GoogleComputeCommand(appcommands.Cmd):
         }
 
   def ExecuteRequests(self, requests, collection_name=None):
-    """Execute a list of requests in a thread pool.
+    """Execute a list of requests.
+
+    Unless --nobatch_requests is given, requests that can be batched
+    are sent together in batch HTTP requests of up to MAX_BATCH_SIZE
+    calls each.  The remaining requests, e.g. media uploads, are
+    executed in a thread pool.
 
     Args:
       requests: A list of requests objects to execute.
@@ -1223,27 +1565,157 @@ class GoogleComputeCommand(appcommands.Cmd):
       of all results and exceptions is any exceptions that were
       raised.
     """
-    tp = thread_pool.ThreadPool(self._flags.concurrent_operations)
+    batched = []
+    unbatched = []
+    for index, request in enumerate(requests):
+      if self._flags.batch_requests and self._IsBatchable(request):
+        batched.append((index, request))
+      else:
+        unbatched.append((index, request))
+
+    rate_limiter = self.GetRateLimiter()
+    tp = thread_pool.ThreadPool(self._flags.concurrent_operations,
+                                rate_limiter=rate_limiter)
     ops = []
-    for request in requests:
+    for index, request in unbatched:
       op = ApiThreadPoolOperation(
-          request, self, self._flags.synchronous_mode,
-          collection_name=collection_name)
-      ops.append(op)
+          request, self, False, collection_name=collection_name,
+          rate_limiter=rate_limiter)
+      ops.append((index, op))
       tp.Add(op)
+
+    outcomes = {}
+    if batched:
+      outcomes.update(self._ExecuteBatchRequests(batched))
     tp.WaitShutdown()
+    for index, op in ops:
+      outcomes[index] = (op.RaisedException(), op.Result())
+
+    # All the operations started are then waited on together.
+    if self._flags.synchronous_mode:
+      indexes = [index for index in sorted(outcomes)
+                 if not outcomes[index][0]]
+      waited = self.WaitForOperations(
+          self._flags, time, [outcomes[index][1] for index in indexes],
+          collection_name=collection_name)
+      outcomes.update(zip(indexes, waited))
+
     results = []
     exceptions = []
-    for op in ops:
-      if op.RaisedException():
-        exceptions.append(op.Result())
+    for index in sorted(outcomes):
+      raised_exception, result = outcomes[index]
+      if raised_exception:
+        exceptions.append(result)
       else:
-        if isinstance(op.Result(), list):
-          results.extend(op.Result())
+        if isinstance(result, list):
+          results.extend(result)
         else:
-          results.append(op.Result())
+          results.append(result)
     return (results, exceptions)
 
+  @staticmethod
+  def _IsBatchable(request):
+    """Returns True if the given request can be sent in a batch request."""
+    return (isinstance(request, apiclient_http.HttpRequest) and
+            request.resumable is None)
+
+  def _ExecuteBatchRequests(self, requests, http=None):
+    """Execute requests together in batch HTTP requests.
+
+    Each call in a batch counts against the rate limit quota, so each
+    takes a token from the rate limiter of the command.  Calls that were
+    rate limited are sent again in a new batch request, up to
+    RATE_LIMIT_RETRIES times, after the longest time their responses ask
+    for, or after a delay that doubles on each retry.  The rate limiter
+    is paused meanwhile, so that the other operations back off too.
+
+    Args:
+      requests: A list of (index, request) tuples.
+      http: An optional httplib2.Http object to send the batch requests with.
+
+    Returns:
+      A dict mapping the index of each request to a tuple of
+      (raised_exception, result), where result is the exception if one
+      was raised.
+    """
+    outcomes = {}
+
+    def Callback(request_id, response, exception):
+      if exception is not None:
+        outcomes[int(request_id)] = (True, exception)
+      else:
+        outcomes[int(request_id)] = (False, response)
+
+    def GetChunkRetryAfter(chunk):
+      """Returns the rate limited requests of the chunk and the wait."""
+      rate_limited = []
+      retry_after = 0
+      for index, request in chunk:
+        raised_exception, result = outcomes[index]
+        if raised_exception and isinstance(result, errors.HttpError):
+          request_retry_after = GetRetryAfter(result)
+          if request_retry_after is not None:
+            rate_limited.append((index, request))
+            retry_after = max(retry_after, request_retry_after)
+      return rate_limited, retry_after
+
+    if http is None:
+      http = self.GetHttp()
+    batch_uri = self._flags.api_host + 'batch'
+    rate_limiter = self.GetRateLimiter()
+    for start in xrange(0, len(requests), MAX_BATCH_SIZE):
+      chunk = requests[start:start + MAX_BATCH_SIZE]
+      delay = RATE_LIMIT_INITIAL_DELAY
+      for retry in range(RATE_LIMIT_RETRIES + 1):
+        batch = apiclient_http.BatchHttpRequest(callback=Callback,
+                                                batch_uri=batch_uri)
+        for index, request in chunk:
+          rate_limiter.Acquire()
+          outcomes.pop(index, None)
+          batch.add(request, request_id=str(index))
+        try:
+          batch.execute(http=http)
+        except Exception, e:  # pylint: disable-msg=W0703
+          LOGGER.debug(traceback.format_exc())
+          for index, _ in chunk:
+            outcomes.setdefault(index, (True, e))
+
+        chunk, retry_after = GetChunkRetryAfter(chunk)
+        if not chunk or retry == RATE_LIMIT_RETRIES:
+          break
+        if retry_after == 0:
+          retry_after = delay
+          delay *= 2
+        LOGGER.info('%d requests were rate limited, retrying in %s seconds.',
+                    len(chunk), retry_after)
+        rate_limiter.Pause(retry_after)
+    return outcomes
+
+  def _ExecuteRequestsTogether(self, requests, http=None):
+    """Execute requests, together in batch HTTP requests where possible.
+
+    Args:
+      requests: A list of (index, request) tuples.
+      http: An optional httplib2.Http object to send the requests with.
+
+    Returns:
+      A dict mapping the index of each request to a tuple of
+      (raised_exception, result), where result is the exception if one
+      was raised.
+    """
+    if (self._flags.batch_requests and len(requests) > 1 and
+        all(self._IsBatchable(request) for _, request in requests)):
+      return self._ExecuteBatchRequests(requests, http=http)
+
+    outcomes = {}
+    for index, request in requests:
+      try:
+        outcomes[index] = (False, request.execute(http=http))
+      except Exception, e:  # pylint: disable-msg=W0703
+        LOGGER.debug(traceback.format_exc())
+        outcomes[index] = (True, e)
+    return outcomes
+
   def WaitForOperation(self, flag_values, timer, result, http=None,
                        collection_name=None):
     """Wait for a potentially asynchronous operation to complete.
@@ -1254,69 +1726,154 @@ class GoogleComputeCommand(appcommands.Cmd):
           methods.
       result: The result of the request, potentially containing an operation.
       http: An optional httplib2.Http object to use for requests.
+      collection_name: The name of the collection the operation acts on.
 
     Returns:
       The synchronous return value, usually an operation object.
     """
-    resource = None
-    if not self.IsResultAnOperation(result):
-      return result
+    raised_exception, result = self.WaitForOperations(
+        flag_values, timer, [result], http=http,
+        collection_name=collection_name)[0]
+    if raised_exception:
+      raise result
+    return result
+
+  def WaitForOperations(self, flag_values, timer, results, http=None,
+                        collection_name=None):
+    """Wait for potentially asynchronous operations to complete.
+
+    All of the pending operations are polled together, in batch requests
+    where possible.  Polls start MIN_POLL_INTERVAL apart and back off as
+    the operations age, up to --sleep_between_polls apart.
 
+    Args:
+      flag_values: The parsed FlagValues instance.
+      timer: An implementation of the time object, providing time and sleep
+          methods.
+      results: The results of the requests, potentially containing
+          operations.
+      http: An optional httplib2.Http object to use for requests.
+      collection_name: The name of the collection the operations act on.
+
+    Returns:
+      A list of (raised_exception, result) tuples, one for each of the
+      given results, where result is the synchronous return value, usually
+      an operation object, or the exception raised while polling.
+    """
+    outcomes = [(False, result) for result in results]
+    pending = set(index for index, result in enumerate(results)
+                  if self.IsResultAnOperation(result) and
+                  result['status'] != 'DONE')
+    done = set(index for index, result in enumerate(results)
+               if self.IsResultAnOperation(result)) - pending
+
+    collection_name = (collection_name
+                       or getattr(self, 'resource_collection_name', None))
+    if pending and http is None:
+      http = self.GetHttp()
     start_time = timer.time()
-    operation_type = result['operationType']
-    target = result['targetLink'].split('/')[-1]
-
-    while result['status'] != 'DONE':
-      if timer.time() - start_time >= flag_values.max_wait_time:
-        LOGGER.warn('Timeout reached. %s of %s has not yet completed. '
-                    'The operation (%s) is still %s.',
-                    operation_type, target, result['name'], result['status'])
+    while pending:
+      elapsed = timer.time() - start_time
+      if elapsed >= flag_values.max_wait_time:
+        for index in sorted(pending):
+          result = outcomes[index][1]
+          LOGGER.warn('Timeout reached. %s of %s has not yet completed. '
+                      'The operation (%s) is still %s.',
+                      result['operationType'],
+                      result['targetLink'].split('/')[-1],
+                      result['name'], result['status'])
         break  # Timeout
 
-      collection_name = (collection_name
-                         or getattr(self, 'resource_collection_name', None))
-      if collection_name:
-        singular_collection_name = utils.Singularize(collection_name)
-        qualified_name = '%s %s' % (singular_collection_name, target)
+      sleep_time = min(max(elapsed * POLL_BACKOFF_FACTOR, MIN_POLL_INTERVAL),
+                       flag_values.sleep_between_polls)
+      if len(pending) == 1:
+        result = outcomes[iter(pending).next()][1]
+        target = result['targetLink'].split('/')[-1]
+        if collection_name:
+          qualified_name = '%s %s' % (utils.Singularize(collection_name),
+                                      target)
+        else:
+          qualified_name = target
+        LOGGER.info('Waiting for %s of %s. Sleeping for %ss.',
+                    result['operationType'], qualified_name, sleep_time)
       else:
-        qualified_name = target
+        LOGGER.info('Waiting for %d operations. Sleeping for %ss.',
+                    len(pending), sleep_time)
+      timer.sleep(sleep_time)
+
+      polled = self._ExecuteRequestsTogether(
+          [(index, self._GetOperationRequest(outcomes[index][1]))
+           for index in sorted(pending)],
+          http=http)
+      for index, outcome in polled.iteritems():
+        outcomes[index] = outcome
+        raised_exception, result = outcome
+        if raised_exception:
+          pending.discard(index)
+        elif result['status'] == 'DONE':
+          pending.discard(index)
+          done.add(index)
+
+    # We are going to replace each completed operation with its resulting
+    # resource.  Save the operation to return as well.
+    targets = [index for index in sorted(done)
+               if outcomes[index][1]['operationType'] != 'delete' and
+               'error' not in outcomes[index][1]]
+    if targets:
+      if http is None:
+        http = self.GetHttp()
+      resources = self._GetTargetResources(
+          [(index, outcomes[index][1]['targetLink']) for index in targets],
+          http)
+      for index, resource in resources.iteritems():
+        outcomes[index] = (False, [outcomes[index][1], resource])
+      self._RecordResourceZones(resources.values())
+    return outcomes
+
+  def _GetOperationRequest(self, operation):
+    """Returns the request that polls the given operation for its status."""
+    kwargs = {
+        'project': self._project,
+        'operation': operation['name'],
+    }
+
+    poll_api = self._global_operations_api
 
-      LOGGER.info('Waiting for %s of %s. Sleeping for %ss.', operation_type,
-                  qualified_name, flag_values.sleep_between_polls)
-      timer.sleep(flag_values.sleep_between_polls)
+    if self._IsUsingAtLeastApiVersion('v1beta14'):
+      operation_zone = self._GetZoneFromSelfLink(operation['selfLink'])
+      if operation_zone:
+        kwargs['zone'] = operation_zone
+        poll_api = self._zone_operations_api
 
-      kwargs = {
-          'project': self._project,
-          'operation': result['name'],
-      }
+    return poll_api.get(**kwargs)
 
-      poll_api = self._global_operations_api
+  def _GetTargetResources(self, target_links, http):
+    """Fetch the resources at the given links.
 
-      if self._IsUsingAtLeastApiVersion('v1beta14'):
-        operation_zone = self._GetZoneFromSelfLink(result['selfLink'])
-        if operation_zone:
-          kwargs['zone'] = operation_zone
-          poll_api = self._zone_operations_api
+    Args:
+      target_links: A list of (index, target link) tuples.
+      http: An httplib2.Http object to use for requests.
 
-      # Poll the operation for status.
-      request = poll_api.get(**kwargs)
-      result = request.execute(http=http)
-    else:
-      if result['operationType'] != 'delete' and 'error' not in result:
-        # We are going to replace the operation with its resulting resource.
-        # Save the operation to return as well.
-        target_link = result['targetLink']
-        http = self.CreateHttp()
-        response, data = http.request(target_link, method='GET')
-        if 200 <= response.status <= 299:
-          resource = json.loads(data)
-
-    if resource is not None:
-      results = []
-      results.append(result)
-      results.append(resource)
-      return results
-    return result
+    Returns:
+      A dict mapping the index of each resource that could be fetched to
+      the resource.
+    """
+    if self._flags.batch_requests and len(target_links) > 1:
+      postproc = model.JsonModel().response
+      requests = [(index, apiclient_http.HttpRequest(
+          http, postproc, target_link, method='GET', headers={}))
+                  for index, target_link in target_links]
+      outcomes = self._ExecuteBatchRequests(requests, http=http)
+      return dict((index, resource)
+                  for index, (raised_exception, resource)
+                  in outcomes.iteritems() if not raised_exception)
+
+    resources = {}
+    for index, target_link in target_links:
+      response, data = http.request(target_link, method='GET')
+      if 200 <= response.status <= 299:
+        resources[index] = json.loads(data)
+    return resources
 
   def CommandGetHelp(self, unused_argv, cmd_names=None):
     """Get help for command.
@@ -1663,11 +2220,14 @@ class GoogleComputeCommand(appcommands.Cmd):
     """Returns a list of scopes required for this command."""
     return scopes.DEFAULT_AUTH_SCOPES
 
-  def SetFlagDefaults(self):
-    if 'project' in FLAGS.FlagDict() and not FLAGS['project'].present:
+  def SetFlagDefaults(self, flag_values=None):
+    if flag_values is None:
+      flag_values = FLAGS
+    if ('project' in flag_values.FlagDict() and
+        not flag_values['project'].present):
       try:
         metadata = metadata_lib.Metadata()
-        setattr(FLAGS, 'project', metadata.GetProjectId())
+        setattr(flag_values, 'project', metadata.GetProjectId())
       except metadata_lib.MetadataError:
         pass
 
@@ -1721,14 +2281,50 @@ class GoogleComputeListCommand(GoogleComputeCommand):
                       False,
                       'Whether to fetch all pages on truncated results',
                       flag_values=flag_values)
+    self._error_in_streamed_items = False
 
   def Handle(self):
-    """Returns the result of list on a resource type."""
+    """Returns the result of list on a resource type.
+
+    When the result is printed in a format that does not need all of the
+    resources at once, its items are an iterator fetching the pages of
+    resources as they are printed.
+    """
     if self._flags.sort_by or self._flags.fetch_all_pages:
       max_results = None
     else:
       max_results = self._flags.max_results
 
+    if self._CanStreamItems():
+      return self._StreamItems(max_results)
+
+    zones = self._GetZonesToList()
+    if zones is not None:
+      items = []
+      for sub_result in self.ListInZones(
+          [(self.ListZoneFunc() if zone else self.ListFunc(), zone)
+           for zone in zones],
+          max_results,
+          self._flags.filter):
+        kind = sub_result.get('kind')
+        items.extend(sub_result.get('items', []))
+
+      return {'kind': kind, 'items': items}
+
+    # A global collection
+    return utils.All(
+        self.ListFunc(),
+        self._project,
+        max_results=max_results,
+        filter=self._flags.filter)
+
+  def _GetZonesToList(self):
+    """Returns the zones to list the collection in.
+
+    Returns:
+      A list of the zones to list resources in, holding None for the
+      global namespace, or None if the collection is global only.
+    """
     if (self._IsUsingAtLeastApiVersion('v1beta14') and
         self.is_zone_level_collection):
       # We have three cases for zone level collections:
@@ -1751,35 +2347,113 @@ class GoogleComputeListCommand(GoogleComputeCommand):
         if self.is_global_level_collection:
           zones.append(None)
         zones.extend(self._GetZones())
+      return zones
+    return None
 
-      items = []
-      for zone in zones:
-        list_func = self.ListZoneFunc() if zone else self.ListFunc()
-        sub_result = utils.All(list_func,
-                               self._project,
-                               max_results,
-                               self._flags.filter,
-                               zone)
-        kind = sub_result.get('kind')
-        items.extend(sub_result.get('items', []))
+  def _CanStreamItems(self):
+    """Returns True if the result can be printed as it is fetched.
 
-      return {'kind': kind, 'items': items}
+    The table formats lay out all of the rows at once, so only the csv,
+    json and names formats are streamed.
+    """
+    return (self._flags.print_json or
+            self._flags.format in ('csv', 'json', 'names'))
 
-    # A global collection
-    return utils.All(
-        self.ListFunc(),
-        self._project,
-        max_results=max_results,
-        filter=self._flags.filter)
+  def _StreamItems(self, max_results):
+    """Returns a list result whose items are fetched as they are consumed.
+
+    The first page is fetched for the kind of the result.  When the items
+    are not to be sorted, no more pages are fetched once --max_results
+    items have been consumed.
+
+    Args:
+      max_results: The maximum number of items to fetch from each list
+          function, or None to fetch all of them.
+
+    Returns:
+      A {'kind': ..., 'items': iterator} result.
+    """
+    zones = self._GetZonesToList()
+    if zones is not None:
+      pages = (res for _, res in self._IterPagesInZones(
+          [(self.ListZoneFunc() if zone else self.ListFunc(), zone)
+           for zone in zones],
+          max_results,
+          self._flags.filter))
+    else:
+      pages = utils.IterPages(
+          self.ListFunc(),
+          self._project,
+          max_results=max_results,
+          filter=self._flags.filter)
+
+    first_page = next(pages, {})
+    items = itertools.chain(
+        first_page.get('items', []),
+        itertools.chain.from_iterable(page.get('items', []) for page in pages))
+    if max_results is not None and not self._GetSortColumn():
+      items = itertools.islice(items, max_results)
+    return {'kind': first_page.get('kind'),
+            'items': self._WatchForErrors(items)}
+
+  def _WatchForErrors(self, items):
+    """Yields the given items, noting any that hold errors."""
+    for item in items:
+      if item.get('error', {}).get('errors', []):
+        self._error_in_streamed_items = True
+      yield item
+
+  def _ErrorInResult(self, result):
+    """Return True if a result should be considered an error."""
+    if self._error_in_streamed_items and self._flags.synchronous_mode:
+      return True
+    return super(GoogleComputeListCommand, self)._ErrorInResult(result)
+
+  def PrintResult(self, result):
+    """Pretty-print the result of the command.
+
+    Streamed items are printed as JSON one at a time, in the same layout
+    as json.dumps would print the whole result in.
+
+    Args:
+      result: A JSON-serializable object to print.
+    """
+    if ((self._flags.print_json or self._flags.format == 'json') and
+        isinstance(result, dict) and
+        not isinstance(result.get('items', []), list)):
+      self._PrintJsonItems(result)
+      return
+    super(GoogleComputeListCommand, self).PrintResult(result)
+
+  def _PrintJsonItems(self, result):
+    """Prints a list result with streamed items as JSON."""
+    separator = '\n'
+    sys.stdout.write('{\n  "items": [')
+    for item in result['items']:
+      sys.stdout.write(separator + '    ' + json.dumps(
+          item, sort_keys=True, indent=2).replace('\n', '\n    '))
+      separator = ', \n'
+    if separator != '\n':
+      sys.stdout.write('\n  ')
+    sys.stdout.write('], \n  "kind": %s\n}\n' % json.dumps(result['kind']))
+
+  def _GetSortColumn(self):
+    """Returns the column to sort by, starting with "-" if descending."""
+    return self._flags.sort_by or getattr(self, 'default_sort_field', None)
 
   def _PrintList(self, result):
-    """Prints a table for the given resources."""
+    """Prints a table for the given resources.
+
+    The rows are flattened as they are printed.  When they are sorted and
+    truncated to --max_results, only that many rows are kept while the
+    rest are compared against them.
+    """
     items = result.get('items', [])
     column_names = [x[0] for x in self.summary_fields]
-    rows = [self._FlattenObjectToList(row, self.summary_fields)
-            for row in items]
+    rows = (self._FlattenObjectToList(row, self.summary_fields)
+            for row in items)
 
-    sort_col = self._flags.sort_by or getattr(self, 'default_sort_field', None)
+    sort_col = self._GetSortColumn()
     if sort_col:
       reverse = False
       if sort_col.startswith('-'):
@@ -1788,8 +2462,13 @@ class GoogleComputeListCommand(GoogleComputeCommand):
 
       if sort_col in column_names:
         sort_col_idx = column_names.index(sort_col)
-        rows = sorted(rows, key=(lambda row: row[sort_col_idx]),
-                      reverse=reverse)
+        sort_key = lambda row: row[sort_col_idx]
+        if self._flags.fetch_all_pages:
+          rows = sorted(rows, key=sort_key, reverse=reverse)
+        elif reverse:
+          rows = heapq.nlargest(self._flags.max_results, rows, key=sort_key)
+        else:
+          rows = heapq.nsmallest(self._flags.max_results, rows, key=sort_key)
       else:
         LOGGER.warn('Invalid sort column: ' + sort_col)
 
@@ -1799,10 +2478,8 @@ class GoogleComputeListCommand(GoogleComputeCommand):
       # results on the client side. If sorting was not requested, we
       # truncate anyway in case the server gives back more results
       # than requested.
-      rows = rows[:self._flags.max_results]
+      rows = itertools.islice(rows, self._flags.max_results)
 
     table = self._CreateFormatter()
     table.AddColumns(column_names)
-    table.AddRows(rows)
-
-    print table
+    table.PrintRows(rows)
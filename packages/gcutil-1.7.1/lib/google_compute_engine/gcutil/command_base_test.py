@@ -25,13 +25,19 @@ path_initializer.InitializeSysPath()
 
 import copy
 import datetime
+import json
 import os
+import shutil
 import sys
 import tempfile
 
 
 
 
+from apiclient import errors
+from apiclient import http as apiclient_http
+from apiclient import model
+import httplib2
 from google.apputils import app
 import gflags as flags
 import unittest
@@ -39,6 +45,8 @@ import unittest
 from gcutil import command_base
 from gcutil import gcutil_logging
 from gcutil import mock_api
+from gcutil import resource_cache
+from gcutil import thread_pool
 
 FLAGS = flags.FLAGS
 
@@ -1119,6 +1127,78 @@ class CommandBaseTest(unittest.TestCase):
 
     self.assertEqual(mock_output.GetCapturedText(), expected_output)
 
+  def _PrintListResult(self, command, flag_values):
+    """Runs the given list command, returning its printed output."""
+    mock_output = mock_api.MockOutput()
+    oldout = sys.stdout
+    sys.stdout = mock_output
+    try:
+      command.SetFlags(flag_values)
+      command.PrintResult(command.Handle())
+    finally:
+      sys.stdout = oldout
+    return mock_output.GetCapturedText()
+
+  def testStreamedJsonListsPrintAsTheyWould(self):
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.project = 'user'
+    command = CommandBaseTest.ListMockCommand('mock_command', flag_values)
+    command.SetFlags(flag_values)
+    result = command.Handle()
+
+    flag_values.format = 'json'
+    self.assertEqual(json.dumps(result, sort_keys=True, indent=2) + '\n',
+                     self._PrintListResult(command, flag_values))
+
+    # An empty list.
+    command.ListFunc = lambda: lambda **unused_kwargs: mock_api.MockRequest(
+        {'kind': 'cloud#objectList'})
+    flag_values.format = 'json'
+    self.assertEqual(
+        json.dumps({'kind': 'cloud#objectList', 'items': []},
+                   sort_keys=True, indent=2) + '\n',
+        self._PrintListResult(command, flag_values))
+
+  def testStreamedListsStopFetchingAtMaxResults(self):
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.project = 'user'
+    flag_values.format = 'names'
+    command = CommandBaseTest.ListMockCommandBase('mock_command', flag_values)
+    flag_values.max_results = 2
+    requested_pages = []
+
+    def ListFunc(pageToken=None, **unused_kwargs):
+      requested_pages.append(pageToken)
+      return mock_api.MockRequest(
+          {'kind': 'cloud#objectList',
+           'items': [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}],
+           'nextPageToken': 'next'})
+
+    command.ListFunc = lambda: ListFunc
+    self.assertEqual('a\nb\n', self._PrintListResult(command, flag_values))
+    self.assertEqual([None], requested_pages)
+
+  def testSortedCsvListsKeepTheTopRows(self):
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.project = 'user'
+    flag_values.format = 'csv'
+    command = CommandBaseTest.ListMockCommand('mock_command', flag_values)
+    flag_values.max_results = 2
+
+    flag_values.sort_by = '-id'
+    self.assertEqual('name,id,description\n'
+                     'my-object-d,999,Object D\n'
+                     'my-object-a,789,Object A\n',
+                     self._PrintListResult(command, flag_values))
+
+    # Without --sort_by, only the first --max_results objects are fetched
+    # before they are sorted by the default sort field.
+    flag_values.sort_by = None
+    self.assertEqual('name,id,description\n'
+                     'my-object-a,789,Object A\n'
+                     'my-object-c,123,Object C\n',
+                     self._PrintListResult(command, flag_values))
+
   def testGracefulHandlingOfInvalidDefaultSortField(self):
 
     class ListMockCommandWithBadDefaultSortField(
@@ -1331,11 +1411,311 @@ class CommandBaseTest(unittest.TestCase):
     self.assertEqual(30, command._global_operations_api.GetCallCount())
     self.assertEqual(result['status'], 'PENDING')
 
+  def testWaitForOperationsPollsTogether(self):
+
+    def Operation(name, status, operation_type='insert'):
+      return {'kind': 'compute#operation',
+              'name': name,
+              'status': status,
+              'operationType': operation_type,
+              'targetLink': 'https://www.googleapis.com/compute/v1beta13/'
+                            'projects/p/instances/%s' % name,
+              'selfLink': 'https://www.googleapis.com/compute/v1beta13/'
+                          'projects/p/operations/%s' % name}
+
+    def BatchResponse(parts):
+      return ''.join('--batch_boundary\r\n'
+                     'Content-Type: application/http\r\n'
+                     'Content-ID: <response-id+%d>\r\n\r\n'
+                     'HTTP/1.1 200 OK\r\n'
+                     'Content-Type: application/json\r\n\r\n'
+                     '%s\r\n' % (index, json.dumps(body))
+                     for index, body in parts) + '--batch_boundary--'
+
+    batch_headers = {
+        'status': '200',
+        'content-type': 'multipart/mixed; boundary="batch_boundary"'}
+    http = apiclient_http.HttpMockSequence([
+        # The two pending operations are polled together.
+        (batch_headers, BatchResponse([(0, Operation('i0', 'DONE')),
+                                       (1, Operation('i1', 'RUNNING'))])),
+        # A single pending operation is polled on its own.
+        ({'status': '200'}, json.dumps(Operation('i1', 'DONE'))),
+        # The resulting resources are fetched together.
+        (batch_headers, BatchResponse([(0, {'kind': 'compute#instance',
+                                            'name': 'i0'}),
+                                       (1, {'kind': 'compute#instance',
+                                            'name': 'i1'})]))])
+
+    class MockCommand(command_base.GoogleComputeCommand):
+
+      def SetApi(self, api):
+        pass
+
+      def Handle(self):
+        pass
+
+      def CreateHttp(self):
+        return http
+
+    class LocalMockOperationsApi(object):
+
+      def get(self, project='unused project', operation='operation'):
+        return apiclient_http.HttpRequest(
+            None, model.JsonModel().response,
+            'https://www.googleapis.com/compute/v1beta13/projects/%s/'
+            'operations/%s' % (project, operation), headers={})
+
+    class MockTimer(object):
+
+      def __init__(self):
+        self.sleeps = []
+
+      def time(self):
+        return sum(self.sleeps)
+
+      def sleep(self, time_to_sleep):
+        self.sleeps.append(time_to_sleep)
+
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.service_version = 'v1beta13'
+    flag_values.project = 'p'
+    command = MockCommand('mock_command', flag_values)
+    command.SetFlags(flag_values)
+    command._global_operations_api = LocalMockOperationsApi()
+
+    timer = MockTimer()
+    disk = {'kind': 'compute#disk'}
+    results = command.WaitForOperations(
+        flag_values, timer,
+        [Operation('i0', 'PENDING'), Operation('i1', 'PENDING'),
+         Operation('i2', 'DONE', 'delete'), disk])
+
+    self.assertEqual([], http._iterable)
+    self.assertEqual([1, 1], timer.sleeps)
+    self.assertEqual([False] * 4, [raised for raised, _ in results])
+    self.assertEqual(['DONE', 'i0'],
+                     [results[0][1][0]['status'], results[0][1][1]['name']])
+    self.assertEqual(['DONE', 'i1'],
+                     [results[1][1][0]['status'], results[1][1][1]['name']])
+    self.assertEqual('i2', results[2][1]['name'])
+    self.assertEqual(disk, results[3][1])
+
+  def testExecuteRequestsInBatches(self):
+
+    def BatchResponse(indexes):
+      parts = []
+      for index in indexes:
+        if index == 3:
+          status = '404 Not Found'
+          body = '{"error": {"message": "not found"}}'
+        else:
+          status = '200 OK'
+          body = '{"kind": "compute#disk", "name": "disk-%d"}' % index
+        parts.append('--batch_boundary\r\n'
+                     'Content-Type: application/http\r\n'
+                     'Content-ID: <response-id+%d>\r\n\r\n'
+                     'HTTP/1.1 %s\r\n'
+                     'Content-Type: application/json\r\n\r\n'
+                     '%s\r\n' % (index, status, body))
+      return ''.join(parts) + '--batch_boundary--'
+
+    headers = {'status': '200',
+               'content-type': 'multipart/mixed; boundary="batch_boundary"'}
+    batch_http = apiclient_http.HttpMockSequence([
+        (headers, BatchResponse([0, 1])),
+        (headers, BatchResponse([2, 3])),
+        (headers, BatchResponse([4]))])
+
+    class MockCommand(command_base.GoogleComputeCommand):
+
+      def SetApi(self, api):
+        pass
+
+      def Handle(self):
+        pass
+
+      def CreateHttp(self):
+        return batch_http
+
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.synchronous_mode = False
+    command = MockCommand('mock_command', flag_values)
+    command.SetFlags(flag_values)
+
+    postproc = model.JsonModel().response
+    requests = [
+        apiclient_http.HttpRequest(
+            None, postproc,
+            'https://www.googleapis.com/compute/v1beta14/projects/p/'
+            'zones/z/disks/disk-%d' % i, headers={})
+        for i in xrange(5)]
+    # Requests that cannot be batched go through the thread pool.
+    requests.append(mock_api.MockRequest({'kind': 'compute#disk',
+                                          'name': 'disk-5'}))
+
+    old_max_batch_size = command_base.MAX_BATCH_SIZE
+    command_base.MAX_BATCH_SIZE = 2
+    try:
+      results, exceptions = command.ExecuteRequests(requests)
+    finally:
+      command_base.MAX_BATCH_SIZE = old_max_batch_size
+
+    self.assertEqual(['disk-0', 'disk-1', 'disk-2', 'disk-4', 'disk-5'],
+                     [result['name'] for result in results])
+    self.assertEqual(1, len(exceptions))
+    self.assertTrue(isinstance(exceptions[0], errors.HttpError))
+    self.assertEqual([], batch_http._iterable)
+
+  def testBatchRequestsRetryRateLimitedRequests(self):
+
+    def BatchResponse(statuses):
+      parts = []
+      for index, status in statuses:
+        if status == '200 OK':
+          body = '{"kind": "compute#disk", "name": "disk-%d"}' % index
+          retry_after = ''
+        else:
+          body = '{"error": {"message": "rate limited"}}'
+          retry_after = 'Retry-After: 3\r\n'
+        parts.append('--batch_boundary\r\n'
+                     'Content-Type: application/http\r\n'
+                     'Content-ID: <response-id+%d>\r\n\r\n'
+                     'HTTP/1.1 %s\r\n'
+                     '%s'
+                     'Content-Type: application/json\r\n\r\n'
+                     '%s\r\n' % (index, status, retry_after, body))
+      return ''.join(parts) + '--batch_boundary--'
+
+    class MockTimer(object):
+
+      def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+      def time(self):
+        return self.now
+
+      def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    headers = {'status': '200',
+               'content-type': 'multipart/mixed; boundary="batch_boundary"'}
+    rate_limited = '429 Too Many Requests'
+    # Only the rate limited calls are sent again, in a new batch request.
+    batch_http = apiclient_http.HttpMockSequence(
+        [(headers, BatchResponse([(0, '200 OK'), (1, rate_limited)])),
+         (headers, BatchResponse([(1, '200 OK')])),
+         (headers, BatchResponse([(2, rate_limited)]))] +
+        [(headers, BatchResponse([(2, rate_limited)]))] *
+        command_base.RATE_LIMIT_RETRIES)
+
+    flag_values = copy.deepcopy(FLAGS)
+    command = CommandBaseTest.MockDetailCommand('mock_command', flag_values)
+    command.SetFlags(flag_values)
+    timer = MockTimer()
+    command._rate_limiter = thread_pool.RateLimiter(timer=timer)
+
+    postproc = model.JsonModel().response
+    requests = [
+        (i, apiclient_http.HttpRequest(
+            None, postproc,
+            'https://www.googleapis.com/compute/v1beta14/projects/p/'
+            'zones/z/disks/disk-%d' % i, headers={}))
+        for i in xrange(3)]
+
+    old_max_batch_size = command_base.MAX_BATCH_SIZE
+    command_base.MAX_BATCH_SIZE = 2
+    try:
+      outcomes = command._ExecuteBatchRequests(requests, http=batch_http)
+    finally:
+      command_base.MAX_BATCH_SIZE = old_max_batch_size
+
+    for index in (0, 1):
+      raised_exception, result = outcomes[index]
+      self.assertFalse(raised_exception)
+      self.assertEqual('disk-%d' % index, result['name'])
+    # Calls rate limited too often are not retried again.
+    self.assertTrue(outcomes[2][0])
+    self.assertEqual(429, outcomes[2][1].resp.status)
+    self.assertEqual([3] * (command_base.RATE_LIMIT_RETRIES + 1), timer.sleeps)
+    self.assertEqual([], batch_http._iterable)
+
+  def testApiOperationsRetryRateLimitedRequests(self):
+
+    def HttpError(status, retry_after=None, reason=None):
+      resp = httplib2.Response({'status': status})
+      if retry_after:
+        resp['retry-after'] = retry_after
+      content = json.dumps({'error': {'errors': [{'reason': reason}]}})
+      return errors.HttpError(resp, content)
+
+    class FailingRequest(object):
+
+      def __init__(self, failures):
+        self.failures = failures
+
+      def execute(self, http=None):
+        if self.failures:
+          raise self.failures.pop(0)
+        return {'kind': 'compute#disk'}
+
+    class MockTimer(object):
+
+      def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+      def time(self):
+        return self.now
+
+      def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    flag_values = copy.deepcopy(FLAGS)
+    command = CommandBaseTest.MockDetailCommand('mock_command', flag_values)
+    command.GetHttp = lambda: None
+    timer = MockTimer()
+    rate_limiter = thread_pool.RateLimiter(timer=timer)
+
+    request = FailingRequest([
+        HttpError(429, retry_after='7'),
+        HttpError(503),
+        HttpError(403, reason='userRateLimitExceeded'),
+        HttpError(503, retry_after='a date')])
+    op = command_base.ApiThreadPoolOperation(
+        request, command, False, rate_limiter=rate_limiter)
+    self.assertEqual({'kind': 'compute#disk'}, op.Run())
+    self.assertEqual([7, 1, 2, 4], timer.sleeps)
+
+    # Other errors, and requests rate limited too often, are not retried.
+    for failures in ([HttpError(403, reason='forbidden')],
+                     [HttpError(429)] * (command_base.RATE_LIMIT_RETRIES + 1)):
+      op = command_base.ApiThreadPoolOperation(
+          FailingRequest(failures), command, False, rate_limiter=rate_limiter)
+      self.assertRaises(errors.HttpError, op.Run)
+
   def testBuildComputeApi(self):
     """Ensures that building of the API from the discovery succeeds."""
     flag_values = copy.deepcopy(FLAGS)
     command = command_base.GoogleComputeCommand('test_cmd', flag_values)
-    command._BuildComputeApi(None)
+    temp_dir = tempfile.mkdtemp()
+    old_cached_discovery_file = FLAGS.cached_discovery_file
+    FLAGS.cached_discovery_file = os.path.join(temp_dir, 'discovery')
+    try:
+      command._BuildComputeApi(None)
+      # The second time the discovery document comes from the cache.
+      self.assertEqual(1, len(os.listdir(temp_dir)))
+      api = command._BuildComputeApi(None)
+    finally:
+      FLAGS.cached_discovery_file = old_cached_discovery_file
+      shutil.rmtree(temp_dir)
+
+    request = api.zones().get(project='p', zone='z')
+    self.assertTrue('/projects/p/zones/z?' in request.uri)
+    self.assertRaises(AttributeError, getattr, api.zones(), 'no_such_method')
 
   def testGetZone(self):
     zones = {
@@ -1489,6 +1869,73 @@ class CommandBaseTest(unittest.TestCase):
         'explicitly-set-zone')
 
 
+  def testGetZoneForResourceWithResourceCache(self):
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.project = 'p'
+    flag_values.service_version = 'v1beta14'
+
+    class MockCommand(command_base.GoogleComputeCommand):
+
+      def __init__(self, name, flag_values):
+        super(MockCommand, self).__init__(name, flag_values)
+        flags.DEFINE_string('zone', None, 'Zone name.',
+                            flag_values=flag_values)
+
+      def SetApi(self, api):
+        pass
+
+      def Handle(self):
+        pass
+
+    class MockZonesApi(object):
+
+      def list(self, **unused_kwargs):
+        raise AssertionError('Zones should be read from the cache.')
+
+    listed_zones = []
+
+    class MockDisksApi(object):
+
+      def list(self, zone=None, **unused_kwargs):
+        listed_zones.append(zone)
+        items = []
+        if zone == 'zone-c':
+          items.append({'name': 'disk-1',
+                        'selfLink': 'https://www.googleapis.com/compute/'
+                                    'v1beta14/projects/p/zones/zone-c/disks/'
+                                    'disk-1'})
+        return mock_api.MockRequest({'kind': 'compute#diskList',
+                                     'items': items})
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+      cache = resource_cache.ResourceCache(
+          'v1beta14', cache_file_name=os.path.join(temp_dir, 'resources'))
+      cache.SetCollection('p', 'zones', [{'name': 'zone-a'},
+                                         {'name': 'zone-b'},
+                                         {'name': 'zone-c'}])
+      cache.SetResourceZone('p', 'disk-1', 'zone-b')
+
+      command = MockCommand('mock_command', flag_values)
+      command.SetFlags(flag_values)
+      command._zones_api = MockZonesApi()
+      command._resource_cache = cache
+
+      # The cached zone is stale, so all the zones are searched and the
+      # zone the disk is found in is remembered.
+      self.assertEqual('zone-c',
+                       command.GetZoneForResource(MockDisksApi(), 'disk-1'))
+      self.assertEqual(['zone-b', 'zone-a', 'zone-b', 'zone-c'], listed_zones)
+      self.assertEqual('zone-c', cache.GetResourceZone('p', 'disk-1'))
+
+      # The next lookup only lists the remembered zone.
+      listed_zones[:] = []
+      self.assertEqual('zone-c',
+                       command.GetZoneForResource(MockDisksApi(), 'disk-1'))
+      self.assertEqual(['zone-c'], listed_zones)
+    finally:
+      shutil.rmtree(temp_dir)
+
   def testGetUsageWithPositionalArgs(self):
 
     class MockCommand(command_base.GoogleComputeCommand):
@@ -1647,5 +2094,71 @@ class CommandBaseTest(unittest.TestCase):
     self.assertEqual(list_all, command.Handle())
 
 
+  def testListInZones(self):
+
+    def BatchResponse(parts):
+      return ''.join('--batch_boundary\r\n'
+                     'Content-Type: application/http\r\n'
+                     'Content-ID: <response-id+%d>\r\n\r\n'
+                     'HTTP/1.1 200 OK\r\n'
+                     'Content-Type: application/json\r\n\r\n'
+                     '%s\r\n' % (index, json.dumps(body))
+                     for index, body in parts) + '--batch_boundary--'
+
+    batch_headers = {
+        'status': '200',
+        'content-type': 'multipart/mixed; boundary="batch_boundary"'}
+    http = apiclient_http.HttpMockSequence([
+        # The first page of every zone is fetched in one batch.
+        (batch_headers, BatchResponse([
+            (0, {'kind': 'compute#diskList',
+                 'items': [{'name': 'a1'}],
+                 'nextPageToken': 'a-page-2'}),
+            (1, {'kind': 'compute#diskList', 'items': [{'name': 'b1'}]}),
+            (2, {'kind': 'compute#diskList'})])),
+        # Only zone a has a second page.
+        ({'status': '200'}, json.dumps({'kind': 'compute#diskList',
+                                        'items': [{'name': 'a2'}]}))])
+
+    requested_params = []
+
+    def ListFunc(**kwargs):
+      requested_params.append(kwargs)
+      return apiclient_http.HttpRequest(
+          http, model.JsonModel().response,
+          'https://www.googleapis.com/compute/v1beta14/projects/p/zones/%s/'
+          'disks' % kwargs['zone'], headers={})
+
+    class MockCommand(command_base.GoogleComputeCommand):
+
+      def SetApi(self, api):
+        pass
+
+      def Handle(self):
+        pass
+
+      def CreateHttp(self):
+        return http
+
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.project = 'p'
+    command = MockCommand('mock_command', flag_values)
+    command.SetFlags(flag_values)
+
+    results = command.ListInZones(
+        [(ListFunc, 'a'), (ListFunc, 'b'), (ListFunc, 'c')],
+        filter='name eq .*')
+
+    self.assertEqual([], http._iterable)
+    self.assertEqual([['a1', 'a2'], ['b1'], []],
+                     [[item['name'] for item in result['items']]
+                      for result in results])
+    self.assertEqual(['compute#diskList'] * 3,
+                     [result['kind'] for result in results])
+    self.assertEqual([None, None, None, 'a-page-2'],
+                     [params.get('pageToken') for params in requested_params])
+    self.assertEqual(['name eq .*'] * 4,
+                     [params['filter'] for params in requested_params])
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,106 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Registry of the gcutil commands and the modules that define them.
+
+Only the module of the command being run is imported and registered, so
+that gcutil does not pay for importing every command module and defining
+the flags of every command on each invocation.
+"""
+
+
+# The name of the module in the gcutil package that defines each command.
+COMMAND_MODULES = {
+    'addaccessconfig': 'instance_cmds',
+    'adddisk': 'disk_cmds',
+    'addfirewall': 'firewall_cmds',
+    'addimage': 'image_cmds',
+    'addinstance': 'instance_cmds',
+    'addnetwork': 'network_cmds',
+    'addsnapshot': 'snapshot_cmds',
+    'auth': 'basic_cmds',
+    'batch': 'batch_cmds',
+    'deleteaccessconfig': 'instance_cmds',
+    'deletedisk': 'disk_cmds',
+    'deletefirewall': 'firewall_cmds',
+    'deleteimage': 'image_cmds',
+    'deleteinstance': 'instance_cmds',
+    'deletenetwork': 'network_cmds',
+    'deleteoperation': 'operation_cmds',
+    'deletesnapshot': 'snapshot_cmds',
+    'deprecateimage': 'image_cmds',
+    'getdisk': 'disk_cmds',
+    'getfirewall': 'firewall_cmds',
+    'getimage': 'image_cmds',
+    'getinstance': 'instance_cmds',
+    'getkernel': 'kernel_cmds',
+    'getmachinetype': 'machine_type_cmds',
+    'getnetwork': 'network_cmds',
+    'getoperation': 'operation_cmds',
+    'getproject': 'project_cmds',
+    'getserialportoutput': 'instance_cmds',
+    'getsnapshot': 'snapshot_cmds',
+    'getzone': 'zone_cmds',
+    'listdisks': 'disk_cmds',
+    'listfirewalls': 'firewall_cmds',
+    'listimages': 'image_cmds',
+    'listinstances': 'instance_cmds',
+    'listkernels': 'kernel_cmds',
+    'listmachinetypes': 'machine_type_cmds',
+    'listnetworks': 'network_cmds',
+    'listoperations': 'operation_cmds',
+    'listsnapshots': 'snapshot_cmds',
+    'listzones': 'zone_cmds',
+    'moveinstances': 'move_cmds',
+    'pull': 'instance_cmds',
+    'push': 'instance_cmds',
+    'resumemove': 'move_cmds',
+    'setcommoninstancemetadata': 'project_cmds',
+    'setinstancemetadata': 'instance_cmds',
+    'setinstancetags': 'instance_cmds',
+    'ssh': 'instance_cmds',
+    'version': 'basic_cmds',
+}
+
+# All of the command modules.
+ALL_MODULES = sorted(set(COMMAND_MODULES.itervalues()))
+
+
+def GetModuleNames(argv):
+  """Returns the names of the modules needed to run a command line.
+
+  Args:
+    argv: The command line arguments remaining after parsing the global
+        flags; argv[1], if present, is the name of the command.
+
+  Returns:
+    The list of module names.  This is all of the modules when no known
+    command is given, e.g. for help, which lists every command.
+  """
+  if len(argv) > 1 and argv[1] in COMMAND_MODULES:
+    return [COMMAND_MODULES[argv[1]]]
+  return ALL_MODULES
+
+
+def AddCommands(argv):
+  """Imports and registers the commands needed to run a command line.
+
+  Args:
+    argv: The command line arguments remaining after parsing the global
+        flags.
+  """
+  for module_name in GetModuleNames(argv):
+    # importlib is not available on Python 2.6.
+    module = __import__('gcutil.%s' % module_name, fromlist=['AddCommands'])
+    module.AddCommands()
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the command registry."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+from google.apputils import appcommands
+import unittest
+
+from gcutil import command_registry
+
+
+class CommandRegistryTest(unittest.TestCase):
+
+  def setUp(self):
+    self._old_add_cmd = appcommands.AddCmd
+    self.registered = {}
+    self._module_name = None
+
+    def MockAddCmd(command_name, unused_cmd_factory, **unused_kwargs):
+      self.registered[command_name] = self._module_name
+
+    appcommands.AddCmd = MockAddCmd
+
+  def tearDown(self):
+    appcommands.AddCmd = self._old_add_cmd
+
+  def testRegistryMatchesTheCommandModules(self):
+    for module_name in command_registry.ALL_MODULES:
+      self._module_name = module_name
+      __import__('gcutil.%s' % module_name,
+                 fromlist=['AddCommands']).AddCommands()
+    self.assertEqual(command_registry.COMMAND_MODULES, self.registered)
+
+  def testOnlyTheModuleOfTheCommandIsRegistered(self):
+    command_registry.AddCommands(['gcutil', 'listzones', '--project=p'])
+    self.assertEqual(['getzone', 'listzones'], sorted(self.registered))
+
+  def testAllModulesAreRegisteredWithoutAKnownCommand(self):
+    for argv in (['gcutil'], ['gcutil', 'help', 'listzones'],
+                 ['gcutil', 'nosuchcommand']):
+      self.assertEqual(command_registry.ALL_MODULES,
+                       command_registry.GetModuleNames(argv))
+
+
+if __name__ == '__main__':
+  unittest.main()
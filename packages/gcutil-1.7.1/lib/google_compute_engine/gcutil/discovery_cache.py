@@ -0,0 +1,88 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of deserialized discovery documents.
+
+Deserializing the discovery document is part of the fixed cost of every
+command.  The deserialized document is kept in marshal format, which loads
+faster than JSON, and keyed by the hash of the document it came from.
+"""
+
+from __future__ import with_statement
+
+
+
+import hashlib
+import json
+import marshal
+import os
+import threading
+
+import gflags as flags
+from gcutil import gcutil_logging
+
+FLAGS = flags.FLAGS
+LOGGER = gcutil_logging.LOGGER
+
+flags.DEFINE_string(
+    'cached_discovery_file',
+    '~/.gcutil.discovery',
+    'Prefix of the files storing deserialized discovery documents. '
+    'An empty value disables the cache.')
+
+
+def LoadDiscoveryDocument(discovery_doc, api_version, cache_file_name=None,
+                          open_function=open, os_module=os):
+  """Deserializes a discovery document, using the cache if possible.
+
+  Args:
+    discovery_doc: (str) the discovery document.
+    api_version: (str) the API version the document describes.
+    cache_file_name: (str) optional prefix of the cache file (default is
+      FLAGS.cached_discovery_file).
+    open_function: (function) used to open a file (overriden in tests).
+    os_module: (module) used to perform OS operations (overriden in tests).
+
+  Returns:
+    The deserialized discovery document.
+  """
+  if cache_file_name is None:
+    cache_file_name = FLAGS.cached_discovery_file
+  if not cache_file_name:
+    return json.loads(discovery_doc)
+
+  cache_file_path = '%s.%s' % (os_module.path.expanduser(cache_file_name),
+                               api_version)
+  digest = hashlib.sha1(discovery_doc).hexdigest()
+  if os_module.path.exists(cache_file_path):
+    try:
+      with open_function(cache_file_path, 'rb') as cache_file:
+        cached_digest, service = marshal.loads(cache_file.read())
+      if cached_digest == digest:
+        return service
+    except (IOError, EOFError, ValueError, TypeError), e:
+      LOGGER.debug('Ignoring unreadable discovery cache file %s: %s',
+                   cache_file_path, e)
+
+  service = json.loads(discovery_doc)
+  temp_path = '%s.%d.%d' % (cache_file_path, os_module.getpid(),
+                             threading.current_thread().ident)
+  try:
+    with open_function(temp_path, 'wb') as cache_file:
+      cache_file.write(marshal.dumps((digest, service)))
+    os_module.rename(temp_path, cache_file_path)
+  except (IOError, OSError), e:
+    LOGGER.debug('Could not write discovery cache file %s: %s',
+                 cache_file_path, e)
+  return service
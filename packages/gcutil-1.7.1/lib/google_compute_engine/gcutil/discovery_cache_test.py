@@ -0,0 +1,77 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the discovery document cache."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import json
+import os
+import shutil
+import tempfile
+
+import unittest
+
+from gcutil import discovery_cache
+
+
+class DiscoveryCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.cache_file = os.path.join(self.temp_dir, 'discovery')
+    self.cache_path = self.cache_file + '.v1'
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _Load(self, service):
+    return discovery_cache.LoadDiscoveryDocument(
+        json.dumps(service), 'v1', cache_file_name=self.cache_file)
+
+  def testDocumentIsCached(self):
+    service = {'name': 'compute', 'resources': {'zones': {}}}
+    self.assertEqual(service, self._Load(service))
+    self.assertTrue(os.path.exists(self.cache_path))
+    mtime = os.path.getmtime(self.cache_path)
+
+    self.assertEqual(service, self._Load(service))
+    self.assertEqual(mtime, os.path.getmtime(self.cache_path))
+
+  def testChangedDocumentReplacesCache(self):
+    self._Load({'version': 1})
+    self.assertEqual({'version': 2}, self._Load({'version': 2}))
+    self.assertEqual({'version': 2}, self._Load({'version': 2}))
+
+  def testUnreadableCacheFileIsIgnored(self):
+    cache_file = open(self.cache_path, 'wb')
+    cache_file.write('garbage')
+    cache_file.close()
+
+    self.assertEqual({'version': 1}, self._Load({'version': 1}))
+    self.assertEqual({'version': 1}, self._Load({'version': 1}))
+
+  def testCacheCanBeDisabled(self):
+    self.assertEqual({'version': 1}, discovery_cache.LoadDiscoveryDocument(
+        json.dumps({'version': 1}), 'v1', cache_file_name=''))
+    self.assertEqual([], os.listdir(self.temp_dir))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -23,6 +23,9 @@ FLAGS = flags.FLAGS
 _LOG_ROOT = 'gcutil-logs'
 LOGGER = logging.getLogger(_LOG_ROOT)
 
+# The handler added to LOGGER by SetupLogging.
+_handler = None
+
 CRITICAL = logging.CRITICAL
 FATAL = logging.FATAL
 ERROR = logging.ERROR
@@ -49,10 +52,16 @@ flags.DEFINE_enum(
 
 
 def SetupLogging():
-  """Set up a logger that will have its own logging level."""
-  gc_handler = logging.StreamHandler()
-  gc_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
-  LOGGER.addHandler(gc_handler)
+  """Set up a logger that will have its own logging level.
+
+  This may be called once per command run in the same process, so the
+  handler is only added the first time.
+  """
+  global _handler
+  if _handler is None:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    LOGGER.addHandler(_handler)
   LOGGER.propagate = False
 
   log_level_map = dict(
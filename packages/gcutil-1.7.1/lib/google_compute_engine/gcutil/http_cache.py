@@ -0,0 +1,152 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An in-memory cache of API responses for httplib2.
+
+httplib2 stores the responses to GET requests in its cache, and sends
+the ETag of a cached response in an If-None-Match header the next time the
+resource is requested.  The server then answers with 304 Not Modified,
+without the resource, if it has not changed.  The cache is shared by the
+Http objects of all threads of a command, and is kept in memory only, as
+its keys are the URIs requested without the credential they were
+requested with.
+"""
+
+from __future__ import with_statement
+
+
+
+import collections
+import threading
+
+import gflags as flags
+from gcutil import gcutil_logging
+
+FLAGS = flags.FLAGS
+LOGGER = gcutil_logging.LOGGER
+
+flags.DEFINE_bool(
+    'cache_api_responses',
+    False,
+    'If true, keep the responses to API GET requests in memory and '
+    'revalidate them with the server when they are requested again, '
+    'instead of fetching them again in full.')
+flags.DEFINE_integer(
+    'api_response_cache_size',
+    16,
+    'The maximum size in megabytes of the responses kept with '
+    '--cache_api_responses.',
+    1)
+
+# The response headers that let a cached response be revalidated.
+_VALIDATOR_HEADERS = ('\r\netag:', '\r\nlast-modified:')
+
+
+class MemoryCache(object):
+  """A thread-safe in-memory cache implementing the httplib2 cache interface.
+
+  Only responses carrying an ETag or Last-Modified header are kept, as
+  others cannot be revalidated.  Once the cached responses exceed the
+  maximum size, the least recently used ones are evicted.
+
+  Attributes:
+    hits: The number of requests for which a response was cached.
+    misses: The number of requests for which no response was cached.
+    evictions: The number of responses evicted to make room for others.
+  """
+
+  def __init__(self, max_size=None):
+    """Constructor.
+
+    Args:
+      max_size: The maximum total size in bytes of the cached responses
+          (default is FLAGS.api_response_cache_size megabytes).
+    """
+    if max_size is None:
+      max_size = FLAGS.api_response_cache_size * 1024 * 1024
+    self._max_size = max_size
+    self._size = 0
+    # Maps each key to a tuple of (use, value), where use counts the uses
+    # of all entries.  The uses are also appended to _uses as (use, key)
+    # tuples, oldest first, and a use is stale once its key has been used
+    # again, as collections.OrderedDict is not available in Python 2.6.
+    self._entries = {}
+    self._uses = collections.deque()
+    self._use_count = 0
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key):
+    """Returns the cached response for the key, or None."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      _, value = entry
+      self._Use(key, value)
+      self.hits += 1
+      return value
+
+  def set(self, key, value):
+    """Caches the response for the key, evicting others to make room."""
+    headers = value.split('\r\n\r\n', 1)[0].lower()
+    if (len(value) > self._max_size or
+        not any(header in headers for header in _VALIDATOR_HEADERS)):
+      self.delete(key)
+      return
+
+    with self._lock:
+      old_entry = self._entries.get(key)
+      if old_entry is not None:
+        self._size -= len(old_entry[1])
+      self._Use(key, value)
+      self._size += len(value)
+      while self._size > self._max_size:
+        use, evicted_key = self._uses.popleft()
+        entry = self._entries.get(evicted_key)
+        if entry is None or entry[0] != use:
+          continue
+        _, evicted = self._entries.pop(evicted_key)
+        self._size -= len(evicted)
+        self.evictions += 1
+
+  def delete(self, key):
+    """Removes the cached response for the key, if any."""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._size -= len(entry[1])
+
+  def _Use(self, key, value):
+    """Stores the value for the key as the most recently used entry.
+
+    The cache must be locked when this is called.
+    """
+    self._use_count += 1
+    self._entries[key] = (self._use_count, value)
+    self._uses.append((self._use_count, key))
+    if len(self._uses) > 2 * len(self._entries) + 16:
+      # Drops the stale uses, so that they do not accumulate.
+      self._uses = collections.deque(sorted(
+          (use, entry_key)
+          for entry_key, (use, _) in self._entries.iteritems()))
+
+  def LogStatistics(self):
+    """Logs how often requested responses were found in the cache."""
+    LOGGER.debug('API response cache: %d hits, %d misses, %d evictions, '
+                 '%d bytes cached.',
+                 self.hits, self.misses, self.evictions, self._size)
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the in-memory API response cache."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import httplib2
+
+import unittest
+
+from gcutil import http_cache
+
+
+def CachedResponse(body, etag='"1"'):
+  """Returns a response as httplib2 stores it in its cache."""
+  headers = 'status: 200\r\n'
+  if etag:
+    headers += 'etag: %s\r\n' % etag
+  return headers + '\r\n' + body
+
+
+class ConditionalHttp(httplib2.Http):
+  """An Http object answering requests for a resource with a given ETag."""
+
+  def __init__(self, cache, etag, body):
+    super(ConditionalHttp, self).__init__(cache=cache)
+    self.etag = etag
+    self.body = body
+    self.request_headers = []
+
+  def _conn_request(self, conn, request_uri, method, body, headers):
+    self.request_headers.append(dict(headers))
+    if headers.get('if-none-match') == self.etag:
+      return httplib2.Response({'status': '304', 'etag': self.etag}), ''
+    return httplib2.Response({'status': '200',
+                              'etag': self.etag,
+                              'cache-control': 'private, max-age=0',
+                              'content-type': 'application/json'}), self.body
+
+
+class MemoryCacheTest(unittest.TestCase):
+
+  def testLeastRecentlyUsedResponsesAreEvicted(self):
+    response = CachedResponse('x' * 10)
+    cache = http_cache.MemoryCache(max_size=len(response) * 2)
+    cache.set('a', response)
+    cache.set('b', response)
+    self.assertEqual(response, cache.get('a'))
+
+    cache.set('c', response)
+    self.assertEqual(None, cache.get('b'))
+    self.assertEqual(response, cache.get('a'))
+    self.assertEqual(response, cache.get('c'))
+    self.assertEqual((3, 1, 1), (cache.hits, cache.misses, cache.evictions))
+
+    cache.delete('a')
+    self.assertEqual(None, cache.get('a'))
+
+  def testDeletedAndRepeatedlyUsedResponsesAreEvictedInOrder(self):
+    response = CachedResponse('x' * 10)
+    cache = http_cache.MemoryCache(max_size=len(response) * 2)
+    cache.set('a', response)
+    cache.set('b', response)
+    cache.delete('a')
+    for _ in range(100):
+      self.assertEqual(response, cache.get('b'))
+    cache.set('c', response)
+    cache.set('d', response)
+    self.assertEqual(None, cache.get('b'))
+    self.assertEqual(response, cache.get('c'))
+    self.assertEqual(response, cache.get('d'))
+    self.assertEqual(1, cache.evictions)
+    self.assertTrue(len(cache._uses) < 100)
+
+  def testResponsesThatCannotBeRevalidatedAreNotCached(self):
+    cache = http_cache.MemoryCache(max_size=100)
+    cache.set('a', CachedResponse('body', etag=None))
+    cache.set('b', CachedResponse('x' * 100))
+    self.assertEqual(None, cache.get('a'))
+    self.assertEqual(None, cache.get('b'))
+
+  def testUnchangedResourcesAreRevalidated(self):
+    http = ConditionalHttp(http_cache.MemoryCache(), '"v1"', '{"name": "a"}')
+    uri = 'https://www.googleapis.com/compute/v1beta15/projects/p'
+
+    response, content = http.request(uri)
+    self.assertEqual('{"name": "a"}', content)
+    self.assertFalse(response.fromcache)
+
+    response, content = http.request(uri)
+    self.assertEqual('{"name": "a"}', content)
+    self.assertEqual(200, response.status)
+    self.assertTrue(response.fromcache)
+    self.assertEqual('"v1"', http.request_headers[-1]['if-none-match'])
+
+    # A changed resource is fetched in full.
+    http.etag = '"v2"'
+    http.body = '{"name": "b"}'
+    response, content = http.request(uri)
+    self.assertEqual('{"name": "b"}', content)
+    self.assertFalse(response.fromcache)
+
+
+if __name__ == '__main__':
+  unittest.main()
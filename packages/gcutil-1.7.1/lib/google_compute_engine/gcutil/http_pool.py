@@ -0,0 +1,74 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A per-thread pool of authorized HTTP objects.
+
+httplib2.Http objects are not thread-safe, so threads making API requests
+cannot share one.  Creating an Http object per request instead means a
+new connection, and TLS handshake, per request.  The pool keeps an Http
+object for each thread, so that the requests a thread makes reuse its
+kept-alive connections.  The Http objects are authorized with the same
+credential, whose Storage lock makes its threads refresh it in turn.
+"""
+
+from __future__ import with_statement
+
+
+
+import threading
+
+from gcutil import gcutil_logging
+
+LOGGER = gcutil_logging.LOGGER
+
+
+class HttpPool(object):
+  """A pool of authorized httplib2.Http objects, one for each thread.
+
+  Attributes:
+    created_count: The number of Http objects created.
+    reused_count: The number of times an Http object was reused.
+  """
+
+  def __init__(self, create_http):
+    """Constructor.
+
+    Args:
+      create_http: A function returning a new authorized httplib2.Http
+          object.
+    """
+    self._create_http = create_http
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self.created_count = 0
+    self.reused_count = 0
+
+  def GetHttp(self):
+    """Returns the Http object of the current thread, creating it if needed."""
+    http = getattr(self._local, 'http', None)
+    if http is None:
+      http = self._create_http()
+      self._local.http = http
+      with self._lock:
+        self.created_count += 1
+    else:
+      with self._lock:
+        self.reused_count += 1
+    return http
+
+  def LogStatistics(self):
+    """Logs how many Http objects were created and reused."""
+    LOGGER.debug('Created %d HTTP objects, reused them %d times.',
+                 self.created_count, self.reused_count)
+
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the HTTP object pool."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import threading
+
+import unittest
+
+from gcutil import http_pool
+
+
+class HttpPoolTest(unittest.TestCase):
+
+  def testEachThreadReusesItsOwnHttp(self):
+    pool = http_pool.HttpPool(object)
+
+    http = pool.GetHttp()
+    self.assertTrue(http is pool.GetHttp())
+
+    thread_https = []
+
+    def GetHttps():
+      thread_https.append(pool.GetHttp())
+      thread_https.append(pool.GetHttp())
+
+    thread = threading.Thread(target=GetHttps)
+    thread.start()
+    thread.join()
+
+    self.assertTrue(thread_https[0] is thread_https[1])
+    self.assertFalse(thread_https[0] is http)
+    self.assertEqual(2, pool.created_count)
+    self.assertEqual(2, pool.reused_count)
+
+
+if __name__ == '__main__':
+  unittest.main()
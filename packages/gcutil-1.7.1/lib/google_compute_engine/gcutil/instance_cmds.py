@@ -17,8 +17,13 @@
 
 
 
+from __future__ import with_statement
+
 import logging
 import os
+import subprocess
+import sys
+import threading
 import time
 
 from apiclient import errors
@@ -32,6 +37,8 @@ from gcutil import gcutil_logging
 from gcutil import metadata
 from gcutil import scopes
 from gcutil import ssh_keys
+from gcutil import thread_pool
+from gcutil import utils
 
 
 
@@ -590,59 +597,73 @@ class AddInstance(InstanceCommand):
     (results, exceptions) = self.ExecuteRequests(requests)
 
     if self._flags.wait_until_running:
-      instances_to_wait = results
-      results = []
-      for result in instances_to_wait:
-        if self.IsResultAnOperation(result):
-          results.append(result)
-        else:
-          instance_name = result['name']
-          kwargs = self._PrepareRequestArgs(instance_name)
-          get_request = self._instances_api.get(**kwargs)
-          instance_result = get_request.execute()
-          instance_result = self._WaitUntilInstanceIsRunning(
-              instance_result, kwargs)
-          results.append(instance_result)
+      results = self._WaitUntilInstancesAreRunning(time, results)
 
     if self._flags.synchronous_mode:
       return (self.MakeListResult(results, 'instanceList'), exceptions)
     else:
       return (self.MakeListResult(results, 'operationList'), exceptions)
 
-  def _WaitUntilInstanceIsRunning(self, result, kwargs):
-    """Waits for the instance to start.
+  def _WaitUntilInstancesAreRunning(self, timer, results):
+    """Waits for the instances among the given results to start.
 
-    Periodically polls the server for current instance status. Exits if the
-    status of the instance is RUNNING or TERMINATED or the maximum waiting
-    timeout has been reached. In both cases returns the last known instance
-    details.
+    The instances that have not started are polled together, in batch
+    requests where possible, until the status of each is RUNNING or
+    TERMINATED or the maximum waiting time has been reached.  An instance
+    is no longer polled once it has started, so the wait only lasts as
+    long as the slowest instance takes to start.
 
     Args:
-      result: the current state of the instance.
-      kwargs: keyword arguments to _instances_api.get()
+      timer: An implementation of the time object, providing time and sleep
+          methods.
+      results: The results of adding the instances: instance resources,
+          and operations for the instances that were not added.
 
     Returns:
-      Json containing full instance information.
+      The results, with the last known details of each instance in place
+      of its instance resource.
     """
-    current_status = result[self.status_field]
-    start_time = time.time()
-    instance_name = kwargs['instance']
-    LOGGER.info('Ensuring %s is running.  Will wait to start for: %d seconds.',
-                instance_name, self._flags.max_wait_time)
-    while (time.time() - start_time < self._flags.max_wait_time and
-           current_status not in self._TERMINAL_STATUS):
-      LOGGER.info(
-          'Waiting for instance \'%s\' to start. '
-          'Current status: %s. Sleeping for %ss.',
-          instance_name,
-          current_status, self._flags.sleep_between_polls)
-      time.sleep(self._flags.sleep_between_polls)
-      result = self._instances_api.get(**kwargs).execute()
-      current_status = result[self.status_field]
-    if current_status not in self._TERMINAL_STATUS:
-      LOGGER.warn('Timeout reached. Instance %s has not yet started.',
-                  instance_name)
-    return result
+    results = list(results)
+    pending = set(index for index, result in enumerate(results)
+                  if not self.IsResultAnOperation(result) and
+                  result[self.status_field] not in self._TERMINAL_STATUS)
+    if not pending:
+      return results
+
+    LOGGER.info('Ensuring %d instance(s) are running.  Will wait to start '
+                'for: %d seconds.', len(pending), self._flags.max_wait_time)
+    start_time = timer.time()
+    while pending:
+      elapsed = timer.time() - start_time
+      if elapsed >= self._flags.max_wait_time:
+        for index in sorted(pending):
+          LOGGER.warn('Timeout reached. Instance %s has not yet started.',
+                      results[index]['name'])
+        break
+
+      sleep_time = min(max(elapsed * command_base.POLL_BACKOFF_FACTOR,
+                           command_base.MIN_POLL_INTERVAL),
+                       self._flags.sleep_between_polls)
+      LOGGER.info('Waiting for %d instance(s) to start. Sleeping for %ss.',
+                  len(pending), sleep_time)
+      timer.sleep(sleep_time)
+
+      polled = self._ExecuteRequestsTogether(
+          [(index, self._instances_api.get(
+              **self._PrepareRequestArgs(results[index]['name'])))
+           for index in sorted(pending)])
+      for index, (raised_exception, result) in polled.iteritems():
+        if raised_exception:
+          LOGGER.warn('Could not get the status of instance %s: %s',
+                      results[index]['name'], result)
+          pending.discard(index)
+          continue
+        results[index] = result
+        if result[self.status_field] in self._TERMINAL_STATUS:
+          LOGGER.info('Instance %s is %s.', result['name'],
+                      result[self.status_field])
+          pending.discard(index)
+    return results
 
   def _FindDefaultZone(self, disks):
     """Given the persistent disks for an instance, find a default zone.
@@ -1004,8 +1025,38 @@ class DeleteAccessConfig(InstanceCommand):
     return delete_access_config_request.execute()
 
 
+class _SshChildOperation(thread_pool.Operation):
+  """Runs an ssh-based command line, prefixing its output with a name."""
+
+  def __init__(self, instance_name, command_line, output_lock):
+    super(_SshChildOperation, self).__init__()
+    self.instance_name = instance_name
+    self._command_line = command_line
+    self._output_lock = output_lock
+
+  def Run(self):
+    """Runs the command line, returning its exit code."""
+    with open(os.devnull) as stdin:
+      child = subprocess.Popen(self._command_line, stdin=stdin,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+      for line in iter(child.stdout.readline, ''):
+        if not line.endswith('\n'):
+          line += '\n'
+        with self._output_lock:
+          sys.stdout.write('%s: %s' % (self.instance_name, line))
+          sys.stdout.flush()
+      return child.wait()
+
+
 class SshInstanceBase(InstanceCommand):
-  """Base class for SSH-based commands."""
+  """Base class for SSH-based commands.
+
+  With --instances, the command runs on every matching instance at once
+  instead of on the instance given as the first argument.  The output of
+  each instance is prefixed with its name, and the exit code of each is
+  reported once all have completed.
+  """
 
   # We want everything after 'ssh <instance>' to be passed on to the
   # ssh command in question.  As such, all arguments to the utility
@@ -1031,6 +1082,20 @@ class SshInstanceBase(InstanceCommand):
         'Number of seconds to wait for updates to project-wide ssh keys '
         'to cascade to the instances within the project',
         flag_values=flag_values)
+    flags.DEFINE_list(
+        'instances',
+        [],
+        'Names, or regular expressions matching the names, of instances '
+        'to run the command on at once. The instance name is then not '
+        'given as the first argument.',
+        flag_values=flag_values)
+    flags.DEFINE_integer(
+        'max_concurrent_connections',
+        10,
+        'The maximum number of instances to connect to at once when '
+        '--instances is given.',
+        lower_bound=1,
+        flag_values=flag_values)
 
   def PrintResult(self, _):
     """Override the PrintResult to be a noop."""
@@ -1094,27 +1159,37 @@ class SshInstanceBase(InstanceCommand):
     Raises:
       command_base.CommandError: If the instance is not in the RUNNING state.
     """
+    self._CheckRunning(instance_resource)
+    if not self._HasSshKeys(instance_resource):
+      self._EnsureComputeKeyInProject()
+
+  def _CheckRunning(self, instance_resource):
+    """Raises a CommandError if the instance is not in the RUNNING state."""
     instance_status = instance_resource.get('status')
     if instance_status != 'RUNNING':
       raise command_base.CommandError(
           'Cannot connect to the instance since its current status is %s.'
           % instance_status)
 
+  def _HasSshKeys(self, instance_resource):
+    """Returns True if the instance has ssh keys of its own."""
     instance_metadata = instance_resource.get('metadata', {})
+    return any(entry.get('key') == 'sshKeys'
+               for entry in instance_metadata.get('items', []))
 
-    instance_ssh_key_entries = (
-        [entry for entry in instance_metadata.get(
-            'items', [])
-         if entry.get('key') == 'sshKeys'])
+  def _EnsureComputeKeyInProject(self):
+    """Adds the user's public ssh key to the project if it is not there.
 
-    if not instance_ssh_key_entries:
-      if self._AddComputeKeyToProject():
-        wait_time = self._flags.ssh_key_push_wait_time
-        LOGGER.info('Updated project with new ssh key. It can take several '
-                    'minutes for the instance to pick up the key.')
-        LOGGER.info('Waiting %s seconds before attempting to connect.',
-                    wait_time)
-        time.sleep(wait_time)
+    If the key is added, waits for --ssh_key_push_wait_time seconds for
+    the change to cascade down to the instances.
+    """
+    if self._AddComputeKeyToProject():
+      wait_time = self._flags.ssh_key_push_wait_time
+      LOGGER.info('Updated project with new ssh key. It can take several '
+                  'minutes for the instance to pick up the key.')
+      LOGGER.info('Waiting %s seconds before attempting to connect.',
+                  wait_time)
+      time.sleep(wait_time)
 
   def _BuildSshCmd(self, instance_resource, command, args):
     """Builds the given SSH-based command line with the given arguments.
@@ -1186,6 +1261,136 @@ class SshInstanceBase(InstanceCommand):
     except OSError as e:
       LOGGER.error('There was a problem executing the command: %s', e)
 
+  def _HandleSshCmd(self, command, generate_args, argv):
+    """Runs an ssh-based command on the instances named by the arguments.
+
+    Args:
+      command: the ssh-based command to run (e.g. ssh or scp)
+      generate_args: A function generating the arguments for the command
+        from the positional arguments that follow the instance name.
+      argv: The positional arguments: the instance name, unless
+        --instances is given, followed by the remaining arguments.
+
+    Returns:
+      None, or with --instances, a tuple of (exit codes, exceptions) as
+      returned by _RunSshCmdOnInstances.
+
+    Raises:
+      UsageError: If no instance is given.
+    """
+    if self._flags.instances:
+      return self._RunSshCmdOnInstances(
+          self._flags.instances, command, generate_args(*argv))
+    if not argv:
+      raise app.UsageError('You must specify an instance, or --instances.')
+    self._RunSshCmd(argv[0], command, generate_args(*argv[1:]))
+
+  def _ListInstances(self, instance_regexes):
+    """Lists the instances whose names match any of the given regexes.
+
+    Instances in all zones are listed together, unless --zone is given.
+
+    Args:
+      instance_regexes: A list of regular expressions.
+
+    Returns:
+      The list of matching instance resources.
+    """
+    name_filter = utils.RegexesToFilterExpression(instance_regexes)
+    if not self._IsUsingAtLeastApiVersion('v1beta14'):
+      return utils.All(self._instances_api.list, self._project,
+                       filter=name_filter)['items']
+
+    if self._flags.zone:
+      zones = [self.DenormalizeResourceName(self._flags.zone)]
+    else:
+      zones = self._GetZones()
+    instances = []
+    for result in self.ListInZones(
+        [(self._instances_api.list, zone) for zone in zones],
+        filter=name_filter):
+      instances.extend(result['items'])
+    return instances
+
+  def _RunSshCmdOnInstances(self, instance_regexes, command, args):
+    """Runs the given SSH-based command line on many instances at once.
+
+    The instances are listed together, and the user's ssh key is added to
+    the project once if any of them need it.  The command lines then run
+    in child processes, at most --max_concurrent_connections at once.
+    Each line of their output is prefixed with the name of its instance,
+    and the exit code of each instance is printed once all have completed.
+
+    Args:
+      instance_regexes: A list of names, or regular expressions matching
+        the names, of the instances to run the command on.
+      command: the ssh-based command to run (e.g. ssh or scp)
+      args: arguments for the command
+
+    Returns:
+      A tuple of (exit codes, exceptions), where exit codes maps the name
+      of each instance the command ran on to its exit code and exceptions
+      lists the instances that could not be connected to or whose command
+      failed.
+
+    Raises:
+      command_base.CommandError: If no instances match.
+    """
+    instances = sorted(self._ListInstances(instance_regexes),
+                       key=lambda instance: instance['name'])
+    if not instances:
+      raise command_base.CommandError('No matching instances were found.')
+
+    exceptions = []
+    command_lines = []
+    for instance in instances:
+      try:
+        self._CheckRunning(instance)
+        command_lines.append(
+            (instance, self._BuildSshCmd(instance, command, args)))
+      except command_base.CommandError as e:
+        exceptions.append(command_base.CommandError(
+            '%s: %s' % (instance['name'], e)))
+
+    if any(not self._HasSshKeys(instance) for instance, _ in command_lines):
+      try:
+        self._EnsureComputeKeyInProject()
+      except ssh_keys.UserSetupError as e:
+        LOGGER.warn('Could not generate compute ssh key: %s', e)
+        return ({}, exceptions)
+
+    output_lock = threading.Lock()
+    pool = thread_pool.ThreadPool(
+        min(self._flags.max_concurrent_connections, len(command_lines)) or 1)
+    operations = []
+    for instance, command_line in command_lines:
+      LOGGER.info('Running command line: %s', ' '.join(command_line))
+      operation = _SshChildOperation(instance['name'], command_line,
+                                     output_lock)
+      operations.append(operation)
+      pool.Add(operation)
+    pool.WaitShutdown()
+
+    exit_codes = {}
+    for operation in operations:
+      if operation.RaisedException():
+        exceptions.append(command_base.CommandError(
+            '%s: There was a problem executing the command: %s' % (
+                operation.instance_name, operation.Result())))
+        continue
+      exit_code = operation.Result()
+      exit_codes[operation.instance_name] = exit_code
+      if exit_code:
+        exceptions.append(command_base.CommandError(
+            '%s: %s exited with code %d.' % (
+                operation.instance_name, command, exit_code)))
+
+    if exit_codes:
+      print 'Exit codes:'
+      for instance_name in sorted(exit_codes):
+        print '  %s: %d' % (instance_name, exit_codes[instance_name])
+    return (exit_codes, exceptions)
+
 
 class SshToInstance(SshInstanceBase):
   """Ssh to an instance."""
@@ -1208,18 +1413,23 @@ class SshToInstance(SshInstanceBase):
 
     return ssh_args
 
-  def Handle(self, instance_name, *argv):
-    """SSH into the instance.
+  def Handle(self, *argv):
+    """SSH into the instance, or run a command on each of --instances.
 
     Args:
-      instance_name: The name of the instance to ssh to.
-      *argv: The remaining unhandled arguments.
+      *argv: The name of the instance to ssh to, unless --instances is
+        given, followed by the remaining unhandled arguments.
 
     Returns:
       The result of the ssh command
+
+    Raises:
+      UsageError: If --instances is given without a command to run.
     """
-    ssh_args = self._GenerateSshArgs(*argv)
-    self._RunSshCmd(instance_name, 'ssh', ssh_args)
+    if self._flags.instances and not argv:
+      raise app.UsageError(
+          'You must specify a command to run with --instances.')
+    return self._HandleSshCmd('ssh', self._GenerateSshArgs, argv)
 
 
 class PushToInstance(SshInstanceBase):
@@ -1251,22 +1461,21 @@ class PushToInstance(SshInstanceBase):
 
     return scp_args
 
-  def Handle(self, instance_name, *argv):
-    """Pushes one or more files into the instance.
+  def Handle(self, *argv):
+    """Pushes one or more files into the instance, or each of --instances.
 
     Args:
-      instance_name: The name of the instance to push files to.
-      *argv: The remaining unhandled arguments.
+      *argv: The name of the instance to push files to, unless --instances
+        is given, followed by the remaining unhandled arguments.
 
     Returns:
       The result of the scp command
 
     Raises:
       command_base.CommandError: If an invalid number of arguments are passed
-        in.
+          in.
     """
-    scp_args = self._GenerateScpArgs(*argv)
-    self._RunSshCmd(instance_name, 'scp', scp_args)
+    return self._HandleSshCmd('scp', self._GenerateScpArgs, argv)
 
 
 class PullFromInstance(SshInstanceBase):
@@ -1299,12 +1508,47 @@ class PullFromInstance(SshInstanceBase):
 
     return scp_args
 
-  def Handle(self, instance_name, *argv):
-    """Pulls one or more files from the instance.
+  def _BuildSshCmd(self, instance_resource, command, args):
+    """Builds the scp command line pulling files from the given instance.
+
+    With --instances, the files of each instance are pulled into a
+    directory named after it within the destination, so that instances
+    pulling files of the same name do not overwrite each other's.  The
+    directory is created if it does not exist.
+
+    Args:
+      instance_resource: The resource data of the instance to pull from.
+      command: the ssh-based command to run (e.g. ssh or scp)
+      args: arguments for the command, ending with the destination.
+
+    Returns:
+      The command line used to pull the files.
+
+    Raises:
+      command_base.CommandError: If the directory could not be created.
+    """
+    if self._flags.instances:
+      instance_name = instance_resource['name']
+      destination = os.path.join(args[-1] % {}, instance_name)
+      try:
+        if not os.path.isdir(destination):
+          os.makedirs(destination)
+      except OSError as e:
+        raise command_base.CommandError(
+            'Could not create the directory %s: %s' % (destination, e))
+      args = list(args[:-1]) + [os.path.join(args[-1], instance_name, '')]
+    return super(PullFromInstance, self)._BuildSshCmd(
+        instance_resource, command, args)
+
+  def Handle(self, *argv):
+    """Pulls one or more files from the instance, or each of --instances.
+
+    With --instances, the files of each instance are pulled into
+    <destination>/<instance-name>/.
 
     Args:
-      instance_name: The name of the instance to pull files from.
-      *argv: The remaining unhandled arguments.
+      *argv: The name of the instance to pull files from, unless
+        --instances is given, followed by the remaining unhandled arguments.
 
     Returns:
       The result of the scp command
@@ -1313,8 +1557,7 @@ class PullFromInstance(SshInstanceBase):
       command_base.CommandError: If an invalid number of arguments are passed
           in.
     """
-    scp_args = self._GenerateScpArgs(*argv)
-    self._RunSshCmd(instance_name, 'scp', scp_args)
+    return self._HandleSshCmd('scp', self._GenerateScpArgs, argv)
 
 
 class GetSerialPortOutput(InstanceCommand):
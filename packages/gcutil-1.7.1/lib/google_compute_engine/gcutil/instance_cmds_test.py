@@ -26,6 +26,9 @@ path_initializer.InitializeSysPath()
 import base64
 import copy
 import logging
+import os
+import shutil
+import StringIO
 import sys
 import tempfile
 
@@ -1320,6 +1323,63 @@ class InstanceCmdsTest(unittest.TestCase):
     self.assertEqual(instance_tags, expected_tags)
     self.assertEqual(exceptions, [])
 
+  def testWaitUntilInstancesAreRunning(self):
+
+    class MockTimer(object):
+
+      def __init__(self):
+        self.sleeps = []
+
+      def time(self):
+        return sum(self.sleeps)
+
+      def sleep(self, time_to_sleep):
+        self.sleeps.append(time_to_sleep)
+
+    # The statuses each instance goes through, one per poll.
+    statuses = {'starting': ['STAGING', 'RUNNING'],
+                'stuck': ['STAGING'] * 100}
+    polls = []
+
+    def MockGet(instance=None, **unused_kwargs):
+      polls.append(instance)
+      return mock_api.MockRequest(
+          {'name': instance, 'status': statuses[instance].pop(0)})
+
+    flag_values = copy.deepcopy(FLAGS)
+    command = instance_cmds.AddInstance('addinstance', flag_values)
+    flag_values.project = 'test_project'
+    flag_values.zone = 'zone-a'
+    flag_values.max_wait_time = 30
+    flag_values.sleep_between_polls = 5
+    command.SetFlags(flag_values)
+    self._instances.get = MockGet
+    command._instances_api = self._instances
+
+    operation = {'kind': 'compute#operation', 'name': 'failed-operation'}
+    timer = MockTimer()
+    results = command._WaitUntilInstancesAreRunning(
+        timer,
+        [{'name': 'running', 'status': 'RUNNING'},
+         {'name': 'starting', 'status': 'PROVISIONING'},
+         operation,
+         {'name': 'stuck', 'status': 'PROVISIONING'}])
+
+    self.assertEqual(
+        [{'name': 'running', 'status': 'RUNNING'},
+         {'name': 'starting', 'status': 'RUNNING'},
+         operation,
+         {'name': 'stuck', 'status': 'STAGING'}],
+        results)
+    # Instances are polled together, and only until they have started.
+    self.assertEqual(['starting', 'stuck', 'starting', 'stuck'], polls[:4])
+    self.assertFalse('starting' in polls[4:])
+    self.assertFalse('running' in polls)
+    # Polls back off up to --sleep_between_polls until --max_wait_time.
+    self.assertEqual([1, 1, 1, 1.5, 2.25], timer.sleeps[:5])
+    self.assertEqual(5, max(timer.sleeps))
+    self.assertTrue(30 <= timer.time() < 35)
+
   def testGetInstanceGeneratesCorrectRequest(self):
     flag_values = copy.deepcopy(FLAGS)
     command = instance_cmds.GetInstance('getinstance', flag_values)
@@ -1684,6 +1744,99 @@ class InstanceCmdsTest(unittest.TestCase):
                       command._EnsureSshable,
                       mock_instance)
 
+  def _MakeFanOutCommand(self, instances):
+    """Returns an ssh command running on the given instances at once."""
+    flag_values = copy.deepcopy(FLAGS)
+    command = instance_cmds.SshToInstance('ssh', flag_values)
+    flag_values.instances = ['instance-.*']
+    flag_values.max_concurrent_connections = 2
+    flag_values.ssh_key_push_wait_time = 0
+    command.SetFlags(flag_values)
+    command._ListInstances = lambda regexes: instances
+    return command
+
+  def _MakeFanOutInstance(self, name, status='RUNNING', ssh_keys=True):
+    items = []
+    if ssh_keys:
+      items.append({'key': 'sshKeys', 'value': ''})
+    return {'name': name,
+            'status': status,
+            'networkInterfaces': [{'accessConfigs': [
+                {'type': 'ONE_TO_ONE_NAT', 'natIP': '0.0.0.0'}]}],
+            'metadata': {'items': items}}
+
+  def testSshRunsOnManyInstancesAtOnce(self):
+    command = self._MakeFanOutCommand([
+        self._MakeFanOutInstance('instance-a'),
+        self._MakeFanOutInstance('instance-b'),
+        self._MakeFanOutInstance('instance-c', status='TERMINATED')])
+    command._AddComputeKeyToProject = (
+        lambda: self.fail('Unexpected call to _AddComputeKeyToProject'))
+    exit_codes = {'instance-a': 0, 'instance-b': 3}
+    command._BuildSshCmd = lambda instance, unused_command, args: [
+        'sh', '-c', 'echo %s; printf done; exit %d' % (
+            ' '.join(args[-1:]), exit_codes[instance['name']])]
+
+    old_stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+      result, exceptions = command.Handle('uptime')
+      output = sys.stdout.getvalue()
+    finally:
+      sys.stdout = old_stdout
+
+    self.assertEqual(exit_codes, result)
+    # The lines of the instances may interleave.
+    for name in exit_codes:
+      self.assertTrue('%s: uptime\n' % name in output)
+      self.assertTrue('%s: done\n' % name in output)
+    self.assertTrue(
+        output.endswith('Exit codes:\n  instance-a: 0\n  instance-b: 3\n'))
+    self.assertEqual(2, len(exceptions))
+    self.assertTrue('instance-c' in str(exceptions[0]))
+    self.assertTrue('instance-b' in str(exceptions[1]))
+
+  def testSshOnManyInstancesAddsTheProjectKeyOnce(self):
+    command = self._MakeFanOutCommand([
+        self._MakeFanOutInstance('instance-a', ssh_keys=False),
+        self._MakeFanOutInstance('instance-b', ssh_keys=False)])
+    calls = []
+    command._AddComputeKeyToProject = lambda: calls.append(1) or True
+    command._BuildSshCmd = lambda *unused_args: ['true']
+
+    result, exceptions = command.Handle('uptime')
+    self.assertEqual({'instance-a': 0, 'instance-b': 0}, result)
+    self.assertEqual([], exceptions)
+    self.assertEqual(1, len(calls))
+
+  def testScpPullFromManyInstancesPullsIntoADirectoryPerInstance(self):
+    flag_values = copy.deepcopy(FLAGS)
+    command = instance_cmds.PullFromInstance('pull', flag_values)
+    flag_values.instances = ['instance-.*']
+    command.SetFlags(flag_values)
+    temp_dir = tempfile.mkdtemp()
+    try:
+      destination = os.path.join(temp_dir, '%dest')
+      args = command._GenerateScpArgs('file1', destination)
+      for name in ('instance-a', 'instance-b'):
+        command_line = command._BuildSshCmd(
+            self._MakeFanOutInstance(name), 'scp', args)
+        self.assertEqual(os.path.join(destination, name, ''),
+                         command_line[-1])
+        self.assertTrue(os.path.isdir(os.path.join(destination, name)))
+    finally:
+      shutil.rmtree(temp_dir)
+
+  def testSshRequiresAnInstanceOrACommandForInstances(self):
+    flag_values = copy.deepcopy(FLAGS)
+    command = instance_cmds.SshToInstance('ssh', flag_values)
+    command.SetFlags(flag_values)
+    self.assertRaises(app.UsageError, command.Handle)
+
+    command = self._MakeFanOutCommand([])
+    self.assertRaises(app.UsageError, command.Handle)
+    self.assertRaises(command_base.CommandError, command.Handle, 'uptime')
+
   def testSshGeneratesCorrectArguments(self):
     flag_values = copy.deepcopy(FLAGS)
     command = instance_cmds.SshToInstance('ssh', flag_values)
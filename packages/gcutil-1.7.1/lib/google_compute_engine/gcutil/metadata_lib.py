@@ -7,10 +7,27 @@
 
 
 
+from __future__ import with_statement
+
 import datetime
 import json
+import threading
+import time
 import urllib2
 
+# Access tokens are renewed this many seconds before they expire, so that
+# a token is not sent just as it expires.
+TOKEN_RENEWAL_MARGIN_SEC = 60
+
+# How long values that do not change while the VM runs are cached.
+STATIC_VALUE_TTL_SEC = 60 * 60
+
+# How long values that can change while the VM runs are cached.
+DYNAMIC_VALUE_TTL_SEC = 5
+
+# How often WaitForAttributeChange polls the attribute.
+ATTRIBUTE_POLL_INTERVAL_SEC = 1
+
 
 class MetadataError(Exception):
   """Base class for metadata errors."""
@@ -28,17 +45,59 @@ class MetadataNotFoundError(MetadataError):
 
 
 class Metadata(object):
-  """Client API for the metadata server."""
+  """Client API for the metadata server.
+
+  Access tokens are cached until shortly before they expire, and the
+  values returned by the Get* methods other than GetValue, GetJSONValue
+  and GetAttribute are cached for STATIC_VALUE_TTL_SEC or
+  DYNAMIC_VALUE_TTL_SEC.  The caches are safe to share between threads.
+  """
 
   DEFAULT_METADATA_URL = 'http://metadata.google.internal/0.1/meta-data'
 
-  def __init__(self, server_address=DEFAULT_METADATA_URL):
+  def __init__(self, server_address=DEFAULT_METADATA_URL, timer=time):
     """Construct a Metadata client.
 
     Args:
       server_address: The address of the metadata server.
+      timer: An implementation of the time object, providing time and sleep
+          methods.
     """
     self._server_address = server_address
+    self._timer = timer
+    self._token_lock = threading.Lock()
+    self._tokens = {}
+    self._values_lock = threading.Lock()
+    self._values = {}
+
+  def ClearCache(self):
+    """Drops all of the cached access tokens and values."""
+    with self._token_lock:
+      self._tokens.clear()
+    with self._values_lock:
+      self._values.clear()
+
+  def _GetCachedValue(self, path, ttl_sec, get_value):
+    """Returns the cached value of path, getting it if it has expired.
+
+    Args:
+      path: The path of the value, which it is cached under.
+      ttl_sec: How many seconds a value that is got is cached for.
+      get_value: A function returning the value from the metadata server.
+
+    Returns:
+      The value.
+    """
+    now = self._timer.time()
+    with self._values_lock:
+      entry = self._values.get(path)
+    if entry is not None and now < entry[1]:
+      return entry[0]
+
+    value = get_value()
+    with self._values_lock:
+      self._values[path] = (value, now + ttl_sec)
+    return value
 
   def IsPresent(self):
     """Return whether the metadata server is ready and available."""
@@ -62,6 +121,37 @@ class Metadata(object):
     """
     return self.GetValue('attributes/%s' % (path), **kwargs)
 
+  def WaitForAttributeChange(self, path, last_value, timeout=None,
+                             poll_interval=ATTRIBUTE_POLL_INTERVAL_SEC):
+    """Wait until the value of an attribute differs from the given one.
+
+    Args:
+      path: A subpath under attributes/ on the metadata server.
+      last_value: The last known value, or None if the attribute was not
+          present.
+      timeout: The maximum number of seconds to wait, or None to wait until
+          the value changes.
+      poll_interval: The number of seconds between reads of the attribute.
+
+    Returns:
+      The new value, or None if the attribute has been removed.
+
+    Raises:
+      MetadataError on failure, or if the value does not change in time.
+    """
+    start_time = self._timer.time()
+    while True:
+      try:
+        value = self.GetAttribute(path)
+      except MetadataNotFoundError:
+        value = None
+      if value != last_value:
+        return value
+      if timeout is not None and self._timer.time() - start_time >= timeout:
+        raise MetadataError(
+            'Attribute %s did not change within %s seconds.' % (path, timeout))
+      self._timer.sleep(poll_interval)
+
   def GetValue(self, path, **kwargs):
     """Return a string value from the metadata server.
 
@@ -80,6 +170,12 @@ class Metadata(object):
     req = urllib2.Request(url)
     try:
       return self._DoHttpRequestRead(req, **kwargs)
+    # HTTPError is a subclass of URLError, so it is handled first.
+    except urllib2.HTTPError as e:
+      if e.code == 404:
+        raise MetadataNotFoundError('Metadata not found: %s' % (path))
+      raise MetadataError(
+          'Failed to get value %s: %s %s' % (path, e.code, e.reason))
     except urllib2.URLError as e:
       try:
         if e.reason.errno == 111:
@@ -90,11 +186,6 @@ class Metadata(object):
         pass
 
       raise MetadataError('URLError %s: %s' % (url, e))
-    except urllib2.HTTPError as e:
-      if e.code == 404:
-        raise MetadataNotFoundError('Metadata not found: %s' % (path))
-      raise MetadataError(
-          'Failed to get value %s: %s %s' % (path, e.code, e.reason))
 
   def GetJSONValue(self, path, **kwargs):
     """Return a decoded JSON value from the metadata server.
@@ -137,13 +228,19 @@ class Metadata(object):
     return list(scope_set)
 
   def GetAccessToken(self, scopes, service_account='default',
-                     any_available=False):
+                     any_available=False, use_cache=True):
     """Get an access token.
 
+    Tokens are cached until TOKEN_RENEWAL_MARGIN_SEC before they expire.
+    A token is acquired under a lock, so threads needing a token at the
+    same time wait for a single request instead of each making one.
+
     Args:
       scopes: The set of scopes desired in the access token.
       service_account: The service account to use.
       any_available: Allow only a subset of scopes to be in access token.
+      use_cache: If False, a new token is acquired even if a cached one
+          has not expired, e.g. because it was rejected.
 
     Returns:
       (access-token, expiry-time). Expiry time is a datetime that may be None.
@@ -152,6 +249,32 @@ class Metadata(object):
       MetadataError on failure.
       MetadataNotFoundError if the token is not present.
     """
+    key = (service_account, tuple(sorted(scopes)), any_available)
+    with self._token_lock:
+      if use_cache:
+        token = self._tokens.get(key)
+        if token is not None and not self._IsTokenExpiring(token[1]):
+          return token
+
+      token = self._AcquireAccessToken(scopes, service_account, any_available)
+      # Tokens without an expiry time cannot be renewed in time.
+      if token[1] is None:
+        self._tokens.pop(key, None)
+      else:
+        self._tokens[key] = token
+      return token
+
+  def _IsTokenExpiring(self, expires_at):
+    """Returns True if a token expiring at the given time should be renewed."""
+    now = datetime.datetime.utcfromtimestamp(self._timer.time())
+    return (expires_at - datetime.timedelta(seconds=TOKEN_RENEWAL_MARGIN_SEC)
+            <= now)
+
+  def _AcquireAccessToken(self, scopes, service_account, any_available):
+    """Acquires a new access token from the metadata server.
+
+    See GetAccessToken for the arguments and the return value.
+    """
     if any_available:
       scopes = self.GetAccessScopes(service_account=service_account,
                                     restrict_scopes=scopes)
@@ -182,8 +305,8 @@ class Metadata(object):
         if expires_in > 1000000000:
           expires_at = datetime.datetime.utcfromtimestamp(expires_in)
         else:
-          expires_at = (datetime.datetime.utcnow() +
-                        datetime.timedelta(seconds=expires_in))
+          expires_at = (datetime.datetime.utcfromtimestamp(self._timer.time())
+                        + datetime.timedelta(seconds=expires_in))
 
     return (token_info['accessToken'], expires_at)
 
@@ -218,7 +341,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    keys = self.GetValue('attributes/sshKeys', **kwargs)
+    keys = self._GetCachedValue(
+        'attributes/sshKeys', DYNAMIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('attributes/sshKeys', **kwargs))
     keyof = lambda line: line.split(':', 1)[0]
     return dict(map(lambda line: (keyof(line), line), keys.splitlines()))
 
@@ -231,7 +356,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    data = self.GetJSONValue('attached-disks', **kwargs)
+    data = self._GetCachedValue(
+        'attached-disks', DYNAMIC_VALUE_TTL_SEC,
+        lambda: self.GetJSONValue('attached-disks', **kwargs))
     if 'disks' not in data:
       raise MetadataError('No disks in attached-disks')
     return data['disks']
@@ -245,7 +372,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('instance-id', **kwargs)
+    return self._GetCachedValue(
+        'instance-id', STATIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('instance-id', **kwargs))
 
   def GetNumericProjectId(self, **kwargs):
     """Return the numeric project ID for this VM.
@@ -259,7 +388,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('numeric-project-id', **kwargs)
+    return self._GetCachedValue(
+        'numeric-project-id', STATIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('numeric-project-id', **kwargs))
 
   def GetProjectId(self, **kwargs):
     """Return the unique name of the project for this VM.
@@ -270,7 +401,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('project-id', **kwargs)
+    return self._GetCachedValue(
+        'project-id', STATIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('project-id', **kwargs))
 
   def GetHostname(self, **kwargs):
     """Get the hostname of the VM.
@@ -281,7 +414,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('hostname', **kwargs)
+    return self._GetCachedValue(
+        'hostname', STATIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('hostname', **kwargs))
 
   def GetTags(self, **kwargs):
     """Return the list of tags for the VM.
@@ -292,7 +427,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetJSONValue('tags', **kwargs)
+    return self._GetCachedValue(
+        'tags', DYNAMIC_VALUE_TTL_SEC,
+        lambda: self.GetJSONValue('tags', **kwargs))
 
   def GetZone(self, **kwargs):
     """Return the zone of the VM.
@@ -303,7 +440,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('zone', **kwargs)
+    return self._GetCachedValue(
+        'zone', STATIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('zone', **kwargs))
 
   def GetImage(self, **kwargs):
     """Return the name of this VM's disk image.
@@ -314,7 +453,8 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('image')
+    return self._GetCachedValue(
+        'image', STATIC_VALUE_TTL_SEC, lambda: self.GetValue('image'))
 
   def GetMachineType(self, **kwargs):
     """Return the name of this VM's machine type.
@@ -325,7 +465,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('machine-type', **kwargs)
+    return self._GetCachedValue(
+        'machine-type', STATIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('machine-type', **kwargs))
 
   def GetDescription(self, **kwargs):
     """Return the description associated with this VM.
@@ -336,7 +478,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetValue('description', **kwargs)
+    return self._GetCachedValue(
+        'description', DYNAMIC_VALUE_TTL_SEC,
+        lambda: self.GetValue('description', **kwargs))
 
   def GetNetwork(self, **kwargs):
     """Return the network configuration for this VM.
@@ -347,7 +491,9 @@ class Metadata(object):
     Raises:
       MetadataError on failure.
     """
-    return self.GetJSONValue('network', **kwargs)
+    return self._GetCachedValue(
+        'network', DYNAMIC_VALUE_TTL_SEC,
+        lambda: self.GetJSONValue('network', **kwargs))
 
   def _DoHttpRequestRead(self, request, timeout=None):
     """Open and return contents of an http request."""
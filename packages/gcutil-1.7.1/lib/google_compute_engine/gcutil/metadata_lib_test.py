@@ -0,0 +1,155 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the metadata server client."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import json
+import threading
+import time
+import urllib2
+
+import unittest
+
+from gcutil import metadata_lib
+
+
+class MockTimer(object):
+
+  def __init__(self):
+    self.now = 1000000.0
+
+  def time(self):
+    return self.now
+
+  def sleep(self, time_to_sleep):
+    self.now += time_to_sleep
+
+
+class MockMetadata(metadata_lib.Metadata):
+  """A metadata client answering requests from a dict of paths to values."""
+
+  def __init__(self, values, timer=None):
+    super(MockMetadata, self).__init__(server_address='', timer=timer or time)
+    self.values = values
+    self.requests = []
+
+  def _DoHttpRequestRead(self, request, timeout=None):
+    path = request.get_full_url()[1:]
+    self.requests.append(path)
+    value = self.values.get(path)
+    if value is None:
+      raise urllib2.HTTPError(path, 404, 'Not Found', {}, None)
+    if callable(value):
+      return value()
+    return value
+
+
+class MetadataTest(unittest.TestCase):
+
+  TOKEN_PATH = 'service-accounts/default/acquire?scopes=scope1%20scope2'
+
+  def testAccessTokensAreCachedUntilTheyNearExpiry(self):
+    timer = MockTimer()
+    tokens = iter(['token1', 'token2', 'token3'])
+    metadata = MockMetadata(
+        {self.TOKEN_PATH: lambda: json.dumps(
+            {'accessToken': tokens.next(), 'expiresIn': 3600})},
+        timer=timer)
+
+    self.assertEqual('token1',
+                     metadata.GetAccessToken(['scope1', 'scope2'])[0])
+    timer.sleep(3600 - metadata_lib.TOKEN_RENEWAL_MARGIN_SEC - 1)
+    self.assertEqual('token1',
+                     metadata.GetAccessToken(['scope2', 'scope1'])[0])
+    self.assertEqual(1, len(metadata.requests))
+
+    # The token is renewed ahead of its expiry.
+    timer.sleep(1)
+    self.assertEqual('token2',
+                     metadata.GetAccessToken(['scope1', 'scope2'])[0])
+    self.assertEqual(
+        'token3',
+        metadata.GetAccessToken(['scope1', 'scope2'], use_cache=False)[0])
+    self.assertEqual(3, len(metadata.requests))
+
+  def testAccessTokensAreAcquiredOnceForConcurrentRequests(self):
+
+    def AcquireSlowly():
+      time.sleep(0.1)
+      return json.dumps({'accessToken': 'token', 'expiresIn': 3600})
+
+    metadata = MockMetadata({self.TOKEN_PATH: AcquireSlowly})
+    threads = [
+        threading.Thread(
+            target=lambda: metadata.GetAccessToken(['scope1', 'scope2']))
+        for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual([self.TOKEN_PATH], metadata.requests)
+
+  def testValuesAreCachedForTheirTtl(self):
+    timer = MockTimer()
+    metadata = MockMetadata(
+        {'zone': 'my-zone', 'tags': '["tag"]', 'attributes/key': 'value'},
+        timer=timer)
+
+    for _ in range(3):
+      self.assertEqual('my-zone', metadata.GetZone())
+      self.assertEqual(['tag'], metadata.GetTags())
+      self.assertEqual('value', metadata.GetAttribute('key'))
+    # Attributes are not cached.
+    self.assertEqual(['zone', 'tags'] + ['attributes/key'] * 3,
+                     metadata.requests)
+
+    del metadata.requests[:]
+    timer.sleep(metadata_lib.DYNAMIC_VALUE_TTL_SEC)
+    metadata.GetZone()
+    metadata.GetTags()
+    self.assertEqual(['tags'], metadata.requests)
+
+    metadata.ClearCache()
+    metadata.GetZone()
+    self.assertEqual(['tags', 'zone'], metadata.requests)
+
+  def testWaitForAttributeChange(self):
+    timer = MockTimer()
+    values = iter(['old', 'old', 'new'])
+    metadata = MockMetadata({'attributes/key': lambda: values.next()},
+                            timer=timer)
+    self.assertEqual('new', metadata.WaitForAttributeChange('key', 'old'))
+    self.assertEqual(3, len(metadata.requests))
+
+    # An attribute that is not present reads as None.
+    self.assertEqual(None, metadata.WaitForAttributeChange('other', 'old'))
+
+  def testWaitForAttributeChangeTimesOut(self):
+    timer = MockTimer()
+    metadata = MockMetadata({'attributes/key': 'old'}, timer=timer)
+    self.assertRaises(metadata_lib.MetadataError,
+                      metadata.WaitForAttributeChange, 'key', 'old',
+                      timeout=3)
+    self.assertEqual(4, len(metadata.requests))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -40,11 +40,12 @@ class MockMetadata(object):
     return self._is_present_return_values.pop(0)
 
   def GetAccessToken(self, scopes, service_account='default',
-                     any_available=True):
+                     any_available=True, use_cache=True):
     self._get_access_token_calls.append(
         {'scopes': ' '.join(scopes),
          'service_account': service_account,
-         'any_available': any_available})
+         'any_available': any_available,
+         'use_cache': use_cache})
     return self._get_access_token_return_values.pop(0)
 
   def GetAccessScopes(self, service_account='default'):
@@ -39,6 +39,76 @@ LOGGER = gcutil_logging.LOGGER
 MAX_INSTANCES_TO_MOVE = 100
 MAX_DISKS_TO_MOVE = 100
 
+# The stages a disk goes through as it is moved, in order.
+DISK_PENDING = 'PENDING'
+DISK_SNAPSHOTTED = 'SNAPSHOTTED'
+DISK_SNAPSHOT_READY = 'SNAPSHOT_READY'
+DISK_DELETED = 'DELETED'
+DISK_CREATED = 'CREATED'
+DISK_STAGES = (DISK_PENDING, DISK_SNAPSHOTTED, DISK_SNAPSHOT_READY,
+               DISK_DELETED, DISK_CREATED)
+
+
+class _DiskMove(object):
+  """The progress of a disk being moved.
+
+  Attributes:
+    name: The name of the disk.
+    snapshot: The name of the snapshot the disk is moved through.
+    stage: The last of DISK_STAGES the disk has reached.
+    operation: The operation of the step in progress, if it has not
+        completed yet.
+    failed: True if a step of the move failed.
+  """
+
+  def __init__(self, name, snapshot, stage=DISK_PENDING):
+    self.name = name
+    self.snapshot = snapshot
+    self.stage = stage
+    self.operation = None
+    self.failed = False
+
+  def IsPolling(self):
+    """Returns True if the disk is waiting for its current step."""
+    return bool(self.operation) or self.stage == DISK_SNAPSHOTTED
+
+  def Advance(self):
+    """Moves the disk on to its next stage."""
+    self.stage = DISK_STAGES[DISK_STAGES.index(self.stage) + 1]
+
+  def Describe(self):
+    return 'Disk %s is %s' % (self.name, self.stage)
+
+
+class _InstanceMove(object):
+  """The progress of an instance being recreated in the destination zone.
+
+  Attributes:
+    instance: The instance resource to create.
+    disk_names: The names of the persistent disks of the instance.
+    operation: The operation creating the instance, if it has not completed
+        yet.
+    done: True once the instance has been created.
+    failed: True if the instance could not be created.
+  """
+
+  def __init__(self, instance, disk_names):
+    self.instance = instance
+    self.disk_names = disk_names
+    self.operation = None
+    self.done = False
+    self.failed = False
+
+  def IsPolling(self):
+    """Returns True if the instance is waiting for its creation."""
+    return bool(self.operation)
+
+  def Advance(self):
+    self.done = True
+
+  def Describe(self):
+    return 'Instance %s' % self.instance['name']
+
 
 class MoveInstancesBase(command_base.GoogleComputeCommand):
   """The base class for the move commands."""
@@ -150,8 +220,8 @@ class MoveInstancesBase(command_base.GoogleComputeCommand):
           utils.ListStrings(exceptions))
     self._CheckForErrorsInOps(self.MakeListResult(results, 'operationList'))
 
-  def _CreateInstances(self, instances, src_zone, dest_zone):
-    """Creates the instance resources in the given list in dest_zone.
+  def _PrepareInstances(self, instances, src_zone, dest_zone):
+    """Prepares the given instance resources for creation in dest_zone.
 
     The instance resources are changed in two ways:
       (1) Their zone fields are changed to dest_zone; and
@@ -161,18 +231,10 @@ class MoveInstancesBase(command_base.GoogleComputeCommand):
       instances: A list of instance resources.
       src_zone: The zone to which the instances belong.
       dest_zone: The destination zone.
-
-    Raises:
-      CommandError: If one or more of the insertions fail.
     """
-    if not instances:
-      return
-
-    print 'Recreating instances in %s...' % dest_zone
     ip_addresses = set(self._project_resource.get('externalIpAddresses', []))
     self._SetIps(instances, ip_addresses)
 
-    requests = []
     for instance in instances:
       instance['zone'] = self.NormalizeTopLevelResourceName(
           self._project, 'zones', dest_zone)
@@ -183,29 +245,24 @@ class MoveInstancesBase(command_base.GoogleComputeCommand):
           disk['source'] = disk['source'].replace(
               'zones/' + src_zone, 'zones/' + dest_zone)
 
-      requests.append(self._instances_api.insert(
-          project=self._project, body=instance, zone=dest_zone))
-    results, exceptions = self.ExecuteRequests(
-        requests, collection_name='instances')
-    if exceptions:
-      raise command_base.CommandError(
-          'Aborting due to errors while creating instances:\n%s' %
-          utils.ListStrings(exceptions))
-    self._CheckForErrorsInOps(self.MakeListResult(results, 'operationList'))
-
   def _CheckForErrorsInOps(self, results):
     """Raises CommandError if any operations in results contains an error."""
     _, ops = self._PartitionResults(results)
     errors = []
     for op in (ops or []):
-      if 'error' in op and 'errors' in op['error'] and op['error']['errors']:
-        error = op['error']['errors'][0].get('message')
-        if error:
-          errors.append(error)
+      error = self._GetOperationError(op)
+      if error:
+        errors.append(error)
     if errors:
       raise command_base.CommandError(
           'Encountered errors:\n%s' % utils.ListStrings(errors))
 
+  def _GetOperationError(self, op):
+    """Returns the message of the first error in op, or None if it has none."""
+    if 'error' in op and 'errors' in op['error'] and op['error']['errors']:
+      return op['error']['errors'][0].get('message')
+    return None
+
   def _SetIps(self, instances, ip_addresses):
     """Clears the natIP field for instances without reserved addresses."""
     for instance in instances:
@@ -214,57 +271,162 @@ class MoveInstancesBase(command_base.GoogleComputeCommand):
           if 'natIP' in config and config['natIP'] not in ip_addresses:
             config['natIP'] = None
 
-  def _WaitForSnapshots(self, snapshots):
-    """Waits for the given snapshots to be in the READY state."""
-    snapshots = set(snapshots)
-    start_sec = time.time()
-    while True:
-      if time.time() - start_sec > self._flags.max_wait_time:
-        raise command_base.CommandError(
-            'Timeout reached while waiting for snapshots to be ready.')
-
-      all_snapshots = [
-          s for s in utils.All(self._snapshots_api.list, self._project)['items']
-          if s['name'] in snapshots and s['status'] != 'READY']
-      if not all_snapshots:
-        break
-      LOGGER.info('Waiting for snapshots to be READY. Sleeping for %ss' %
-                  self._flags.sleep_between_polls)
-      time.sleep(self._flags.sleep_between_polls)
+  def _MoveDisksAndInstances(self, timer, disk_moves, instances, src_zone,
+                             dest_zone, log_path):
+    """Moves the given disks, and the instances using them.
 
-  def _CreateSnapshots(self, snapshot_mappings, src_zone, dest_zone):
-    """Creates snapshots for the disks to be moved.
+    Each disk moves on its own: it is snapshotted, its snapshot is polled
+    until it is READY, it is deleted from the source zone and it is
+    created from the snapshot in the destination zone.  Each instance is
+    created in the destination zone as soon as all of its disks have been.
+    The next step of every disk and instance is sent together each round,
+    in batch requests where possible, so a slow snapshot only holds back
+    the instances that use its disk.  Rounds that only poll back off like
+    WaitForOperations does.  The stage each disk reaches is recorded in
+    the move log, for resumemove.
 
     Args:
-      snapshot_mappings: A map of disk names that should be moved to
-        the names that should be used for each disk's snapshot.
-      src_zone: The source zone. All disks in snapshot_mappings must be
-        in this zone.
-      dest_zone: The zone the disks are destined for.
+      timer: An implementation of the time object, providing time and sleep
+          methods.
+      disk_moves: A list of _DiskMove objects for the disks to move.
+      instances: A list of the instance resources to create in dest_zone.
+      src_zone: The source zone.
+      dest_zone: The destination zone.
+      log_path: The path of the move log.
+
+    Raises:
+      CommandError: If any of the steps fail, or if no step completes
+          within --max_wait_time.
     """
-    if not snapshot_mappings:
+    if not disk_moves and not instances:
       return
 
-    print 'Snapshotting disks...'
-    requests = []
-    for disk_name, snapshot_name in snapshot_mappings.iteritems():
+    print 'Moving disks and recreating instances in %s...' % dest_zone
+    self._PrepareInstances(instances, src_zone, dest_zone)
+    disks_by_name = dict((disk.name, disk) for disk in disk_moves)
+    instance_moves = [_InstanceMove(instance, self._GetPersistentDiskNames(
+        [instance])) for instance in instances]
+
+    errors = []
+    last_progress_time = timer.time()
+    while True:
+      steps = []
+      for disk in disk_moves:
+        if disk.stage != DISK_CREATED and not disk.failed:
+          steps.append((disk, self._GetDiskMoveRequest(disk, src_zone,
+                                                       dest_zone)))
+      for instance in instance_moves:
+        if instance.done or instance.failed:
+          continue
+        if instance.operation:
+          steps.append((instance,
+                        self._GetOperationRequest(instance.operation)))
+        elif all(disks_by_name[name].stage == DISK_CREATED
+                 for name in instance.disk_names if name in disks_by_name):
+          steps.append((instance, self._instances_api.insert(
+              project=self._project, body=instance.instance, zone=dest_zone)))
+      if not steps:
+        break
+
+      # Rounds that start no new step wait before polling.
+      if all(item.IsPolling() for item, _ in steps):
+        elapsed = timer.time() - last_progress_time
+        if elapsed >= self._flags.max_wait_time:
+          raise command_base.CommandError(
+              'Timeout reached while waiting for:\n%s' %
+              utils.ListStrings(item.Describe() for item, _ in steps))
+        sleep_time = min(max(elapsed * command_base.POLL_BACKOFF_FACTOR,
+                             command_base.MIN_POLL_INTERVAL),
+                         self._flags.sleep_between_polls)
+        LOGGER.info('Waiting for %d disk(s) and instance(s). Sleeping for '
+                    '%ss.', len(steps), sleep_time)
+        timer.sleep(sleep_time)
+
+      outcomes = self._ExecuteRequestsTogether(
+          [(index, request) for index, (_, request) in enumerate(steps)])
+      disks_advanced = False
+      for index, (item, _) in enumerate(steps):
+        raised_exception, result = outcomes[index]
+        error = None
+        if raised_exception:
+          error = result
+        elif self.IsResultAnOperation(result):
+          if result['status'] != 'DONE':
+            item.operation = result
+            continue
+          item.operation = None
+          error = self._GetOperationError(result)
+        elif result.get('status') != 'READY':
+          # A snapshot that is not READY yet.
+          if result.get('status') == 'FAILED':
+            error = 'The snapshot failed.'
+          else:
+            continue
+
+        if error:
+          item.failed = True
+          errors.append('%s: %s' % (item.Describe(), error))
+          continue
+        item.Advance()
+        last_progress_time = timer.time()
+        if isinstance(item, _DiskMove):
+          LOGGER.info('%s.', item.Describe())
+          disks_advanced = True
+      if disks_advanced:
+        self._RecordDiskStages(log_path, disk_moves)
+
+    blocked = [instance.instance['name'] for instance in instance_moves
+               if not instance.done and not instance.failed]
+    if blocked:
+      errors.append('These instances were not created, as some of their '
+                    'disks could not be moved: %s' % ', '.join(blocked))
+    if errors:
+      raise command_base.CommandError(
+          'Aborting due to errors while moving disks and instances:\n%s' %
+          utils.ListStrings(errors))
+
+  def _GetDiskMoveRequest(self, disk, src_zone, dest_zone):
+    """Returns the request for the next step in moving the given disk."""
+    if disk.operation:
+      return self._GetOperationRequest(disk.operation)
+
+    if disk.stage == DISK_PENDING:
       snapshot_resource = {
-          'name': snapshot_name,
+          'name': disk.snapshot,
           'sourceDisk': self.NormalizePerZoneResourceName(
-              self._project, src_zone, 'disks', disk_name),
+              self._project, src_zone, 'disks', disk.name),
           'description': ('Snapshot for moving disk %s from %s to %s.' %
-                          (disk_name, src_zone, dest_zone))}
-      requests.append(self._snapshots_api.insert(
-          project=self._project, body=snapshot_resource))
+                          (disk.name, src_zone, dest_zone))}
+      return self._snapshots_api.insert(
+          project=self._project, body=snapshot_resource)
+    elif disk.stage == DISK_SNAPSHOTTED:
+      return self._snapshots_api.get(
+          project=self._project, snapshot=disk.snapshot)
+    elif disk.stage == DISK_SNAPSHOT_READY:
+      return self._disks_api.delete(
+          project=self._project, disk=disk.name, zone=src_zone)
+    else:
+      disk_resource = {
+          'name': disk.name,
+          'sourceSnapshot': self.NormalizeGlobalResourceName(
+              self._project, 'snapshots', disk.snapshot)}
+      return self._disks_api.insert(
+          project=self._project, body=disk_resource, zone=dest_zone)
 
-    results, exceptions = self.ExecuteRequests(
-        requests, collection_name='snapshots')
-    if exceptions:
-      raise command_base.CommandError(
-          'Aborting due to errors while creating snapshots:\n%s' %
-          utils.ListStrings(exceptions))
-    self._CheckForErrorsInOps(self.MakeListResult(results, 'operationList'))
-    self._WaitForSnapshots(snapshot_mappings.values())
+  def _RecordDiskStages(self, log_path, disk_moves):
+    """Records the stage each of the given disks has reached in the log."""
+    with open(log_path) as f:
+      contents = json.load(f)
+    stages = contents.setdefault('disk_stages', {})
+    for disk in disk_moves:
+      stages[disk.name] = disk.stage
+
+    # The log is replaced whole, so that an interrupted write does not
+    # lose it.
+    temp_path = log_path + '.tmp'
+    with open(temp_path, 'w') as f:
+      json.dump(contents, f)
+    os.rename(temp_path, log_path)
 
   def _DeleteSnapshots(self, snapshot_names, zone):
     """Deletes the given snapshots.
@@ -290,60 +452,13 @@ class MoveInstancesBase(command_base.GoogleComputeCommand):
           utils.ListStrings(exceptions))
     self._CheckForErrorsInOps(self.MakeListResult(results, 'operationList'))
 
-  def _CreateDisksFromSnapshots(self, snapshot_mappings, dest_zone):
-    """Creates disks in the destination zone from the given snapshots.
-
-    Args:
-      snapshot_mappings: A dict of disk names to snapshot names. Disks are
-        created in the destination zone from the given snapshot names. The
-        disks will assume their previous names as indicated by the key-value
-        pairs.
-      dest_zone: The zone in which the disks will be created.
-    """
-    if not snapshot_mappings:
-      return
-
-    print 'Recreating disks from snapshots...'
-    requests = []
-    for disk_name, snapshot_name in snapshot_mappings.iteritems():
-      disk_resource = {
-          'name': disk_name,
-          'sourceSnapshot': self.NormalizeGlobalResourceName(
-              self._project, 'snapshots', snapshot_name)}
-      requests.append(self._disks_api.insert(
-          project=self._project, body=disk_resource, zone=dest_zone))
-
-    results, exceptions = self.ExecuteRequests(
-        requests, collection_name='disks')
-    if exceptions:
-      raise command_base.CommandError(
-          'Aborting due to errors while re-creating disks:\n%s' %
-          utils.ListStrings(exceptions))
-    self._CheckForErrorsInOps(self.MakeListResult(results, 'operationList'))
-
-  def _DeleteDisks(self, disk_names, zone):
-    """Deletes the given disks.
-
-    Args:
-      disk_names: A list of disk names to delete.
-      zone: The zone to which the disks belong.
-    """
-    if not disk_names:
-      return
-
-    print 'Deleting disks...'
-    requests = []
-    for name in disk_names:
-      requests.append(self._disks_api.delete(
-          project=self._project, disk=name, zone=zone))
-
-    results, exceptions = self.ExecuteRequests(
-        requests, collection_name='disks')
-    if exceptions:
-      raise command_base.CommandError(
-          'Aborting due to errors while deleting disks:\n%s' %
-          utils.ListStrings(exceptions))
-    self._CheckForErrorsInOps(self.MakeListResult(results, 'operationList'))
+  def _GetPersistentDiskNames(self, instances):
+    res = []
+    for instance in instances:
+      for disk in instance.get('disks', []):
+        if disk['type'] == 'PERSISTENT':
+          res.append(disk['source'].split('/')[-1])
+    return res
 
   def _CalculateNumCpus(self, instances_to_mv):
     """Calculates the amount of CPUs used by the given instances."""
@@ -552,15 +667,14 @@ class MoveInstances(MoveInstancesBase):
     # Assuming no other processes have modified the user's project, at
     # this point, we can assume that all disks-to-be-moved are
     # dormant.
-    self._CreateSnapshots(snapshot_mappings,
-                          self._flags.source_zone,
-                          self._flags.destination_zone)
-    self._DeleteDisks(disks_to_mv, self._flags.source_zone)
-    self._CreateDisksFromSnapshots(snapshot_mappings,
-                                   self._flags.destination_zone)
-    self._CreateInstances(instances_to_mv,
-                          self._flags.source_zone,
-                          self._flags.destination_zone)
+    self._MoveDisksAndInstances(
+        time,
+        [_DiskMove(disk, snapshot)
+         for disk, snapshot in sorted(snapshot_mappings.iteritems())],
+        instances_to_mv,
+        self._flags.source_zone,
+        self._flags.destination_zone,
+        log_path)
 
     self._DeleteSnapshots(snapshot_mappings.values(),
                           self._flags.destination_zone)
@@ -647,14 +761,6 @@ class MoveInstances(MoveInstancesBase):
           res[instance_name].append(disk_name)
     return sorted(res.iteritems())
 
-  def _GetPersistentDiskNames(self, instances):
-    res = []
-    for instance in instances:
-      for disk in instance.get('disks', []):
-        if disk['type'] == 'PERSISTENT':
-          res.append(disk['source'].split('/')[-1])
-    return res
-
   def _CheckDestinationZone(self):
     """Raises an exception if the destination zone is not valid."""
     print 'Checking destination zone...'
@@ -727,6 +833,44 @@ class ResumeMove(MoveInstancesBase):
       result = json.load(f)
     return result
 
+  def _GetDiskMovesToResume(self, snapshot_mappings, logged_stages,
+                            disks_in_src, disks_in_dest, snapshots):
+    """Works out the stage each disk that has not been moved is at.
+
+    Args:
+      snapshot_mappings: A dict mapping the names of the disks to move to
+        the names of their snapshots.
+      logged_stages: A dict mapping disk names to the stage the move log
+        records for them.
+      disks_in_src: The names of the disks in the source zone.
+      disks_in_dest: The names of the disks in the destination zone.
+      snapshots: The names of the snapshots in the project.
+
+    Returns:
+      A list of _DiskMove objects for the disks that have not been moved.
+      Disks that are in neither zone and have no snapshot are left out.
+    """
+    disk_moves = []
+    for disk, snapshot in sorted(snapshot_mappings.iteritems()):
+      if disk in disks_in_dest:
+        continue
+      if disk in disks_in_src:
+        if snapshot not in snapshots:
+          stage = DISK_PENDING
+        elif logged_stages.get(disk) == DISK_SNAPSHOT_READY:
+          stage = DISK_SNAPSHOT_READY
+        else:
+          # The snapshot may not be READY yet.
+          stage = DISK_SNAPSHOTTED
+      elif snapshot in snapshots:
+        stage = DISK_DELETED
+      else:
+        LOGGER.warn('Disk %s and its snapshot %s no longer exist.',
+                    disk, snapshot)
+        continue
+      disk_moves.append(_DiskMove(disk, snapshot, stage))
+    return disk_moves
+
   def HandleMove(self, log_path):
     """Attempts the move dictated in the given log file.
 
@@ -779,40 +923,26 @@ class ResumeMove(MoveInstancesBase):
 
     instances_to_delete = self._Intersect(instances_to_mv, instances_in_source)
 
-    # For the disks that are still in the source zone, figures out
-    # which ones still need to be snapshotted before being deleted.
-    snapshot_mappings_for_unmoved_disks = {}
-    if disks_to_mv:
-      current_snapshots = utils.AllNames(
-          self._snapshots_api.list, self._project)
-
-      for disk, snapshot in snapshot_mappings.iteritems():
-        if disk in disks_to_mv and snapshot not in current_snapshots:
-          snapshot_mappings_for_unmoved_disks[disk] = snapshot
+    # Each disk that has not been moved resumes from the stage it is at.
+    current_snapshots = set(utils.AllNames(
+        self._snapshots_api.list, self._project))
+    disk_moves = self._GetDiskMovesToResume(
+        snapshot_mappings, log.get('disk_stages', {}), disks_in_src,
+        disks_in_dest, current_snapshots)
+    snapshots_to_create = [disk.snapshot for disk in disk_moves
+                           if disk.stage == DISK_PENDING]
 
     # Ensures that the current quotas can support the move and prompts
     # the user for confirmation.
     self._CheckQuotas(instances_to_mv, disks_to_mv, src_zone, dest_zone,
-                      snapshots_to_create=snapshot_mappings_for_unmoved_disks)
+                      snapshots_to_create=snapshots_to_create)
     self._Confirm(instances_to_mv, instances_to_ignore,
                   disks_to_mv, dest_zone)
 
     self._DeleteInstances(instances_to_delete, src_zone)
-    self._CreateSnapshots(snapshot_mappings_for_unmoved_disks,
-                          src_zone, dest_zone)
-    self._DeleteDisks(disks_to_mv, src_zone)
-
-    # Create disks in destination zone from snapshots.
-    all_snapshots = set(utils.AllNames(
-        self._snapshots_api.list, self._project))
-    disks_to_create = {}
-    for disk, snapshot in snapshot_mappings.iteritems():
-      if snapshot in all_snapshots and disk not in disks_in_dest:
-        disks_to_create[disk] = snapshot
-    self._CreateDisksFromSnapshots(disks_to_create, dest_zone)
-
-    self._CreateInstances(instances_to_mv, src_zone, dest_zone)
-    self._DeleteSnapshots(disks_to_create.values(), dest_zone)
+    self._MoveDisksAndInstances(time, disk_moves, instances_to_mv,
+                                src_zone, dest_zone, log_path)
+    self._DeleteSnapshots([disk.snapshot for disk in disk_moves], dest_zone)
 
     if not self._flags.keep_log_file:
       # We have succeeded, so it's safe to delete the log file.
@@ -22,6 +22,10 @@ import path_initializer
 path_initializer.InitializeSysPath()
 
 import copy
+import json
+import os
+import shutil
+import tempfile
 import uuid
 
 from google.apputils import app
@@ -111,6 +115,97 @@ class MoveInstancesBaseTest(MoveInstancesBaseTestCase):
     self.assertEqual(self.command._ExtractAvailableQuota(
         project_quota, zone_quota, requirements), expected)
 
+  def testMoveDisksAndInstancesMovesEachDiskOnItsOwn(self):
+
+    class MockTimer(object):
+
+      def __init__(self):
+        self.sleeps = []
+
+      def time(self):
+        return sum(self.sleeps)
+
+      def sleep(self, time_to_sleep):
+        self.sleeps.append(time_to_sleep)
+
+    def Operation(target, status='DONE'):
+      return {'kind': 'compute#operation', 'name': 'op-' + target,
+              'targetLink': target, 'status': status}
+
+    # The statuses each snapshot goes through, one per poll.
+    snapshot_statuses = {'snapshot-fast': ['READY'],
+                         'snapshot-slow': ['CREATING'] * 10 + ['READY']}
+    steps = []
+
+    def MockExecuteRequestsTogether(requests):
+      outcomes = {}
+      for index, request in requests:
+        payload = request.request_payload
+        body = payload.get('body', {})
+        if request.method_name == 'poll':
+          steps.append(('done', payload['targetLink']))
+          result = Operation(payload['targetLink'])
+        elif 'sourceDisk' in body:
+          steps.append(('snapshot', body['name']))
+          result = Operation(body['name'])
+        elif 'snapshot' in payload:
+          result = {'name': payload['snapshot'],
+                    'status': snapshot_statuses[payload['snapshot']].pop(0)}
+          if result['status'] == 'READY':
+            steps.append(('ready', payload['snapshot']))
+        elif 'disk' in payload:
+          steps.append(('delete', payload['disk']))
+          result = Operation(payload['disk'])
+        elif 'sourceSnapshot' in body:
+          steps.append(('create', body['name']))
+          result = Operation(body['name'])
+        else:
+          steps.append(('create', body['name']))
+          result = Operation(body['name'], status='PENDING')
+        outcomes[index] = (False, result)
+      return outcomes
+
+    def Instance(name, disk):
+      return {'name': name,
+              'zone': 'projects/my-project/zones/src-zone',
+              'disks': [{'type': 'PERSISTENT',
+                         'source': 'projects/my-project/zones/src-zone/'
+                                   'disks/' + disk}]}
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+      log_path = os.path.join(temp_dir, 'move-log')
+      with open(log_path, 'w') as f:
+        json.dump({}, f)
+
+      self.command._project = 'my-project'
+      self.command._project_resource = {}
+      self.command._ExecuteRequestsTogether = MockExecuteRequestsTogether
+      self.command._GetOperationRequest = (
+          lambda operation: mock_api.MockRequest(operation, 'poll'))
+      self.flag_values.max_wait_time = 60
+      self.flag_values.sleep_between_polls = 5
+      disk_moves = [move_cmds._DiskMove('fast', 'snapshot-fast'),
+                    move_cmds._DiskMove('slow', 'snapshot-slow')]
+      instances = [Instance('i-fast', 'fast'), Instance('i-slow', 'slow')]
+      self.command._MoveDisksAndInstances(
+          MockTimer(), disk_moves, instances, 'src-zone', 'dest-zone',
+          log_path)
+
+      # The instance using the fast disk is created while the snapshot of
+      # the slow disk is not ready yet.
+      self.assertTrue(steps.index(('done', 'i-fast')) <
+                      steps.index(('ready', 'snapshot-slow')))
+      self.assertTrue(steps.index(('create', 'slow')) <
+                      steps.index(('create', 'i-slow')))
+      self.assertTrue(instances[1]['disks'][0]['source'].endswith(
+          '/zones/dest-zone/disks/slow'))
+      with open(log_path) as f:
+        self.assertEqual({'fast': 'CREATED', 'slow': 'CREATED'},
+                         json.load(f)['disk_stages'])
+    finally:
+      shutil.rmtree(temp_dir)
+
 
 class MoveInstancesTest(MoveInstancesBaseTestCase):
 
@@ -302,6 +397,27 @@ class ResumeMoveTest(MoveInstancesBaseTestCase):
       self.assertRaises(command_base.CommandError,
                         self.command._GetKey, log, 'nonexistent')
 
+  def testGetDiskMovesToResume(self):
+    snapshot_mappings = {'moved': 'snapshot-moved',
+                         'pending': 'snapshot-pending',
+                         'snapshotted': 'snapshot-snapshotted',
+                         'ready': 'snapshot-ready',
+                         'deleted': 'snapshot-deleted',
+                         'lost': 'snapshot-lost'}
+    logged_stages = {'snapshotted': 'SNAPSHOTTED',
+                     'ready': 'SNAPSHOT_READY',
+                     'deleted': 'DELETED'}
+    disk_moves = self.command._GetDiskMovesToResume(
+        snapshot_mappings, logged_stages,
+        disks_in_src=set(['pending', 'snapshotted', 'ready']),
+        disks_in_dest=set(['moved']),
+        snapshots=set(['snapshot-moved', 'snapshot-snapshotted',
+                       'snapshot-ready', 'snapshot-deleted']))
+    self.assertEqual(
+        [('deleted', 'DELETED'), ('pending', 'PENDING'),
+         ('ready', 'SNAPSHOT_READY'), ('snapshotted', 'SNAPSHOTTED')],
+        [(disk.name, disk.stage) for disk in disk_moves])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the refresh and storage of oauth2client credentials."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import httplib2
+import oauth2client.client as oauth2_client
+import oauth2client.multistore_file as oauth2_multistore_file
+
+import unittest
+
+
+TOKEN_URI = 'https://accounts.google.com/o/oauth2/token'
+API_URI = 'https://www.googleapis.com/compute/v1beta15/projects/p'
+
+
+def MakeCredentials(access_token, token_expiry=None):
+  return oauth2_client.OAuth2Credentials(
+      access_token, 'client-id', 'client-secret', 'refresh-token',
+      token_expiry, TOKEN_URI, 'user-agent')
+
+
+class MockHttp(object):
+  """An Http object answering token refreshes and API requests."""
+
+  def __init__(self, api_responses=None, refresh_delay=0):
+    self.refreshes = 0
+    self.api_requests = []
+    self._api_responses = list(api_responses or [])
+    self._refresh_delay = refresh_delay
+    self._lock = threading.Lock()
+
+  def request(self, uri, method='GET', body=None, headers=None,
+              redirections=None, connection_type=None):
+    if uri == TOKEN_URI:
+      time.sleep(self._refresh_delay)
+      with self._lock:
+        self.refreshes += 1
+        access_token = 'token%d' % self.refreshes
+      return (httplib2.Response({'status': '200'}),
+              json.dumps({'access_token': access_token, 'expires_in': 3600}))
+    with self._lock:
+      self.api_requests.append(headers['Authorization'])
+      response = self._api_responses and self._api_responses.pop(0)
+    if callable(response):
+      response = response()
+    return httplib2.Response({'status': str(response or 200)}), ''
+
+
+class RefreshTest(unittest.TestCase):
+
+  def testThreadsShareOneRefreshOfAnExpiringToken(self):
+    credentials = MakeCredentials(
+        'old', datetime.datetime.utcnow() + datetime.timedelta(seconds=10))
+    http = credentials.authorize(MockHttp(refresh_delay=0.1))
+    threads = [threading.Thread(target=http.request, args=(API_URI,))
+               for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual('token1', credentials.access_token)
+    self.assertEqual(['Bearer token1'] * 5, http.api_requests)
+    self.assertEqual(1, http.refreshes)
+
+  def testRejectedTokenAlreadyRefreshedIsNotRefreshedAgain(self):
+    credentials = MakeCredentials('old')
+
+    def RefreshedByAnotherThread():
+      credentials.access_token = 'new'
+      return 401
+
+    http = credentials.authorize(MockHttp([RefreshedByAnotherThread]))
+    response, _ = http.request(API_URI)
+    self.assertEqual(200, response.status)
+    self.assertEqual(['Bearer old', 'Bearer new'], http.api_requests)
+    self.assertEqual(0, http.refreshes)
+
+  def testRejectedTokenIsRefreshed(self):
+    http = MakeCredentials('old').authorize(MockHttp([401]))
+    response, _ = http.request(API_URI)
+    self.assertEqual(200, response.status)
+    self.assertEqual(['Bearer old', 'Bearer token1'], http.api_requests)
+    self.assertEqual(1, http.refreshes)
+
+  def testRefreshLocksAreNotSharedOrSerialized(self):
+    credentials = MakeCredentials('token')
+    self.assertFalse(
+        credentials._refresh_lock is MakeCredentials('token')._refresh_lock)
+    self.assertFalse('_refresh_lock' in json.loads(credentials.to_json()))
+    restored = oauth2_client.Credentials.new_from_json(credentials.to_json())
+    self.assertFalse(restored._refresh_lock is credentials._refresh_lock)
+
+
+class MultistoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.temp_dir, 'credentials')
+    self.old_stat_resolution = oauth2_multistore_file._STAT_RESOLUTION
+
+  def tearDown(self):
+    oauth2_multistore_file._STAT_RESOLUTION = self.old_stat_resolution
+    shutil.rmtree(self.temp_dir)
+
+  def _GetStorage(self, multistore):
+    return multistore._get_storage('client-id', 'user-agent', 'scope')
+
+  def _CountReads(self, multistore):
+    reads = []
+    read = multistore._locked_json_read
+    multistore._locked_json_read = lambda: reads.append(1) or read()
+    return reads
+
+  def testFileIsOnlyReadAgainAfterAnotherWriterChangesIt(self):
+    oauth2_multistore_file._STAT_RESOLUTION = 0
+    multistore = oauth2_multistore_file._MultiStore(self.filename)
+    storage = self._GetStorage(multistore)
+    storage.put(MakeCredentials('token1'))
+    reads = self._CountReads(multistore)
+    for _ in range(3):
+      self.assertEqual('token1', storage.get().access_token)
+    self.assertEqual([], reads)
+
+    other_multistore = oauth2_multistore_file._MultiStore(self.filename)
+    self._GetStorage(other_multistore).put(MakeCredentials('token22'))
+    self.assertEqual('token22', storage.get().access_token)
+    self.assertEqual('token22', storage.get().access_token)
+    self.assertEqual([1], reads)
+
+  def testRecentRewriteOfTheSameSizeIsReadAgain(self):
+    multistore = oauth2_multistore_file._MultiStore(self.filename)
+    storage = self._GetStorage(multistore)
+    storage.put(MakeCredentials('token1'))
+    other_multistore = oauth2_multistore_file._MultiStore(self.filename)
+    other_storage = self._GetStorage(other_multistore)
+    other_storage.put(MakeCredentials('token2'))
+    # Restores the modification time, as a file system with a coarse
+    # resolution would leave it.
+    stat = os.stat(self.filename)
+    os.utime(self.filename, (stat.st_atime, stat.st_mtime))
+    self.assertEqual('token2', storage.get().access_token)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,180 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of slowly changing API resources and of the zones of resources."""
+
+from __future__ import with_statement
+
+
+
+import json
+import os
+import threading
+import time
+
+import gflags as flags
+from gcutil import gcutil_logging
+
+FLAGS = flags.FLAGS
+LOGGER = gcutil_logging.LOGGER
+
+# The collections whose resources may be cached.
+CACHED_COLLECTIONS = ('zones', 'machineTypes', 'images', 'kernels')
+
+# The maximum number of resource names kept in the name to zone index.
+MAX_ZONE_INDEX_SIZE = 10000
+
+flags.DEFINE_bool(
+    'cache_resources',
+    False,
+    'If true, cache the zones, machine types, images and kernels of a '
+    'project, and the zones of resources seen, in the file specified by '
+    'the "cached_resources_file" flag.  Lists of these resources may then '
+    'be up to "cached_resources_ttl" seconds old.')
+flags.DEFINE_string(
+    'cached_resources_file',
+    '~/.gcutil.resources',
+    'File storing a cache of slowly changing resources.')
+flags.DEFINE_integer(
+    'cached_resources_ttl',
+    3600,
+    'The number of seconds a cached list of resources is used for.',
+    0)
+
+
+class ResourceCache(object):
+  """File based cache of resource lists and of a resource name to zone index.
+
+  The cache is kept separately for each API version.  Lists of resources
+  expire after a TTL.  The zones in the index never expire, as a zone
+  found there is only a hint that callers are expected to verify.
+  """
+
+  def __init__(self, api_version, cache_file_name=None, ttl=None,
+               open_function=open, os_module=os, timer=time):
+    """Constructor.
+
+    Args:
+      api_version: (str) the API version whose resources are cached.
+      cache_file_name: (str) optional path of the cache file (default is
+        FLAGS.cached_resources_file).
+      ttl: (int) optional number of seconds a list of resources is fresh for
+        (default is FLAGS.cached_resources_ttl).
+      open_function: (function) used to open a file (overriden in tests).
+      os_module: (module) used to perform OS operations (overriden in tests).
+      timer: (module) providing the time function (overriden in tests).
+    """
+    self._open = open_function
+    self._os = os_module
+    self._timer = timer
+    self._api_version = api_version
+    self._ttl = FLAGS.cached_resources_ttl if ttl is None else ttl
+    self.cache_file_path = self._os.path.expanduser(
+        cache_file_name or FLAGS.cached_resources_file)
+    self._dirty = False
+
+    self._cache = {}
+    if self._os.path.exists(self.cache_file_path):
+      try:
+        with self._open(self.cache_file_path) as cache_file:
+          self._cache = json.loads(cache_file.read())
+      except (IOError, ValueError), e:
+        LOGGER.debug('Ignoring unreadable resource cache file %s: %s',
+                     self.cache_file_path, e)
+    if not isinstance(self._cache, dict):
+      self._cache = {}
+    version_cache = self._cache.setdefault(api_version, {})
+    self._collections = version_cache.setdefault('collections', {})
+    self._zones = version_cache.setdefault('zones', {})
+
+  @staticmethod
+  def _Key(project, name):
+    return '%s/%s' % (project, name)
+
+  def GetCollection(self, project, collection):
+    """Returns the cached resources of a collection.
+
+    Args:
+      project: (str) the project the collection belongs to.
+      collection: (str) the name of the collection, e.g. 'zones'.
+    Returns:
+      The list of cached resources, or None if there is no fresh list.
+    """
+    entry = self._collections.get(self._Key(project, collection))
+    if entry is None or self._timer.time() - entry['time'] >= self._ttl:
+      return None
+    return entry['items']
+
+  def SetCollection(self, project, collection, items):
+    """Caches the full list of resources of a collection.
+
+    Args:
+      project: (str) the project the collection belongs to.
+      collection: (str) the name of the collection, e.g. 'zones'.
+      items: (list) the resources of the collection.
+    """
+    if collection not in CACHED_COLLECTIONS:
+      return
+    self._collections[self._Key(project, collection)] = {
+        'time': self._timer.time(),
+        'items': items}
+    self._dirty = True
+
+  def InvalidateCollection(self, project, collection):
+    """Removes the cached list of resources of a collection, if any."""
+    if self._collections.pop(self._Key(project, collection), None):
+      self._dirty = True
+
+  def GetResourceZone(self, project, name):
+    """Returns the zone a resource was last seen in, or None."""
+    entry = self._zones.get(self._Key(project, name))
+    return entry and entry['zone']
+
+  def SetResourceZone(self, project, name, zone):
+    """Records the zone a resource was seen in.
+
+    Args:
+      project: (str) the project the resource belongs to.
+      name: (str) the unqualified name of the resource.
+      zone: (str) the unqualified name of the zone.
+    """
+    key = self._Key(project, name)
+    entry = self._zones.get(key)
+    if entry and entry['zone'] == zone:
+      return
+    self._zones[key] = {'zone': zone, 'time': self._timer.time()}
+    self._dirty = True
+
+    if len(self._zones) > MAX_ZONE_INDEX_SIZE:
+      # Forget the oldest entries.
+      oldest = sorted(self._zones, key=lambda k: self._zones[k]['time'])
+      for key in oldest[:len(self._zones) - MAX_ZONE_INDEX_SIZE]:
+        del self._zones[key]
+
+  def Save(self):
+    """Writes the cache file if anything was changed."""
+    if not self._dirty:
+      return
+    temp_path = '%s.%d.%d' % (self.cache_file_path, self._os.getpid(),
+                              threading.current_thread().ident)
+    try:
+      with self._open(temp_path, 'w') as cache_file:
+        cache_file.write(json.dumps(self._cache))
+      # Replacing the file keeps concurrent readers from seeing a partial one.
+      self._os.rename(temp_path, self.cache_file_path)
+    except (IOError, OSError), e:
+      LOGGER.debug('Could not write resource cache file %s: %s',
+                   self.cache_file_path, e)
+      return
+    self._dirty = False
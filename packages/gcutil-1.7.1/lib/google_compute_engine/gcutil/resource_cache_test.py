@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the resource cache."""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import os
+import shutil
+import tempfile
+
+import unittest
+
+from gcutil import resource_cache
+
+
+class MockTimer(object):
+
+  def __init__(self):
+    self.current_time = 1000
+
+  def time(self):
+    return self.current_time
+
+
+class ResourceCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.cache_file = os.path.join(self.temp_dir, 'resources')
+    self.timer = MockTimer()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _CreateCache(self, api_version='v1beta14', ttl=60):
+    return resource_cache.ResourceCache(
+        api_version, cache_file_name=self.cache_file, ttl=ttl,
+        timer=self.timer)
+
+  def testCollectionsPersistUntilTheyExpire(self):
+    zones = [{'name': 'zone-a'}, {'name': 'zone-b'}]
+    cache = self._CreateCache()
+    self.assertEqual(None, cache.GetCollection('p', 'zones'))
+    cache.SetCollection('p', 'zones', zones)
+    cache.Save()
+
+    cache = self._CreateCache()
+    self.assertEqual(zones, cache.GetCollection('p', 'zones'))
+    self.assertEqual(None, cache.GetCollection('other-project', 'zones'))
+    self.timer.current_time += 60
+    self.assertEqual(None, cache.GetCollection('p', 'zones'))
+
+  def testCollectionsAreKeyedByApiVersion(self):
+    cache = self._CreateCache()
+    cache.SetCollection('p', 'kernels', [{'name': 'kernel'}])
+    cache.Save()
+
+    self.assertEqual(
+        None, self._CreateCache('v1beta13').GetCollection('p', 'kernels'))
+
+  def testOnlySlowlyChangingCollectionsAreCached(self):
+    cache = self._CreateCache()
+    cache.SetCollection('p', 'instances', [{'name': 'instance'}])
+    self.assertEqual(None, cache.GetCollection('p', 'instances'))
+
+  def testInvalidateCollection(self):
+    cache = self._CreateCache()
+    cache.SetCollection('p', 'images', [{'name': 'image'}])
+    cache.Save()
+
+    cache = self._CreateCache()
+    cache.InvalidateCollection('p', 'images')
+    cache.Save()
+    self.assertEqual(None, self._CreateCache().GetCollection('p', 'images'))
+
+  def testResourceZones(self):
+    cache = self._CreateCache()
+    self.assertEqual(None, cache.GetResourceZone('p', 'instance-1'))
+    cache.SetResourceZone('p', 'instance-1', 'zone-a')
+    cache.SetResourceZone('p', 'instance-1', 'zone-b')
+    cache.Save()
+
+    cache = self._CreateCache()
+    self.assertEqual('zone-b', cache.GetResourceZone('p', 'instance-1'))
+    self.assertEqual(None, cache.GetResourceZone('q', 'instance-1'))
+
+  def testZoneIndexIsBounded(self):
+    old_max_zone_index_size = resource_cache.MAX_ZONE_INDEX_SIZE
+    resource_cache.MAX_ZONE_INDEX_SIZE = 2
+    try:
+      cache = self._CreateCache()
+      for i in xrange(3):
+        self.timer.current_time += 1
+        cache.SetResourceZone('p', 'instance-%d' % i, 'zone-a')
+    finally:
+      resource_cache.MAX_ZONE_INDEX_SIZE = old_max_zone_index_size
+
+    self.assertEqual(None, cache.GetResourceZone('p', 'instance-0'))
+    self.assertEqual('zone-a', cache.GetResourceZone('p', 'instance-1'))
+    self.assertEqual('zone-a', cache.GetResourceZone('p', 'instance-2'))
+
+  def testUnreadableCacheFileIsIgnored(self):
+    cache_file = open(self.cache_file, 'w')
+    cache_file.write('not json')
+    cache_file.close()
+
+    cache = self._CreateCache()
+    self.assertEqual(None, cache.GetCollection('p', 'zones'))
+    cache.SetCollection('p', 'zones', [])
+    cache.Save()
+    self.assertEqual([], self._CreateCache().GetCollection('p', 'zones'))
+
+  def testUnchangedCacheIsNotWritten(self):
+    self._CreateCache().Save()
+    self.assertFalse(os.path.exists(self.cache_file))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the fixed cost of running a gcutil command.
+
+Each measurement starts a new gcutil process, as every gcutil invocation
+does.  The following are reported, in seconds:
+
+  import: importing the modules the gcutil launcher needs.
+  version: running 'gcutil version', which imports and registers a single
+      command module and makes no API request.
+  help: running 'gcutil help', which imports and registers every command.
+  command: running the command given with --command, if any, e.g.
+      --command='getproject --project=my-project'.  This includes loading
+      credentials, building the API and the first API request.
+
+Usage:
+  startup_benchmark.py [--iterations=10] [--command='getproject ...']
+"""
+
+
+
+import path_initializer
+path_initializer.InitializeSysPath()
+
+import os
+import subprocess
+import sys
+import time
+
+from google.apputils import app
+import gflags as flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_integer(
+    'iterations',
+    10,
+    'The number of times each measurement is repeated.',
+    lower_bound=1)
+flags.DEFINE_string(
+    'command',
+    None,
+    'A gcutil command line, without the leading "gcutil", to measure in '
+    'addition to the built-in ones.')
+
+GCUTIL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gcutil')
+
+IMPORT_SCRIPT = """
+import sys
+sys.path.insert(0, %r)
+import path_initializer
+path_initializer.InitializeSysPath()
+from gcutil import command_base
+from gcutil import command_registry
+from gcutil import ssh_keys
+from gcutil import version_checker
+""" % os.path.dirname(os.path.abspath(__file__))
+
+
+def _Time(argv):
+  """Returns the wall time it takes to run the given command line."""
+  with open(os.devnull, 'w') as devnull:
+    start_time = time.time()
+    subprocess.call(argv, stdout=devnull, stderr=devnull)
+    return time.time() - start_time
+
+
+def _Measure(name, argv):
+  """Runs a command line --iterations times and prints its timings."""
+  times = sorted(_Time(argv) for _ in xrange(FLAGS.iterations))
+  print '%-8s min %.3f  median %.3f  max %.3f' % (
+      name, times[0], times[len(times) / 2], times[-1])
+
+
+def main(unused_argv):
+  gcutil = [sys.executable, GCUTIL, '--nocheck_for_new_version']
+  _Measure('import', [sys.executable, '-c', IMPORT_SCRIPT])
+  _Measure('version', gcutil + ['version'])
+  _Measure('help', gcutil + ['help'])
+  if FLAGS.command:
+    _Measure('command', gcutil + FLAGS.command.split())
+
+
+if __name__ == '__main__':
+  app.run()
@@ -135,6 +135,15 @@ class TableFormatter(object):
     for row in rows:
       self.AddRow(row)
 
+  def PrintRows(self, rows):
+    """Add all rows to this table and print it.
+
+    Formatters that do not need all of the rows to lay out the table
+    override this to print each row as it is added.
+    """
+    self.AddRows(rows)
+    print self
+
   def AddField(self, field):
     """Add a field as a new column to this formatter."""
     # TODO(user): Excise this bigquery-specific method.
@@ -474,6 +483,25 @@ class CsvFormatter(TableFormatter):
     self._table.writerow([unicode(entry).encode('utf8', 'backslashreplace')
                           for entry in row])
 
+  def PrintRows(self, rows):
+    """Print the header, then each row as soon as it is added."""
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+      print self
+      return
+
+    def Write(line):
+      sys.stdout.write(line.decode('utf8').encode(
+          sys.getdefaultencoding(), 'backslashreplace'))
+
+    Write(','.join(self._header) + '\n')
+    for row in itertools.chain([first_row], rows):
+      self.AddRow(row)
+      Write(self._buffer.getvalue())
+      self._buffer.seek(0)
+      self._buffer.truncate()
+
 
 class JsonFormatter(TableFormatter):
   """Formats output in maximally compact JSON."""
@@ -14,6 +14,8 @@
 
 """A simple thread pool class for doing multiple concurrent API operations."""
 
+from __future__ import with_statement
+
 
 
 import logging
@@ -25,6 +27,10 @@ import traceback
 
 LOGGER = logging.getLogger('gcutil-logs')
 
+# The longest a wait for operations blocks at once, so that it can be
+# interrupted with a KeyboardInterrupt.
+WAIT_INTERRUPT_INTERVAL = 0.5
+
 
 class ThreadPoolError(Exception):
   """An error occurred in this module."""
@@ -41,13 +47,16 @@ class Operation(object):
     """Initializer."""
     self._result = None
     self._raised_exception = False
+    self.start_time = None
+    self.end_time = None
 
   def Run(self):
     """Override this method to execute this operation."""
     raise NotImplementedError('pure virtual method called')
 
   def _DoOperation(self):
-    """Internal runner that captures result."""
+    """Internal runner that captures result and timing."""
+    self.start_time = time.time()
     try:
       self._result = self.Run()
     except:  # pylint: disable-msg=W0702
@@ -61,6 +70,18 @@ class Operation(object):
       else:
         self._result = a[1]
       LOGGER.debug(traceback.format_exc())
+    finally:
+      self.end_time = time.time()
+
+  def Duration(self):
+    """Get the number of seconds the operation ran for.
+
+    Returns:
+      The duration of the operation, or None if it has not completed.
+    """
+    if self.end_time is None:
+      return None
+    return self.end_time - self.start_time
 
   def Result(self):
     """Get the operation's result.
@@ -85,29 +106,91 @@ class Operation(object):
     return self._raised_exception
 
 
+class RateLimiter(object):
+  """A token bucket limiting the rate at which operations start.
+
+  Tokens are added at the given rate up to the given burst size, and each
+  operation takes one.  Pausing the limiter, e.g. when a server asks that
+  requests be retried after some time, holds back every operation until
+  the pause ends.  This class is thread safe.
+  """
+
+  def __init__(self, rate=None, burst=1, timer=time):
+    """Initializer.
+
+    Args:
+      rate: The number of operations to start per second, or None to only
+          hold them back while paused.
+      burst: The number of operations that may start at once after the
+          limiter has been idle.
+      timer: The module providing the time and sleep functions (overridden
+          in tests).
+    """
+    self._rate = rate
+    self._burst = max(burst, 1)
+    self._timer = timer
+    self._tokens = self._burst
+    self._last_time = timer.time()
+    self._paused_until = 0
+    self._lock = threading.Lock()
+
+  def Acquire(self):
+    """Blocks until an operation may start."""
+    while True:
+      with self._lock:
+        now = self._timer.time()
+        if now < self._paused_until:
+          delay = self._paused_until - now
+        elif self._rate is None:
+          return
+        else:
+          self._tokens = min(
+              self._burst,
+              self._tokens + (now - self._last_time) * self._rate)
+          self._last_time = now
+          if self._tokens >= 1:
+            self._tokens -= 1
+            return
+          delay = (1 - self._tokens) / self._rate
+      self._timer.sleep(delay)
+
+  def Pause(self, seconds):
+    """Holds back all operations for the given number of seconds."""
+    with self._lock:
+      self._paused_until = max(self._paused_until,
+                               self._timer.time() + seconds)
+
+
 class Worker(threading.Thread):
-  """Thread executing tasks from a given tasks queue."""
+  """Thread executing tasks from the queue of a thread pool."""
 
-  def __init__(self, queue):
+  def __init__(self, pool):
     threading.Thread.__init__(self)
-    self._queue = queue
+    self._pool = pool
     self.daemon = True
     self.start()
 
   def run(self):
     # pylint: disable-msg=W0212
     while True:
-      op = self._queue.get()
+      op = self._pool._queue.get()
       if op is None:
-        self._queue.task_done()
         break
-      op._DoOperation()  # pylint: disable-msg=W0212
-      self._queue.task_done()
+      try:
+        if self._pool._rate_limiter:
+          self._pool._rate_limiter.Acquire()
+        op._DoOperation()  # pylint: disable-msg=W0212
+      finally:
+        self._pool._OperationDone()
 
 
 class ThreadPool(object):
   """Pool of threads consuming tasks from a queue.
 
+  Waiting for the tasks is signalled through a condition variable, so a
+  wait ends as soon as the last task completes.  With a RateLimiter, each
+  task takes a token from it before it starts.
+
   Note that operations on the thread pool itself (submitting, waiting,
   shutdown) are not, themselves, multithread safe.
   """
@@ -118,14 +201,17 @@ class ThreadPool(object):
   _TERMINATING = 3
   _TERMINATED = 4
 
-  def __init__(self, num_threads):
+  def __init__(self, num_threads, rate_limiter=None):
     self._queue = Queue.Queue()
     self._num_threads = num_threads
+    self._rate_limiter = rate_limiter
     self._state = self._NOT_RUNNING
+    self._unfinished = 0
+    self._done = threading.Condition(threading.Lock())
 
     self._workers = []
     for _ in range(num_threads):
-      self._workers.append(Worker(self._queue))
+      self._workers.append(Worker(self))
     self._state = self._RUNNING
 
   def __del__(self):
@@ -149,17 +235,26 @@ class ThreadPool(object):
       raise ThreadPoolError('ThreadPool not running')
     if not isinstance(op, Operation):
       raise ValueError('Nonoperation argument to AddOperation')
+    with self._done:
+      self._unfinished += 1
     self._queue.put(op)
 
+  def _OperationDone(self):
+    """Called by the workers once they complete an operation."""
+    with self._done:
+      self._unfinished -= 1
+      if not self._unfinished:
+        self._done.notifyAll()
+
   def _InternalWait(self):
-    """Wait for all items to clear.
+    """Wait for all of the operations added to complete.
 
-    This will come up for air once in a while so that we can capture
-    keyboard interrupt.  Unfortunately Queue.join() isn't
-    interruptable.
+    The wait wakes up once in a while so that we can capture keyboard
+    interrupt, which an untimed wait on a condition doesn't let through.
     """
-    while not self._queue.empty():
-      time.sleep(0.2)
+    with self._done:
+      while self._unfinished:
+        self._done.wait(WAIT_INTERRUPT_INTERVAL)
 
   def WaitAll(self):
     """Wait for completion of all the tasks in the queue.
@@ -181,8 +276,8 @@ class ThreadPool(object):
     if self._state != self._RUNNING:
       raise ThreadPoolError('ThreadPool not running')
     self._state = self._TERMINATING
+    self._InternalWait()
     # Inject a set of sentinal values to have the workers exit.
     for _ in range(self._num_threads):
       self._queue.put(None)
-    self._InternalWait()
     self._state = self._TERMINATED
@@ -84,5 +84,60 @@ class ThreadPoolTest(unittest.TestCase):
       self.assertEqual(str(op.Result()), 'Exception!')
       self.assertTrue(op.RaisedException())
 
+  def testWaitAllWaitsForRunningOperations(self):
+    tp = thread_pool.ThreadPool(2)
+    ops = [TestOperation(sleep_time=0.2) for _ in xrange(2)]
+    for op in ops:
+      tp.Add(op)
+    tp.WaitAll()
+    for op in ops:
+      self.assertEqual(op.Result(), 42)
+      self.assertTrue(op.Duration() >= 0.2)
+    tp.WaitShutdown()
+
+
+class MockTimer(object):
+
+  def __init__(self):
+    self.now = 1000.0
+    self.sleeps = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+
+  def testOperationsStartAtTheRate(self):
+    timer = MockTimer()
+    limiter = thread_pool.RateLimiter(rate=4, burst=2, timer=timer)
+    for _ in xrange(4):
+      limiter.Acquire()
+    # The burst starts at once, then operations start 1 / rate apart.
+    self.assertEqual([0.25, 0.25], timer.sleeps)
+
+    # Tokens accumulate while idle, up to the burst size.
+    timer.now += 10
+    del timer.sleeps[:]
+    for _ in xrange(3):
+      limiter.Acquire()
+    self.assertEqual([0.25], timer.sleeps)
+
+  def testPausesHoldBackOperations(self):
+    timer = MockTimer()
+    limiter = thread_pool.RateLimiter(timer=timer)
+    limiter.Acquire()
+    limiter.Pause(5)
+    limiter.Pause(2)
+    limiter.Acquire()
+    self.assertEqual([5], timer.sleeps)
+    limiter.Acquire()
+    self.assertEqual([5], timer.sleeps)
+
+
 if __name__ == '__main__':
   unittest.main()
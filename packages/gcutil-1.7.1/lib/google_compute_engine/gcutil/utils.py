@@ -162,8 +162,11 @@ def Singularize(string):
   return string[:len(string) - 1] if string.endswith('s') else string
 
 
-def All(func, project, max_results=None, filter=None, zone=None):
-  """Calls the given list function while taking care of paging logic.
+def IterPages(func, project, max_results=None, filter=None, zone=None):
+  """Yields the pages of results of the given list function in turn.
+
+  Each page is only fetched once the one before it has been consumed, and
+  no more pages are fetched once max_results items have been yielded.
 
   Args:
     func: A Google Compute Engine list function.
@@ -172,8 +175,9 @@ def All(func, project, max_results=None, filter=None, zone=None):
     filter: The filter expression to plumb through.
     zone: The zone for list functions that require a zone.
 
-  Returns:
-    A list of the resources.
+  Yields:
+    The list resource of each page, holding at most max_results items
+    between them.
   """
   params = {
       'project': project,
@@ -183,20 +187,43 @@ def All(func, project, max_results=None, filter=None, zone=None):
   if zone:
     params['zone'] = zone
 
-  items = []
+  remaining = max_results
   while True:
     res = func(**params).execute()
-    kind = res.get('kind')
-    items.extend(res.get('items', []))
+
+    if remaining is not None:
+      items = res.get('items', [])[:remaining]
+      remaining -= len(items)
+      if 'items' in res:
+        res = dict(res, items=items)
+    yield res
 
     next_page_token = res.get('nextPageToken')
-    if not next_page_token:
+    if not next_page_token or remaining == 0:
       break
 
     params['pageToken'] = next_page_token
 
-  if max_results is not None:
-    items = items[:max_results]
+
+def All(func, project, max_results=None, filter=None, zone=None):
+  """Calls the given list function while taking care of paging logic.
+
+  Args:
+    func: A Google Compute Engine list function.
+    project: The project to query.
+    max_results: The maximum number of items to return.
+    filter: The filter expression to plumb through.
+    zone: The zone for list functions that require a zone.
+
+  Returns:
+    A list of the resources.
+  """
+  kind = None
+  items = []
+  for res in IterPages(func, project, max_results=max_results,
+                       filter=filter, zone=zone):
+    kind = res.get('kind')
+    items.extend(res.get('items', []))
   return {'kind': kind,
           'items': items}
 
@@ -188,6 +188,27 @@ class AllTests(unittest.TestCase):
     self.assertEqual(utils.All(mockFunc, 'my-project', max_results=5),
                      {'kind': 'numbers', 'items': [1, 2, 3, 4, 5]})
 
+  def testPagingStopsOnceMaxResultsAreFetched(self):
+    responses = [
+        mock_api.MockRequest(
+            {'kind': 'numbers', 'items': [1, 2, 3], 'nextPageToken': 'abc'}),
+        mock_api.MockRequest(
+            {'kind': 'numbers', 'items': [4, 5, 6], 'nextPageToken': 'def'})]
+
+    def mockFunc(project=None, maxResults=None, filter=None, pageToken=None):
+      self._page += 1
+      return responses[self._page - 1]
+
+    self.assertEqual(utils.All(mockFunc, 'my-project', max_results=3),
+                     {'kind': 'numbers', 'items': [1, 2, 3]})
+    self.assertEqual(1, self._page)
+
+    # Pages are only fetched as they are consumed.
+    self._page = 0
+    pages = utils.IterPages(mockFunc, 'my-project')
+    self.assertEqual([1, 2, 3], pages.next()['items'])
+    self.assertEqual(1, self._page)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -23,6 +23,7 @@ the latest version of gcutil.
 import json
 import logging
 import os
+import threading
 import time
 
 import httplib2
@@ -71,6 +72,10 @@ class VersionChecker(object):
     self._cache_path = os.path.expanduser(cache_path)
     self._cache_ttl_sec = cache_ttl_sec
     self._current_version = current_version
+    self._latest_version = None
+    self._new_version_exists = None
+    self._thread = None
+    self._start_time = None
 
   @staticmethod
   def _IsCacheMalformed(cache):
@@ -205,10 +210,22 @@ class VersionChecker(object):
     else:
       LOGGER.debug('Consulting %s for latest version info...', self._cache_path)
 
-    latest_version = cache['last_checked_version']
-    ret = self._CompareVersions(self._current_version, latest_version)
+    self._latest_version = cache['last_checked_version']
+    ret = self._CompareVersions(self._current_version, self._latest_version)
     return ret
 
+  def _WarnIfNewVersion(self, new_version_exists):
+    """Logs a warning if a new version exists."""
+    if new_version_exists:
+      LOGGER.warning(
+          'There is a new version of gcutil available. Go to: %s',
+          SETUP_DOC_URL)
+      LOGGER.warning(
+          'Your version of gcutil is %s, the latest version is %s.',
+          self._current_version, self._latest_version)
+    else:
+      LOGGER.debug('gcutil is up-to-date.')
+
   def CheckForNewVersion(self):
     """Performs the actual check for a new version.
 
@@ -229,18 +246,48 @@ class VersionChecker(object):
     LOGGER.debug('Performing version check...')
 
     try:
-      if self._NewVersionExists():
-        LOGGER.warning(
-            'There is a new version of gcutil available. Go to: %s',
-            SETUP_DOC_URL)
-        LOGGER.warning(
-            'Your version of gcutil is %s, the latest version is %s.',
-            version.__version__, latest_version)
-      else:
-        LOGGER.debug('gcutil is up-to-date.')
+      self._WarnIfNewVersion(self._NewVersionExists())
 
     # So much can go wrong with this code that it's unreasonable to
     # add error handling everywhere hence the "catch-all" exception
     # handling.
     except BaseException as e:
       LOGGER.debug('Version checking failed: %s', e)
+
+  def StartCheckForNewVersion(self):
+    """Starts the check for a new version on a background thread.
+
+    The check then overlaps with the command instead of delaying its
+    exit. ReportNewVersion() reports the outcome.
+    """
+    if not self._perform_check:
+      logging.debug('Skipping version check...')
+      return
+
+    LOGGER.debug('Performing version check in the background...')
+    self._start_time = time.time()
+    self._thread = threading.Thread(target=self._CheckInBackground)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _CheckInBackground(self):
+    """Runs the version check, keeping its outcome for ReportNewVersion."""
+    try:
+      self._new_version_exists = self._NewVersionExists()
+    except BaseException as e:
+      LOGGER.debug('Version checking failed: %s', e)
+
+  def ReportNewVersion(self):
+    """Logs the outcome of the check started by StartCheckForNewVersion.
+
+    The check is given at most TIMEOUT_IN_SEC from its start to finish,
+    so an exiting command never waits for long on it.
+    """
+    if self._thread is None:
+      return
+    self._thread.join(
+        max(0, self._start_time + TIMEOUT_IN_SEC - time.time()))
+    if self._thread.isAlive():
+      LOGGER.debug('Version check did not complete in time.')
+    elif self._new_version_exists is not None:
+      self._WarnIfNewVersion(self._new_version_exists)
@@ -266,6 +266,24 @@ class VersionCheckerTests(unittest.TestCase):
     finally:
       os.remove(cache_file)
 
+  def testCheckForNewVersionInBackground(self):
+    reported = []
+
+    vc = version_checker.VersionChecker(
+        perform_check=True, current_version='1.2.0')
+    vc._NewVersionExists = lambda: True
+    vc._WarnIfNewVersion = reported.append
+    vc.StartCheckForNewVersion()
+    vc.ReportNewVersion()
+    self.assertEqual([True], reported)
+
+    vc = version_checker.VersionChecker(perform_check=False)
+    vc._NewVersionExists = lambda: self.fail('Version check was performed.')
+    vc._WarnIfNewVersion = reported.append
+    vc.StartCheckForNewVersion()
+    vc.ReportNewVersion()
+    self.assertEqual([True], reported)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -120,30 +120,46 @@ class ListZones(ZoneCommand, command_base.GoogleComputeListCommand):
     return self._zones_api.list
 
   def Handle(self):
-    """List the project's zones."""
+    """List the project's zones.
+
+    Streamed items are annotated as they are printed, as they can only be
+    read once.
+    """
     result = super(ListZones, self).Handle()
     items = result.get('items', [])
+    if isinstance(items, list):
+      for zone in items:
+        self._AnnotateZone(zone)
+    else:
+      result['items'] = (self._AnnotateZone(zone) for zone in items)
+    return result
 
-    # Add the next maintenance window start time to each entry.
-    for zone in items:
-      next_iso = None
-      next_str = 'None scheduled'
-
-      for window in zone.get('maintenanceWindows', []):
-        begin_str = window['beginTime']
-        begin_iso = iso8601.parse_date(begin_str)
-        if next_iso is None or begin_iso < next_iso:
-          next_iso = begin_iso
-          next_str = begin_str
-
-      zone['next_maintenance_window'] = next_str
+  def _AnnotateZone(self, zone):
+    """Adds the next maintenance window and the quota columns to a zone.
 
-      for quota in zone.get('quotas', []):
-        column_name = quota['metric'].lower()
-        zone[column_name] = (
-            '%s/%s' % (str(quota['usage']), str(quota['limit'])))
+    Args:
+      zone: The zone resource to annotate.
 
-    return result
+    Returns:
+      The annotated zone.
+    """
+    next_iso = None
+    next_str = 'None scheduled'
+
+    for window in zone.get('maintenanceWindows', []):
+      begin_str = window['beginTime']
+      begin_iso = iso8601.parse_date(begin_str)
+      if next_iso is None or begin_iso < next_iso:
+        next_iso = begin_iso
+        next_str = begin_str
+
+    zone['next_maintenance_window'] = next_str
+
+    for quota in zone.get('quotas', []):
+      column_name = quota['metric'].lower()
+      zone[column_name] = (
+          '%s/%s' % (str(quota['usage']), str(quota['limit'])))
+    return zone
 
 
 def AddCommands():
@@ -22,6 +22,8 @@ import path_initializer
 path_initializer.InitializeSysPath()
 
 import copy
+import json
+import sys
 
 import gflags as flags
 import unittest
@@ -55,6 +57,54 @@ class ZoneCmdsTest(unittest.TestCase):
 
     self.assertEqual(result['zone'], submitted_full_zone)
 
+  def _PrintListZones(self, flag_values):
+    """Runs listzones, returning its printed output."""
+    command = zone_cmds.ListZones('listzones', flag_values)
+    flag_values.project = 'p'
+    flag_values.service_version = command_base.CURRENT_VERSION
+    command.SetFlags(flag_values)
+    command.SetApi(mock_api.MockApi())
+    command._GetZones = lambda: ['zone-a']
+    zone = {'name': 'zone-a',
+            'status': 'UP',
+            'maintenanceWindows': [
+                {'beginTime': '2013-02-01T00:00:00.000'},
+                {'beginTime': '2013-01-01T00:00:00.000'}],
+            'quotas': [{'metric': 'CPUS', 'usage': 1.0, 'limit': 24.0}]}
+    command.ListFunc = lambda: lambda **unused_kwargs: mock_api.MockRequest(
+        {'kind': 'compute#zoneList', 'items': [zone]})
+
+    mock_output = mock_api.MockOutput()
+    oldout = sys.stdout
+    sys.stdout = mock_output
+    try:
+      command.PrintResult(command.Handle())
+    finally:
+      sys.stdout = oldout
+    return mock_output.GetCapturedText()
+
+  def testListZonesAnnotatesStreamedZones(self):
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.format = 'names'
+    self.assertEqual('zone-a\n', self._PrintListZones(flag_values))
+
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.format = 'csv'
+    self.assertEqual(
+        'name,description,status,next-maintenance-window,instances-usage,'
+        'cpus-usage,disks-usage,disks-total-gb-usage\n'
+        'zone-a,,UP,2013-01-01T00:00:00.000,,1.0/24.0,,\n',
+        self._PrintListZones(flag_values))
+
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.format = 'json'
+    zones = json.loads(self._PrintListZones(flag_values))['items']
+    self.assertEqual(['zone-a'], [zone['name'] for zone in zones])
+    self.assertEqual('2013-01-01T00:00:00.000',
+                     zones[0]['next_maintenance_window'])
+    self.assertEqual('1.0/24.0', zones[0]['cpus'])
+
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -32,7 +32,6 @@ import platform
 import re
 import sys
 import logging
-import logging.config
 import urlparse
 from boto.exception import InvalidUriError
 
@@ -52,6 +51,11 @@ VERSION_RE = re.compile('(?P<versionless_uri_str>.+)#(?P<version_id>.+)$')
 
 
 def init_logging():
+    # Logging can only be configured from files with a formatters section,
+    # so logging.config is not imported when no config file has one.
+    if not config.has_section('formatters'):
+        return
+    import logging.config
     for file in BotoConfigLocations:
         try:
             logging.config.fileConfig(os.path.expanduser(file))
@@ -789,5 +793,3 @@ def storage_uri_for_key(key):
     prov_name = key.bucket.connection.provider.get_provider_name()
     uri_str = '%s://%s/%s' % (prov_name, key.bucket.name, key.name)
     return storage_uri(uri_str)
-
-boto.plugin.load_plugins(config)
@@ -83,10 +83,12 @@ class HmacKeys(object):
 
     def update_provider(self, provider):
         self._provider = provider
-        self._hmac = hmac.new(self._provider.secret_key, digestmod=sha)
+        # The keyed contexts are copied for each signature rather than
+        # keyed again, and rebuilt if the provider's keys are refreshed.
+        self._hmac_key = self._provider.secret_key
+        self._hmac = hmac.new(self._hmac_key, digestmod=sha)
         if sha256:
-            self._hmac_256 = hmac.new(self._provider.secret_key,
-                                      digestmod=sha256)
+            self._hmac_256 = hmac.new(self._hmac_key, digestmod=sha256)
         else:
             self._hmac_256 = None
 
@@ -97,12 +99,18 @@ class HmacKeys(object):
             return 'HmacSHA1'
 
     def _get_hmac(self):
+        key = self._provider.secret_key
+        if key != self._hmac_key:
+            # The provider's keys were refreshed since the contexts were
+            # keyed.
+            self._hmac_key = key
+            self._hmac = hmac.new(key, digestmod=sha)
+            if self._hmac_256:
+                self._hmac_256 = hmac.new(key, digestmod=sha256)
         if self._hmac_256:
-            digestmod = sha256
+            return self._hmac_256.copy()
         else:
-            digestmod = sha
-        return hmac.new(self._provider.secret_key,
-                        digestmod=digestmod)
+            return self._hmac.copy()
 
     def sign_string(self, string_to_sign):
         new_hmac = self._get_hmac()
@@ -113,6 +121,7 @@ class HmacKeys(object):
         pickled_dict = copy.copy(self.__dict__)
         del pickled_dict['_hmac']
         del pickled_dict['_hmac_256']
+        del pickled_dict['_hmac_key']
         return pickled_dict
 
     def __setstate__(self, dct):
@@ -306,6 +315,10 @@ class HmacAuthV4Handler(AuthHandler, HmacKeys):
 
     capability = ['hmac-v4']
 
+    # The number of signing keys kept.  A key only changes once a day for
+    # each region and service, so few are ever in use at once.
+    SIGNING_KEY_CACHE_SIZE = 16
+
     def __init__(self, host, config, provider,
                  service_name=None, region_name=None):
         AuthHandler.__init__(self, host, config, provider)
@@ -316,6 +329,15 @@ class HmacAuthV4Handler(AuthHandler, HmacKeys):
         self.service_name = service_name
         self.region_name = region_name
 
+    def update_provider(self, provider):
+        HmacKeys.update_provider(self, provider)
+        self._signing_keys = {}
+
+    def __getstate__(self):
+        pickled_dict = HmacKeys.__getstate__(self)
+        del pickled_dict['_signing_keys']
+        return pickled_dict
+
     def _sign(self, key, msg, hex=False):
         if hex:
             sig = hmac.new(key, msg.encode('utf-8'), sha256).hexdigest()
@@ -444,14 +466,32 @@ class HmacAuthV4Handler(AuthHandler, HmacKeys):
         sts.append(sha256(canonical_request).hexdigest())
         return '\n'.join(sts)
 
-    def signature(self, http_request, string_to_sign):
+    def signing_hmac(self, http_request):
+        """
+        Return an HMAC context keyed with the signing key for the date,
+        region and service of the request.  The context is derived once
+        and cached, so copy it before updating it.
+        """
         key = self._provider.secret_key
-        k_date = self._sign(('AWS4' + key).encode('utf-8'),
-                              http_request.timestamp)
-        k_region = self._sign(k_date, http_request.region_name)
-        k_service = self._sign(k_region, http_request.service_name)
-        k_signing = self._sign(k_service, 'aws4_request')
-        return self._sign(k_signing, string_to_sign, hex=True)
+        cache_key = (key, http_request.timestamp, http_request.region_name,
+                     http_request.service_name)
+        signing_hmac = self._signing_keys.get(cache_key)
+        if signing_hmac is None:
+            k_date = self._sign(('AWS4' + key).encode('utf-8'),
+                                  http_request.timestamp)
+            k_region = self._sign(k_date, http_request.region_name)
+            k_service = self._sign(k_region, http_request.service_name)
+            k_signing = self._sign(k_service, 'aws4_request')
+            signing_hmac = hmac.new(k_signing, digestmod=sha256)
+            if len(self._signing_keys) >= self.SIGNING_KEY_CACHE_SIZE:
+                self._signing_keys.clear()
+            self._signing_keys[cache_key] = signing_hmac
+        return signing_hmac
+
+    def signature(self, http_request, string_to_sign):
+        sig = self.signing_hmac(http_request).copy()
+        sig.update(string_to_sign.encode('utf-8'))
+        return sig.hexdigest()
 
     def add_auth(self, req, **kwargs):
         """
@@ -45,6 +45,7 @@ Handles basic connections to AWS
 
 from __future__ import with_statement
 import base64
+import collections
 import errno
 import httplib
 import os
@@ -56,6 +57,7 @@ import sys
 import time
 import urllib
 import urlparse
+import weakref
 import xml.sax
 import copy
 
@@ -101,20 +103,25 @@ class HostConnectionPool(object):
     """
     A pool of connections for one remote (host,is_secure).
 
-    When connections are added to the pool, they are put into a
-    pending queue.  The _mexe method returns connections to the pool
-    before the response body has been read, so they connections aren't
-    ready to send another request yet.  They stay in the pending queue
-    until they are ready for another request, at which point they are
-    returned to the pool of ready connections.
-
-    The pool of ready connections is an ordered list of
-    (connection,time) pairs, where the time is the time the connection
-    was returned from _mexe.  After a certain period of time,
-    connections are considered stale, and discarded rather than being
-    reused.  This saves having to wait for the connection to time out
-    if AWS has decided to close it on the other end because of
-    inactivity.
+    When connections are added to the pool, they may not be ready to
+    send another request yet: the _mexe method returns connections to
+    the pool before the response body has been read.  Connections that
+    aren't ready are skipped by get() until they are.
+
+    The pool is a deque of (connection,time) pairs, where the time is
+    the time the connection was returned from _mexe, so the oldest
+    connections are at the left end.  Connections are reused from the
+    right end, most recently returned first, which keeps the number of
+    connections in use small and lets the others age out.  After a
+    certain period of time, connections are considered stale, and
+    discarded rather than being reused.  This saves having to wait for
+    the connection to time out if AWS has decided to close it on the
+    other end because of inactivity.
+
+    Connections discarded because they are stale or beyond the maximum
+    size of the pool are closed once they are ready, as somebody may
+    still be reading a response from them.  The number of connections
+    discarded is counted in the evicted attribute.
 
     Thread Safety:
 
@@ -122,8 +129,12 @@ class HostConnectionPool(object):
         is held.
     """
 
-    def __init__(self):
-        self.queue = []
+    def __init__(self, max_size=None):
+        self.queue = collections.deque()
+        self.max_size = max_size
+        # Discarded connections that are not ready to be closed yet.
+        self.closing = []
+        self.evicted = 0
 
     def size(self):
         """
@@ -136,29 +147,33 @@ class HostConnectionPool(object):
     def put(self, conn):
         """
         Adds a connection to the pool, along with the time it was
-        added.
+        added.  The oldest connections are discarded to keep the pool
+        within its maximum size.
         """
         self.queue.append((conn, time.time()))
+        while self.max_size and len(self.queue) > self.max_size:
+            (evicted, _) = self.queue.popleft()
+            self._discard(evicted)
 
     def get(self):
         """
-        Returns the next connection in this pool that is ready to be
-        reused.  Returns None of there aren't any.
+        Returns the most recently returned connection in this pool that
+        is ready to be reused.  Returns None of there aren't any.
         """
-        # Discard ready connections that are too old.
-        self.clean()
-
-        # Return the first connection that is ready, and remove it
-        # from the queue.  Connections that aren't ready are returned
-        # to the end of the queue with an updated time, on the
-        # assumption that somebody is actively reading the response.
-        for _ in range(len(self.queue)):
-            (conn, _) = self.queue.pop(0)
-            if self._conn_ready(conn):
-                return conn
-            else:
-                self.put(conn)
-        return None
+        # Connections that aren't ready are put back with an updated
+        # time, on the assumption that somebody is actively reading the
+        # response.
+        not_ready = []
+        conn = None
+        while self.queue:
+            (candidate, _) = self.queue.pop()
+            if self._conn_ready(candidate):
+                conn = candidate
+                break
+            not_ready.append(candidate)
+        for candidate in reversed(not_ready):
+            self.put(candidate)
+        return conn
 
     def _conn_ready(self, conn):
         """
@@ -185,12 +200,35 @@ class HostConnectionPool(object):
 
     def clean(self):
         """
-        Get rid of stale connections.
+        Get rid of stale connections, and close the discarded ones that
+        have become ready.
         """
-        # Note that we do not close the connection here -- somebody
-        # may still be reading from it.
         while len(self.queue) > 0 and self._pair_stale(self.queue[0]):
-            self.queue.pop(0)
+            (evicted, _) = self.queue.popleft()
+            self._discard(evicted)
+        closing = self.closing
+        self.closing = []
+        for conn in closing:
+            self._close_when_ready(conn)
+
+    def _discard(self, conn):
+        """
+        Counts a connection discarded from the pool, and closes it once
+        it is ready.
+        """
+        self.evicted += 1
+        self._close_when_ready(conn)
+
+    def _close_when_ready(self, conn):
+        """
+        Closes the connection if it is ready, or keeps it to be closed
+        by a later clean() otherwise.  On App Engine connections are
+        never ready, and are left to the garbage collector instead.
+        """
+        if self._conn_ready(conn):
+            conn.close()
+        elif not ON_APP_ENGINE:
+            self.closing.append(conn)
 
     def _pair_stale(self, pair):
         """
@@ -209,6 +247,20 @@ class ConnectionPool(object):
     time.  This saves time spent waiting for a connection that AWS has
     timed out on the other end.
 
+    The pool counts the connections in use for each host: those reused
+    from it or created for it that have not been returned to it or
+    closed yet.  While max_connections_per_host connections are in use
+    for a host, getting another waits up to wait_timeout seconds for one
+    to be returned; after that another connection is created anyway.
+    At most max_connections_per_host connections are kept for each host
+    once returned; connections returned beyond that replace the oldest
+    ones.  A thread discards the stale connections every CLEAN_INTERVAL
+    seconds while there are connections in the pool.
+
+    The pool counts the connections created for it, reused from it and
+    evicted from it, and the time spent waiting for connections; see
+    stats().
+
     This class is thread-safe.
     """
 
@@ -231,25 +283,68 @@ class ConnectionPool(object):
 
     STALE_DURATION = 60.0
 
-    def __init__(self):
+    #
+    # The maximum number of connections in use and kept for each host.
+    # 0 means no limit.
+    #
+
+    MAX_CONNECTIONS_PER_HOST = 20
+
+    #
+    # Connections in use are referred to weakly, so that a connection
+    # dropped without being returned or closed stops counting once it is
+    # garbage collected.  As nothing notifies threads waiting for a
+    # connection of that, they check again this often, in seconds.
+    #
+
+    WAIT_POLL_INTERVAL = 1.0
+
+    def __init__(self, max_connections_per_host=None, wait_timeout=None):
         # Mapping from (host,is_secure) to HostConnectionPool.
         # If a pool becomes empty, it is removed.
         self.host_to_pool = {}
+        # Mapping from (host,is_secure) to the connections in use, and
+        # to the number of connections that get_http_connection() has
+        # told callers to create but that have not been created yet.
+        self.host_to_in_use = {}
+        self.host_to_pending = {}
         # The last time the pool was cleaned.
         self.last_clean_time = 0.0
         self.mutex = threading.Lock()
+        # Notified when a connection is returned to the pool or closed.
+        self.connection_returned = threading.Condition(self.mutex)
+        self.clean_thread = None
         ConnectionPool.STALE_DURATION = \
             config.getfloat('Boto', 'connection_stale_duration',
                             ConnectionPool.STALE_DURATION)
+        if max_connections_per_host is None:
+            max_connections_per_host = config.getint(
+                'Boto', 'max_connections_per_host',
+                ConnectionPool.MAX_CONNECTIONS_PER_HOST)
+        self.max_connections_per_host = max_connections_per_host
+        if wait_timeout is None:
+            wait_timeout = config.getfloat('Boto', 'connection_wait_timeout',
+                                           0.0)
+        self.wait_timeout = wait_timeout
+        self.created = 0
+        self.reused = 0
+        # Connections evicted by host pools that have since been removed.
+        self.evicted = 0
+        self.wait_time = 0.0
 
     def __getstate__(self):
         pickled_dict = copy.copy(self.__dict__)
         pickled_dict['host_to_pool'] = {}
+        pickled_dict['host_to_in_use'] = {}
+        pickled_dict['host_to_pending'] = {}
         del pickled_dict['mutex']
+        del pickled_dict['connection_returned']
+        del pickled_dict['clean_thread']
         return pickled_dict
 
     def __setstate__(self, dct):
-        self.__init__()
+        self.__init__(dct.get('max_connections_per_host'),
+                      dct.get('wait_timeout'))
 
     def size(self):
         """
@@ -257,19 +352,91 @@ class ConnectionPool(object):
         """
         return sum(pool.size() for pool in self.host_to_pool.values())
 
-    def get_http_connection(self, host, is_secure):
+    def in_use(self, host, is_secure):
+        """
+        Returns the number of connections in use for the named host,
+        including those get_http_connection() has told callers to
+        create.
+        """
+        with self.mutex:
+            return self._in_use((host, is_secure))
+
+    def _in_use(self, key):
+        return (len(self.host_to_in_use.get(key, ())) +
+                self.host_to_pending.get(key, 0))
+
+    def _at_limit(self, key):
+        return (self.max_connections_per_host and
+                self._in_use(key) >= self.max_connections_per_host)
+
+    def stats(self):
+        """
+        Returns a dict of the number of connections created, reused and
+        evicted, the total seconds spent waiting for connections, and
+        the number of connections in the pool.
+        """
+        with self.mutex:
+            evicted = self.evicted + sum(
+                pool.evicted for pool in self.host_to_pool.values())
+            return {'created': self.created,
+                    'reused': self.reused,
+                    'evicted': evicted,
+                    'wait_time': self.wait_time,
+                    'size': self.size()}
+
+    def get_http_connection(self, host, is_secure, timeout=None):
         """
         Gets a connection from the pool for the named host.  Returns
-        None if there is no connection that can be reused. It's the caller's
-        responsibility to call close() on the connection when it's no longer
-        needed.
+        None if there is no connection that can be reused, in which case
+        the caller must create one and pass it to connection_created(),
+        or call connection_closed() if it could not.  It's the caller's
+        responsibility to return the connection with put_http_connection()
+        or to close it and call connection_closed().
+
+        While max_connections_per_host connections are in use for the
+        host, waits up to timeout seconds (default is the pool's
+        wait_timeout) for one to be returned to the pool or closed.
+        Waiting lets bursts of requests share a bounded number of
+        connections rather than each opening a connection of its own.
+        If the wait times out, None is returned anyway.
         """
-        self.clean()
+        if timeout is None:
+            timeout = self.wait_timeout
+        if not self._cleaning():
+            # There is no thread to clean the pool.
+            self.clean()
+        key = (host, is_secure)
         with self.mutex:
-            key = (host, is_secure)
-            if key not in self.host_to_pool:
-                return None
-            return self.host_to_pool[key].get()
+            conn = self._get(key)
+            if conn is None and self._at_limit(key) and timeout > 0:
+                start = time.time()
+                deadline = start + timeout
+                now = start
+                while conn is None and self._at_limit(key) and now < deadline:
+                    self.connection_returned.wait(
+                        min(deadline - now, self.WAIT_POLL_INTERVAL))
+                    conn = self._get(key)
+                    now = time.time()
+                self.wait_time += now - start
+            if conn is not None:
+                self.reused += 1
+                self.host_to_in_use.setdefault(
+                    key, weakref.WeakKeyDictionary())[conn] = True
+                return conn
+            if self._at_limit(key):
+                if timeout > 0:
+                    log = boto.log.warning
+                else:
+                    log = boto.log.debug
+                log('%d connections to %s are in use, creating another.',
+                    self._in_use(key), host)
+            self.host_to_pending[key] = self.host_to_pending.get(key, 0) + 1
+            return None
+
+    def _get(self, key):
+        if key not in self.host_to_pool:
+            return None
+        return self.host_to_pool[key].get()
 
     def put_http_connection(self, host, is_secure, conn):
         """
@@ -278,17 +445,71 @@ class ConnectionPool(object):
         """
         with self.mutex:
             key = (host, is_secure)
+            self._release(key, conn)
             if key not in self.host_to_pool:
-                self.host_to_pool[key] = HostConnectionPool()
+                self.host_to_pool[key] = HostConnectionPool(
+                    self.max_connections_per_host)
             self.host_to_pool[key].put(conn)
+            if not self._cleaning() and not ON_APP_ENGINE:
+                self.clean_thread = threading.Thread(
+                    target=_clean_pool, args=(weakref.ref(self),))
+                self.clean_thread.daemon = True
+                self.clean_thread.start()
+
+    def _release(self, key, conn):
+        """
+        Stops counting a connection as in use, or if conn is None, a
+        connection that was to be created but was not.  Wakes the
+        threads waiting for a connection; waiters for other hosts are
+        woken too, so all of them are.
+        """
+        if conn is None:
+            if self.host_to_pending.get(key):
+                self.host_to_pending[key] -= 1
+        else:
+            in_use = self.host_to_in_use.get(key)
+            if in_use is not None:
+                in_use.pop(conn, None)
+                if not in_use:
+                    del self.host_to_in_use[key]
+        self.connection_returned.notifyAll()
+
+    def _cleaning(self):
+        """
+        Returns true if a thread is cleaning the pool.  The thread does
+        not survive a fork.
+        """
+        return self.clean_thread is not None and self.clean_thread.isAlive()
+
+    def connection_created(self, host, is_secure, conn):
+        """
+        Counts a connection created because none could be reused, and
+        counts it as in use for the named host.
+        """
+        with self.mutex:
+            key = (host, is_secure)
+            self.created += 1
+            if self.host_to_pending.get(key):
+                self.host_to_pending[key] -= 1
+            self.host_to_in_use.setdefault(
+                key, weakref.WeakKeyDictionary())[conn] = True
+
+    def connection_closed(self, host, is_secure, conn=None):
+        """
+        Stops counting a connection to the named host that was closed
+        instead of being returned to the pool as in use.  conn is None
+        if get_http_connection() returned None and the caller could not
+        create a connection.
+        """
+        with self.mutex:
+            self._release((host, is_secure), conn)
 
     def clean(self):
         """
         Clean up the stale connections in all of the pools, and then
-        get rid of empty pools.  Pools clean themselves every time a
-        connection is fetched; this cleaning takes care of pools that
-        aren't being used any more, so nothing is being gotten from
-        them.
+        get rid of empty pools.  This is called periodically by the
+        pool's cleaning thread, or when a connection is fetched if there
+        is no such thread.
         """
         with self.mutex:
             now = time.time()
@@ -296,13 +517,39 @@ class ConnectionPool(object):
                 to_remove = []
                 for (host, pool) in self.host_to_pool.items():
                     pool.clean()
-                    if pool.size() == 0:
+                    if pool.size() == 0 and not pool.closing:
                         to_remove.append(host)
                 for host in to_remove:
-                    del self.host_to_pool[host]
+                    self.evicted += self.host_to_pool.pop(host).evicted
                 self.last_clean_time = now
 
 
+def _clean_pool(pool_ref):
+    """
+    Cleans the pool referred to by pool_ref every CLEAN_INTERVAL seconds,
+    until it is empty or garbage collected.  The pool is only referred to
+    weakly, so that the thread does not keep it alive.
+    """
+    while True:
+        pool = pool_ref()
+        if pool is None:
+            return
+        interval = pool.CLEAN_INTERVAL
+        del pool
+        time.sleep(interval)
+        pool = pool_ref()
+        if pool is None:
+            return
+        pool.clean()
+        with pool.mutex:
+            if not pool.host_to_pool:
+                # The next connection put into the pool starts another
+                # thread.
+                pool.clean_thread = None
+                return
+        del pool
+
+
 class HTTPRequest(object):
 
     def __init__(self, method, protocol, host, port, path, auth_path,
@@ -673,10 +920,14 @@ class AWSAuthConnection(object):
         conn = self._pool.get_http_connection(host, is_secure)
         if conn is not None:
             return conn
-        else:
+        try:
             return self.new_http_connection(host, is_secure)
+        except:
+            self._pool.connection_closed(host, is_secure)
+            raise
 
     def new_http_connection(self, host, is_secure):
+        pool_host = host
         if self.use_proxy and not is_secure:
             host = '%s:%d' % (self.proxy, int(self.proxy_port))
         if host is None:
@@ -717,11 +968,16 @@ class AWSAuthConnection(object):
         # Set the response class of the http connection to use our custom
         # class.
         connection.response_class = HTTPResponse
+        self._pool.connection_created(pool_host, is_secure, connection)
         return connection
 
     def put_http_connection(self, host, is_secure, connection):
         self._pool.put_http_connection(host, is_secure, connection)
 
+    def close_http_connection(self, host, is_secure, connection):
+        connection.close()
+        self._pool.connection_closed(host, is_secure, connection)
+
     def proxy_ssl(self, host=None, port=None):
         if host and port:
             host = '%s:%d' % (host, port)
@@ -819,7 +1075,8 @@ class AWSAuthConnection(object):
         else:
             num_retries = override_num_retries
         i = 0
-        connection = self.get_http_connection(request.host, self.is_secure)
+        conn_host, conn_secure = request.host, self.is_secure
+        connection = self.get_http_connection(conn_host, conn_secure)
         while i <= num_retries:
             # Use binary exponential backoff to desynchronize client requests.
             next_sleep = random.random() * (2 ** i)
@@ -856,7 +1113,7 @@ class AWSAuthConnection(object):
                     body = response.read()
                 elif response.status < 300 or response.status >= 400 or \
                         not location:
-                    self.put_http_connection(request.host, self.is_secure,
+                    self.put_http_connection(conn_host, conn_secure,
                                              connection)
                     return response
                 else:
@@ -867,8 +1124,11 @@ class AWSAuthConnection(object):
                     msg = 'Redirecting: %s' % scheme + '://'
                     msg += request.host + request.path
                     boto.log.debug(msg)
-                    connection = self.get_http_connection(request.host,
-                                                          scheme == 'https')
+                    self.close_http_connection(conn_host, conn_secure,
+                                               connection)
+                    conn_host, conn_secure = request.host, scheme == 'https'
+                    connection = self.get_http_connection(conn_host,
+                                                          conn_secure)
                     response = None
                     continue
             except self.http_exceptions, e:
@@ -877,17 +1137,23 @@ class AWSAuthConnection(object):
                         boto.log.debug(
                             'encountered unretryable %s exception, re-raising' %
                             e.__class__.__name__)
+                        self.close_http_connection(conn_host, conn_secure,
+                                                   connection)
                         raise e
                 boto.log.debug('encountered %s exception, reconnecting' % \
                                   e.__class__.__name__)
-                connection = self.new_http_connection(request.host,
-                                                      self.is_secure)
+                self.close_http_connection(conn_host, conn_secure, connection)
+                connection = self.new_http_connection(conn_host, conn_secure)
+            except:
+                self.close_http_connection(conn_host, conn_secure, connection)
+                raise
             time.sleep(next_sleep)
             i += 1
         # If we made it here, it's because we have exhausted our retries
         # and stil haven't succeeded.  So, if we have a response object,
         # use it to raise an exception.
         # Otherwise, raise the exception that must have already h#appened.
+        self.close_http_connection(conn_host, conn_secure, connection)
         if response:
             raise BotoServerError(response.status, response.reason, body)
         elif e:
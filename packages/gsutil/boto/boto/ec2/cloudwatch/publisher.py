@@ -0,0 +1,237 @@
+# Copyright (c) 2013 Amazon.com, Inc. or its affiliates.
+# All Rights Reserved
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+import datetime
+import threading
+
+import boto
+
+
+class StatisticSet(object):
+    """
+    The running samplecount/sum/minimum/maximum of the values put for
+    one metric during a flush interval.
+    """
+
+    __slots__ = ('samplecount', 'sum', 'minimum', 'maximum')
+
+    def __init__(self, value):
+        self.samplecount = 1
+        self.sum = value
+        self.minimum = value
+        self.maximum = value
+
+    def add(self, value):
+        self.samplecount += 1
+        self.sum += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def as_dict(self):
+        """
+        Return the statistics in the form expected by the statistics
+        argument of :meth:`CloudWatchConnection.put_metric_data`.
+        """
+        return {'samplecount': self.samplecount, 'sum': self.sum,
+                'minimum': self.minimum, 'maximum': self.maximum}
+
+
+def _dimensions_key(dimensions):
+    if not dimensions:
+        return ()
+    key = []
+    for name, value in sorted(dimensions.iteritems()):
+        if isinstance(value, list):
+            value = tuple(value)
+        key.append((name, value))
+    return tuple(key)
+
+
+class MetricPublisher(object):
+    """
+    Publishes metric data to CloudWatch in batches from a background
+    thread.
+
+    Values passed to :meth:`put` are aggregated in memory into one
+    statistic set per (namespace, metric name, unit, dimensions).  Every
+    ``flush_interval`` seconds the statistic sets are packed into
+    PutMetricData requests of up to ``MaxMetricsPerRequest`` metrics and
+    sent, so the caller never waits on CloudWatch and thousands of
+    values per second cost a handful of requests per interval.
+
+    At most ``max_metrics`` distinct metrics are kept per interval.
+    Values for new metrics beyond that limit, and values in requests
+    that fail, are dropped and counted in ``dropped``.
+
+    Usage::
+
+        publisher = MetricPublisher(boto.connect_cloudwatch())
+        publisher.start()
+        publisher.put('MyService', 'Latency', 0.25, unit='Seconds',
+                      dimensions={'Operation': 'GetItem'})
+        ...
+        publisher.stop()
+    """
+
+    MaxMetricsPerRequest = 20
+
+    def __init__(self, connection, flush_interval=60, max_metrics=1000):
+        """
+        :type connection: :class:`boto.ec2.cloudwatch.CloudWatchConnection`
+        :param connection: The connection used to put the metric data.
+
+        :type flush_interval: int
+        :param flush_interval: Number of seconds over which values are
+            aggregated before they are sent.
+
+        :type max_metrics: int
+        :param max_metrics: The maximum number of distinct metrics held
+            in memory during an interval.
+        """
+        self.connection = connection
+        self.flush_interval = flush_interval
+        self.max_metrics = max_metrics
+        self.dropped = 0
+        self.requests_sent = 0
+        self.requests_failed = 0
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._timestamp = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def put(self, namespace, name, value, unit=None, dimensions=None):
+        """
+        Add a value for a metric to the current interval.
+
+        :type namespace: str
+        :param namespace: The namespace of the metric.
+
+        :type name: str
+        :param name: The name of the metric.
+
+        :type value: float
+        :param value: The value for the metric.
+
+        :type unit: str
+        :param unit: The unit of the metric, see
+            :meth:`CloudWatchConnection.put_metric_data`.
+
+        :type dimensions: dict
+        :param dimensions: Extra name value pairs to associate with
+            the metric.
+
+        :rtype: bool
+        :return: False if the value was dropped because ``max_metrics``
+            metrics are already held for this interval.
+        """
+        key = (namespace, name, unit, _dimensions_key(dimensions))
+        self._lock.acquire()
+        try:
+            metric = self._metrics.get(key)
+            if metric is not None:
+                metric[0].add(value)
+                return True
+            if len(self._metrics) >= self.max_metrics:
+                self.dropped += 1
+                return False
+            if self._timestamp is None:
+                self._timestamp = datetime.datetime.utcnow()
+            self._metrics[key] = (StatisticSet(value), dimensions)
+            return True
+        finally:
+            self._lock.release()
+
+    def flush(self):
+        """
+        Send the statistics aggregated so far, in the calling thread.
+        """
+        self._lock.acquire()
+        try:
+            metrics, self._metrics = self._metrics, {}
+            timestamp, self._timestamp = self._timestamp, None
+        finally:
+            self._lock.release()
+        by_namespace = {}
+        for key, (statistics, dimensions) in metrics.iteritems():
+            namespace, name, unit = key[:3]
+            by_namespace.setdefault(namespace, []).append(
+                (name, unit, dimensions, statistics))
+        for namespace, items in by_namespace.iteritems():
+            for i in xrange(0, len(items), self.MaxMetricsPerRequest):
+                self._send(namespace, timestamp,
+                           items[i:i + self.MaxMetricsPerRequest])
+
+    def _send(self, namespace, timestamp, items):
+        names, units, dimensions, statistics = zip(*items)
+        try:
+            # A missing unit is sent as CloudWatch's own "None" unit.
+            self.connection.put_metric_data(
+                namespace, list(names), timestamp=timestamp,
+                unit=[u or 'None' for u in units],
+                dimensions=[d or {} for d in dimensions],
+                statistics=[s.as_dict() for s in statistics])
+        except Exception, e:
+            boto.log.error('Failed to put %d metrics in namespace %s: %s' %
+                           (len(items), namespace, e))
+            self._lock.acquire()
+            try:
+                self.requests_failed += 1
+                self.dropped += sum(s.samplecount for s in statistics)
+            finally:
+                self._lock.release()
+            return
+        self._lock.acquire()
+        try:
+            self.requests_sent += 1
+        finally:
+            self._lock.release()
+
+    def start(self):
+        """
+        Start the background thread that flushes every flush_interval.
+        """
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, flush=True):
+        """
+        Stop the background thread and, by default, send what is left.
+        """
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
+
+    def _run(self):
+        while not self._stopped.isSet():
+            self._stopped.wait(self.flush_interval)
+            if not self._stopped.isSet():
+                self.flush()
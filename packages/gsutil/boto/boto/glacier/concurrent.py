@@ -28,21 +28,120 @@ import logging
 from Queue import Queue, Empty
 import binascii
 
-from .utils import DEFAULT_PART_SIZE, minimum_part_size, chunk_hashes, \
-        tree_hash, bytes_to_hex
+from boto.compat import json
+from .utils import DEFAULT_PART_SIZE, minimum_part_size, tree_hash, \
+        bytes_to_hex, compute_hashes_from_part
 from .exceptions import UploadArchiveError, DownloadArchiveError, \
         TreeHashDoesNotMatchError
 
 
 _END_SENTINEL = object()
+_ONE_MEGABYTE = 1024 * 1024
 log = logging.getLogger('boto.glacier.concurrent')
 
 
+class _TransferTracker(object):
+    """Persist the part-level state of a concurrent transfer.
+
+    The first line of the tracker file is a JSON header describing the
+    transfer (upload id or job id, part size and total size) and the
+    local file it reads or writes.  Each
+    completed part is then appended as a ``<part_number> <tree_hash>``
+    line, so recording progress never rewrites the file.
+
+    When no tracker file name is given, state is only kept in memory.
+
+    """
+    def __init__(self, tracker_file_name=None):
+        self.tracker_file_name = tracker_file_name
+        self.header = None
+        self.completed_parts = {}
+        self._fileobj = None
+
+    def load(self, **expected):
+        """Load the state of a previous transfer from the tracker file.
+
+        :return: The saved header if the tracker file exists and every
+            key in ``expected`` matches it, otherwise None (in which case
+            the transfer has to be restarted).
+
+        """
+        if not (self.tracker_file_name and
+                os.path.exists(self.tracker_file_name)):
+            return None
+        completed_parts = {}
+        try:
+            with open(self.tracker_file_name, 'r') as f:
+                header = json.loads(f.readline())
+                for line in f:
+                    fields = line.split()
+                    # A crash can leave a partially written last line.
+                    if len(fields) != 2:
+                        continue
+                    completed_parts[int(fields[0])] = \
+                            binascii.unhexlify(fields[1])
+        except (IOError, ValueError, TypeError), e:
+            log.warning("Couldn't read tracker file %s (%s), restarting "
+                        "transfer.", self.tracker_file_name, e)
+            return None
+        for key, value in expected.iteritems():
+            if header.get(key) != value:
+                log.debug("Tracker file %s does not match this transfer "
+                          "(%s: %s != %s), restarting transfer.",
+                          self.tracker_file_name, key, header.get(key), value)
+                return None
+        self.header = header
+        self.completed_parts = completed_parts
+        self._fileobj = open(self.tracker_file_name, 'a')
+        return header
+
+    def start(self, **header):
+        """Begin tracking a new transfer, replacing any previous state."""
+        self.close()
+        self.header = header
+        self.completed_parts = {}
+        if self.tracker_file_name:
+            self._fileobj = open(self.tracker_file_name, 'w')
+            self._fileobj.write(json.dumps(header) + '\n')
+            self._fileobj.flush()
+
+    def record(self, part_number, tree_hash_bytes):
+        """Record that a part has been completely transferred."""
+        self.completed_parts[part_number] = tree_hash_bytes
+        if self._fileobj is not None:
+            self._fileobj.write('%d %s\n' % (part_number,
+                                             bytes_to_hex(tree_hash_bytes)))
+            self._fileobj.flush()
+
+    def close(self):
+        if self._fileobj is not None:
+            self._fileobj.close()
+            self._fileobj = None
+
+    def remove(self):
+        """Discard the tracked state once the transfer is finished."""
+        self.close()
+        if (self.tracker_file_name and
+                os.path.exists(self.tracker_file_name)):
+            os.unlink(self.tracker_file_name)
+
+
+def _file_identity(filename):
+    """Describe a local file well enough to tell whether it changed."""
+    st = os.stat(filename)
+    return {'file_name': os.path.abspath(filename),
+            'file_size': st.st_size,
+            'file_mtime': st.st_mtime}
+
+
 class ConcurrentTransferer(object):
-    def __init__(self, part_size=DEFAULT_PART_SIZE, num_threads=10):
+    def __init__(self, part_size=DEFAULT_PART_SIZE, num_threads=10,
+                 tracker_file_name=None):
         self._part_size = part_size
         self._num_threads = num_threads
         self._threads = []
+        self._tracker_file_name = tracker_file_name
+        self._tracker = _TransferTracker(tracker_file_name)
 
     def _calculate_required_part_size(self, total_size):
         min_part_size_required = minimum_part_size(total_size)
@@ -67,6 +166,10 @@ class ConcurrentTransferer(object):
     def _add_work_items_to_queue(self, total_parts, worker_queue, part_size):
         log.debug("Adding work items to queue.")
         for i in xrange(total_parts):
+            # Parts completed by a previous, interrupted transfer
+            # are not transferred again.
+            if i in self._tracker.completed_parts:
+                continue
             worker_queue.put((i, part_size))
         for i in xrange(self._num_threads):
             worker_queue.put(_END_SENTINEL)
@@ -81,9 +184,15 @@ class ConcurrentUploader(ConcurrentTransferer):
     The threadpool is completely managed by this class and is
     transparent to the users of this class.
 
+    If a ``tracker_file_name`` is given, the upload id and the tree hash
+    of every uploaded part are saved to that file as the upload
+    progresses.  Calling ``upload`` again with the same tracker file
+    after a failure or crash resumes the multipart upload, and only
+    the parts that were not yet uploaded are sent.
+
     """
     def __init__(self, api, vault_name, part_size=DEFAULT_PART_SIZE,
-                 num_threads=10):
+                 num_threads=10, tracker_file_name=None):
         """
         :type api: :class:`boto.glacier.layer1.Layer1`
         :param api: A layer1 glacier object.
@@ -96,8 +205,13 @@ class ConcurrentUploader(ConcurrentTransferer):
             the archive parts.  The part size must be a megabyte multiplied by
             a power of two.
 
+        :type tracker_file_name: str
+        :param tracker_file_name: Optional file name used to save the
+            state of the upload so that it can be resumed.
+
         """
-        super(ConcurrentUploader, self).__init__(part_size, num_threads)
+        super(ConcurrentUploader, self).__init__(part_size, num_threads,
+                                                 tracker_file_name)
         self._api = api
         self._vault_name = vault_name
 
@@ -120,15 +234,31 @@ class ConcurrentUploader(ConcurrentTransferer):
         :return: The archive id of the newly created archive.
 
         """
-        total_size = os.stat(filename).st_size
+        file_identity = _file_identity(filename)
+        total_size = file_identity['file_size']
         total_parts, part_size = self._calculate_required_part_size(total_size)
         hash_chunks = [None] * total_parts
         worker_queue = Queue()
         result_queue = Queue()
-        response = self._api.initiate_multipart_upload(self._vault_name,
-                                                       part_size,
-                                                       description)
-        upload_id = response['UploadId']
+        # A tracker file left by another file, or by this file before it
+        # was changed, is ignored.
+        header = self._tracker.load(vault_name=self._vault_name,
+                                    part_size=part_size,
+                                    total_size=total_size,
+                                    **file_identity)
+        if header is not None:
+            upload_id = header['upload_id']
+            log.debug("Resuming upload %s, %s of %s parts already uploaded.",
+                      upload_id, len(self._tracker.completed_parts),
+                      total_parts)
+        else:
+            response = self._api.initiate_multipart_upload(self._vault_name,
+                                                           part_size,
+                                                           description)
+            upload_id = response['UploadId']
+            self._tracker.start(vault_name=self._vault_name,
+                                upload_id=upload_id, part_size=part_size,
+                                total_size=total_size, **file_identity)
         # The basic idea is to add the chunks (the offsets not the actual
         # contents) to a work queue, start up a thread pool, let the crank
         # through the items in the work queue, and then place their results
@@ -140,19 +270,28 @@ class ConcurrentUploader(ConcurrentTransferer):
             self._wait_for_upload_threads(hash_chunks, result_queue,
                                           total_parts)
         except UploadArchiveError, e:
-            log.debug("An error occurred while uploading an archive, "
-                      "aborting multipart upload.")
-            self._api.abort_multipart_upload(self._vault_name, upload_id)
+            self._tracker.close()
+            if self._tracker_file_name:
+                log.debug("An error occurred while uploading an archive, "
+                          "multipart upload %s can be resumed.", upload_id)
+            else:
+                log.debug("An error occurred while uploading an archive, "
+                          "aborting multipart upload.")
+                self._api.abort_multipart_upload(self._vault_name, upload_id)
             raise e
         log.debug("Completing upload.")
         response = self._api.complete_multipart_upload(
             self._vault_name, upload_id, bytes_to_hex(tree_hash(hash_chunks)),
             total_size)
+        self._tracker.remove()
         log.debug("Upload finished.")
         return response['ArchiveId']
 
     def _wait_for_upload_threads(self, hash_chunks, result_queue, total_parts):
-        for _ in xrange(total_parts):
+        for part_number, tree_sha256 in \
+                self._tracker.completed_parts.iteritems():
+            hash_chunks[part_number] = tree_sha256
+        for _ in xrange(hash_chunks.count(None)):
             result = result_queue.get()
             if isinstance(result, Exception):
                 log.debug("An error was found in the result queue, terminating "
@@ -165,6 +304,7 @@ class ConcurrentUploader(ConcurrentTransferer):
             # the entire archive.
             part_number, tree_sha256 = result
             hash_chunks[part_number] = tree_sha256
+            self._tracker.record(part_number, tree_sha256)
         self._shutdown_threads()
 
     def _start_upload_threads(self, result_queue, upload_id, worker_queue,
@@ -188,19 +328,25 @@ class TransferThread(threading.Thread):
         self.should_continue = True
 
     def run(self):
-        while self.should_continue:
-            try:
-                work = self._worker_queue.get(timeout=1)
-            except Empty:
-                continue
-            if work is _END_SENTINEL:
-                return
-            result = self._process_chunk(work)
-            self._result_queue.put(result)
+        try:
+            while self.should_continue:
+                try:
+                    work = self._worker_queue.get(timeout=1)
+                except Empty:
+                    continue
+                if work is _END_SENTINEL:
+                    return
+                result = self._process_chunk(work)
+                self._result_queue.put(result)
+        finally:
+            self._cleanup()
 
     def _process_chunk(self, work):
         pass
 
+    def _cleanup(self):
+        pass
+
 
 class UploadWorkerThread(TransferThread):
     def __init__(self, api, vault_name, filename, upload_id,
@@ -217,6 +363,9 @@ class UploadWorkerThread(TransferThread):
         self._time_between_retries = time_between_retries
         self._retry_exceptions = retry_exceptions
 
+    def _cleanup(self):
+        self._fileobj.close()
+
     def _process_chunk(self, work):
         result = None
         for _ in xrange(self._num_retries):
@@ -236,8 +385,9 @@ class UploadWorkerThread(TransferThread):
         start_byte = part_number * part_size
         self._fileobj.seek(start_byte)
         contents = self._fileobj.read(part_size)
-        linear_hash = hashlib.sha256(contents).hexdigest()
-        tree_hash_bytes = tree_hash(chunk_hashes(contents))
+        # The part is read once and hashed in place; hashing happens
+        # concurrently across the upload threads.
+        linear_hash, tree_hash_bytes = compute_hashes_from_part(contents)
         byte_range = (start_byte, start_byte + len(contents) - 1)
         log.debug("Uploading chunk %s of size %s", part_number, part_size)
         response = self._api.upload_part(self._vault_name, self._upload_id,
@@ -259,9 +409,19 @@ class ConcurrentDownloader(ConcurrentTransferer):
     The threadpool is completely managed by this class and is
     transparent to the users of this class.
 
+    Each thread writes the parts it downloads directly to their offset
+    in the destination file, reading at most one tree hash chunk at a
+    time, so memory usage is bounded by the number of threads rather
+    than by the size of the archive.
+
+    If a ``tracker_file_name`` is given, the parts that have been
+    written are saved to that file, and calling ``download`` again with
+    the same tracker file and destination file only fetches the
+    missing parts.
+
     """
     def __init__(self, job, part_size=DEFAULT_PART_SIZE,
-                 num_threads=10):
+                 num_threads=10, tracker_file_name=None):
         """
         :param job: A layer2 job object for archive retrieval object.
 
@@ -269,8 +429,13 @@ class ConcurrentDownloader(ConcurrentTransferer):
             the archive parts.  The part size must be a megabyte multiplied by
             a power of two.
 
+        :type tracker_file_name: str
+        :param tracker_file_name: Optional file name used to save the
+            state of the download so that it can be resumed.
+
         """
-        super(ConcurrentDownloader, self).__init__(part_size, num_threads)
+        super(ConcurrentDownloader, self).__init__(part_size, num_threads,
+                                                   tracker_file_name)
         self._job = job
 
     def download(self, filename):
@@ -283,14 +448,37 @@ class ConcurrentDownloader(ConcurrentTransferer):
         """
         total_size = self._job.archive_size
         total_parts, part_size = self._calculate_required_part_size(total_size)
+        file_name = os.path.abspath(filename)
+        header = None
+        if os.path.exists(filename):
+            # The file's modification time changes as parts are written,
+            # so only its name and size identify it.
+            header = self._tracker.load(job_id=self._job.id,
+                                        part_size=part_size,
+                                        total_size=total_size,
+                                        file_name=file_name,
+                                        file_size=os.stat(filename).st_size)
+        if header is not None:
+            log.debug("Resuming download, %s of %s parts already "
+                      "downloaded.", len(self._tracker.completed_parts),
+                      total_parts)
+        else:
+            self._tracker.start(job_id=self._job.id, part_size=part_size,
+                                total_size=total_size, file_name=file_name,
+                                file_size=total_size)
+            # Size the file up front so that every thread can write
+            # its parts at their final offset.
+            with open(filename, 'wb') as f:
+                f.truncate(total_size)
         worker_queue = Queue()
         result_queue = Queue()
         self._add_work_items_to_queue(total_parts, worker_queue, part_size)
-        self._start_download_threads(result_queue, worker_queue)
+        self._start_download_threads(result_queue, worker_queue, filename)
         try:
             self._wait_for_download_threads(filename, result_queue, total_parts)
         except DownloadArchiveError, e:
             log.debug("An error occurred while downloading an archive: %s", e)
+            self._tracker.close()
             raise e
         log.debug("Download completed.")
 
@@ -299,74 +487,89 @@ class ConcurrentDownloader(ConcurrentTransferer):
         Waits until the result_queue is filled with all the downloaded parts
         This indicates that all part downloads have completed
 
-        Saves downloaded parts into filename
+        The parts themselves are written to filename by the worker
+        threads, only their tree hashes are passed through result_queue.
 
         :param filename:
         :param result_queue:
         :param total_parts:
         """
         hash_chunks = [None] * total_parts
-        with open(filename, "wb") as f:
-            for _ in xrange(total_parts):
-                result = result_queue.get()
-                if isinstance(result, Exception):
-                    log.debug("An error was found in the result queue, "
-                              "terminating threads: %s", result)
-                    self._shutdown_threads()
-                    raise DownloadArchiveError(
-                        "An error occurred while uploading "
-                        "an archive: %s" % result)
-                part_number, part_size, actual_hash, data = result
-                hash_chunks[part_number] = actual_hash
-                start_byte = part_number * part_size
-                f.seek(start_byte)
-                f.write(data)
-                f.flush()
+        for part_number, actual_hash in \
+                self._tracker.completed_parts.iteritems():
+            hash_chunks[part_number] = actual_hash
+        for _ in xrange(hash_chunks.count(None)):
+            result = result_queue.get()
+            if isinstance(result, Exception):
+                log.debug("An error was found in the result queue, "
+                          "terminating threads: %s", result)
+                self._shutdown_threads()
+                raise DownloadArchiveError(
+                    "An error occurred while downloading "
+                    "an archive: %s" % result)
+            part_number, part_size, actual_hash = result
+            hash_chunks[part_number] = actual_hash
+            self._tracker.record(part_number, actual_hash)
         final_hash = bytes_to_hex(tree_hash(hash_chunks))
         log.debug("Verifying final tree hash of archive, expecting: %s, "
                   "actual: %s", self._job.sha256_treehash, final_hash)
+        self._shutdown_threads()
+        # Either way the tracked state is of no further use: the download
+        # is complete, or the file has to be downloaded again from scratch.
+        self._tracker.remove()
         if self._job.sha256_treehash != final_hash:
-            self._shutdown_threads()
             raise TreeHashDoesNotMatchError(
                 "Tree hash for entire archive does not match, "
                 "expected: %s, got: %s" % (self._job.sha256_treehash,
                                            final_hash))
-        self._shutdown_threads()
 
-    def _start_download_threads(self, result_queue, worker_queue):
+    def _start_download_threads(self, result_queue, worker_queue, filename):
         log.debug("Starting threads.")
         for _ in xrange(self._num_threads):
-            thread = DownloadWorkerThread(self._job, worker_queue, result_queue)
+            thread = DownloadWorkerThread(self._job, filename, worker_queue,
+                                          result_queue)
             time.sleep(0.2)
             thread.start()
             self._threads.append(thread)
 
 
 class DownloadWorkerThread(TransferThread):
-    def __init__(self, job,
+    def __init__(self, job, filename,
                  worker_queue, result_queue,
                  num_retries=5,
                  time_between_retries=5,
-                 retry_exceptions=Exception):
+                 retry_exceptions=Exception,
+                 chunk_size=_ONE_MEGABYTE):
         """
         Individual download thread that will download parts of the file from Glacier. Parts
         to download stored in work queue.
 
-        Parts download to a temp dir with each part a separate file
+        Each part is streamed straight to its offset in filename, one
+        chunk at a time.
 
         :param job: Glacier job object
+        :param filename: The file to write the parts to.  It must already
+            exist and be large enough to hold the whole archive.
         :param work_queue: A queue of tuples which include the part_number and
             part_size
-        :param result_queue: A priority queue of tuples which include the
-            part_number and the path to the temp file that holds that
-            part's data.
+        :param result_queue: A queue of tuples which include the
+            part_number, the part_size and the binary tree hash of
+            the part that was written.
+        :param chunk_size: The tree hash chunk size, which is also the
+            amount of data read from the response at a time.
 
         """
         super(DownloadWorkerThread, self).__init__(worker_queue, result_queue)
         self._job = job
+        self._filename = filename
+        self._fileobj = open(filename, 'r+b')
         self._num_retries = num_retries
         self._time_between_retries = time_between_retries
         self._retry_exceptions = retry_exceptions
+        self._chunk_size = chunk_size
+
+    def _cleanup(self):
+        self._fileobj.close()
 
     def _process_chunk(self, work):
         """
@@ -389,21 +592,46 @@ class DownloadWorkerThread(TransferThread):
 
     def _download_chunk(self, work):
         """
-        Downloads a chunk of archive from Glacier. Saves the data to a temp file
-        Returns the part number and temp file location
+        Downloads a chunk of archive from Glacier and writes it to its
+        offset in the file.
+        Returns the part number, part size and tree hash of the chunk
 
         :param work:
         """
         part_number, part_size = work
         start_byte = part_number * part_size
-        byte_range = (start_byte, start_byte + part_size - 1)
+        end_byte = min(start_byte + part_size, self._job.archive_size)
+        byte_range = (start_byte, end_byte - 1)
         log.debug("Downloading chunk %s of size %s", part_number, part_size)
         response = self._job.get_output(byte_range)
-        data = response.read()
-        actual_hash = bytes_to_hex(tree_hash(chunk_hashes(data)))
+        self._fileobj.seek(start_byte)
+        hashes = []
+        data = self._read_chunk(response)
+        while data:
+            hashes.append(hashlib.sha256(data).digest())
+            self._fileobj.write(data)
+            data = self._read_chunk(response)
+        self._fileobj.flush()
+        if not hashes:
+            hashes = [hashlib.sha256('').digest()]
+        tree_hash_bytes = tree_hash(hashes)
+        actual_hash = bytes_to_hex(tree_hash_bytes)
         if response['TreeHash'] != actual_hash:
             raise TreeHashDoesNotMatchError(
                 "Tree hash for part number %s does not match, "
                 "expected: %s, got: %s" % (part_number, response['TreeHash'],
                                            actual_hash))
-        return (part_number, part_size, binascii.unhexlify(actual_hash), data)
+        return (part_number, part_size, tree_hash_bytes)
+
+    def _read_chunk(self, response):
+        # The chunk boundaries must line up with the tree hash chunks,
+        # so keep reading until a full chunk (or the end) is reached.
+        data = []
+        remaining = self._chunk_size
+        while remaining > 0:
+            buf = response.read(remaining)
+            if not buf:
+                break
+            data.append(buf)
+            remaining -= len(buf)
+        return ''.join(data)
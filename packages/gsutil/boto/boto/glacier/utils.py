@@ -21,11 +21,16 @@
 #
 import hashlib
 import math
+import mmap
+import os
+import stat
 
 
 _MEGABYTE = 1024 * 1024
 DEFAULT_PART_SIZE = 4 * _MEGABYTE
 MAXIMUM_NUMBER_OF_PARTS = 10000
+# Number of tree hash chunks read from a file object at a time.
+_CHUNKS_PER_READ = 16
 
 
 def minimum_part_size(size_in_bytes, default_part_size=DEFAULT_PART_SIZE):
@@ -68,16 +73,32 @@ def minimum_part_size(size_in_bytes, default_part_size=DEFAULT_PART_SIZE):
     return part_size
 
 
-def chunk_hashes(bytestring, chunk_size=_MEGABYTE):
-    chunk_count = int(math.ceil(len(bytestring) / float(chunk_size)))
-    hashes = []
-    for i in xrange(chunk_count):
-        start = i * chunk_size
-        end = (i + 1) * chunk_size
-        hashes.append(hashlib.sha256(bytestring[start:end]).digest())
-    if not hashes:
+def _sha256_digest(data):
+    return hashlib.sha256(data).digest()
+
+
+def _chunk_buffers(data, chunk_size):
+    # Buffers let each chunk be hashed without copying it out of data.
+    chunk_count = int(math.ceil(len(data) / float(chunk_size)))
+    return [buffer(data, i * chunk_size, chunk_size)
+            for i in xrange(chunk_count)]
+
+
+def chunk_hashes(bytestring, chunk_size=_MEGABYTE, pool=None):
+    """Compute the SHA-256 hash of each chunk of ``bytestring``.
+
+    :param pool: An optional thread pool (such as a
+        ``multiprocessing.pool.ThreadPool``) used to hash the chunks
+        concurrently.  hashlib releases the GIL while hashing, so this
+        makes use of multiple cores.
+
+    """
+    chunks = _chunk_buffers(bytestring, chunk_size)
+    if not chunks:
         return [hashlib.sha256('').digest()]
-    return hashes
+    if pool is not None and len(chunks) > 1:
+        return pool.map(_sha256_digest, chunks)
+    return [_sha256_digest(chunk) for chunk in chunks]
 
 
 def tree_hash(fo):
@@ -86,35 +107,116 @@ def tree_hash(fo):
     together adjacent hashes until it ends up with one big one. So a
     tree of hashes.
     """
-    hashes = []
-    hashes.extend(fo)
+    hashes = list(fo)
     while len(hashes) > 1:
-        new_hashes = []
-        while True:
-            if len(hashes) > 1:
-                first = hashes.pop(0)
-                second = hashes.pop(0)
-                new_hashes.append(hashlib.sha256(first + second).digest())
-            elif len(hashes) == 1:
-                only = hashes.pop(0)
-                new_hashes.append(only)
-            else:
-                break
-        hashes.extend(new_hashes)
+        new_hashes = [hashlib.sha256(hashes[i] + hashes[i + 1]).digest()
+                      for i in xrange(0, len(hashes) - 1, 2)]
+        if len(hashes) % 2:
+            new_hashes.append(hashes[-1])
+        hashes = new_hashes
     return hashes[0]
 
 
-def compute_hashes_from_fileobj(fileobj, chunk_size=1024 * 1024):
+def _hash_window(window, chunk_size, linear_hash, pool):
+    """Update ``linear_hash`` with ``window`` and hash its chunks.
+
+    With a pool, the chunks are hashed by the pool while the calling
+    thread computes the linear hash.
+
+    """
+    chunks = _chunk_buffers(window, chunk_size)
+    if pool is not None and len(chunks) > 1:
+        result = pool.map_async(_sha256_digest, chunks)
+        linear_hash.update(window)
+        return result.get()
+    linear_hash.update(window)
+    return [_sha256_digest(chunk) for chunk in chunks]
+
+
+def compute_hashes_from_part(part_data, chunk_size=_MEGABYTE, pool=None):
+    """Compute the linear and tree hash of a part held in memory.
+
+    This lets a part be read once and then both hashed and uploaded.
+
+    :param part_data: The data of the part.
+
+    :param chunk_size: The size of the chunks to use for the tree hash.
+
+    :param pool: An optional thread pool used to hash the chunks
+        concurrently, see ``chunk_hashes``.
+
+    :rtype: tuple
+    :return: A tuple of (linear_hash, tree_hash).  The linear hash is
+        returned in hex, the tree hash as the binary digest used to
+        compute the tree hash of the whole archive.
+
+    """
+    linear_hash = hashlib.sha256()
+    hashes = _hash_window(part_data, chunk_size, linear_hash, pool)
+    if not hashes:
+        hashes = [hashlib.sha256('').digest()]
+    return linear_hash.hexdigest(), tree_hash(hashes)
+
+
+def _mmap_fileobj(fileobj):
+    """Memory map fileobj if it is a regular, non-empty file."""
+    try:
+        fileno = fileobj.fileno()
+        file_stat = os.fstat(fileno)
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+    if not stat.S_ISREG(file_stat.st_mode) or not file_stat.st_size:
+        return None
+    try:
+        return mmap.mmap(fileno, file_stat.st_size, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return None
+
+
+def _read_fully(fileobj, size):
+    # Short reads would shift the tree hash chunk boundaries.
+    data = []
+    remaining = size
+    while remaining > 0:
+        buf = fileobj.read(remaining)
+        if not buf:
+            break
+        data.append(buf)
+        remaining -= len(buf)
+    return ''.join(data)
+
+
+def _generate_windows(fileobj, window_size):
+    mapped = _mmap_fileobj(fileobj)
+    if mapped is None:
+        window = _read_fully(fileobj, window_size)
+        while window:
+            yield window
+            window = _read_fully(fileobj, window_size)
+        return
+    try:
+        for offset in xrange(fileobj.tell(), len(mapped), window_size):
+            yield buffer(mapped, offset, window_size)
+        # Leave fileobj where reading it would have.
+        fileobj.seek(len(mapped))
+    finally:
+        mapped.close()
+
+
+def compute_hashes_from_fileobj(fileobj, chunk_size=1024 * 1024, pool=None):
     """Compute the linear and tree hash from a fileobj.
 
     This function will compute the linear/tree hash of a fileobj
-    in a single pass through the fileobj.
+    in a single pass through the fileobj.  Regular files are memory
+    mapped, other file objects are read several chunks at a time.
 
     :param fileobj: A file like object.
 
     :param chunk_size: The size of the chunks to use for the tree
-        hash.  This is also the buffer size used to read from
-        `fileobj`.
+        hash.
+
+    :param pool: An optional thread pool used to hash the chunks
+        concurrently, see ``chunk_hashes``.
 
     :rtype: tuple
     :return: A tuple of (linear_hash, tree_hash).  Both hashes
@@ -123,11 +225,8 @@ def compute_hashes_from_fileobj(fileobj, chunk_size=1024 * 1024):
     """
     linear_hash = hashlib.sha256()
     chunks = []
-    chunk = fileobj.read(chunk_size)
-    while chunk:
-        linear_hash.update(chunk)
-        chunks.append(hashlib.sha256(chunk).digest())
-        chunk = fileobj.read(chunk_size)
+    for window in _generate_windows(fileobj, chunk_size * _CHUNKS_PER_READ):
+        chunks.extend(_hash_window(window, chunk_size, linear_hash, pool))
     if not chunks:
         chunks = [hashlib.sha256('').digest()]
     return linear_hash.hexdigest(), bytes_to_hex(tree_hash(chunks))
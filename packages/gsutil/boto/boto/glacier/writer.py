@@ -22,9 +22,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 #
-import hashlib
-
 from boto.glacier.utils import chunk_hashes, tree_hash, bytes_to_hex
+from boto.glacier.utils import compute_hashes_from_part
 # This import is provided for backwards compatibility.  This function is
 # now in boto.glacier.utils, but any existing code can still import
 # this directly from this module.
@@ -85,12 +84,17 @@ class _Uploader(object):
     Call upload_part for each part (in any order) and then close to complete
     the upload.
 
+    If a hash_pool (such as a ``multiprocessing.pool.ThreadPool``) is
+    given, the tree hash chunks of each part are hashed concurrently.
+
     """
-    def __init__(self, vault, upload_id, part_size, chunk_size=_ONE_MEGABYTE):
+    def __init__(self, vault, upload_id, part_size, chunk_size=_ONE_MEGABYTE,
+                 hash_pool=None):
         self.vault = vault
         self.upload_id = upload_id
         self.part_size = part_size
         self.chunk_size = chunk_size
+        self.hash_pool = hash_pool
         self.archive_id = None
 
         self._uploaded_size = 0
@@ -114,11 +118,11 @@ class _Uploader(object):
         if self.closed:
             raise ValueError("I/O operation on closed file")
         # Create a request and sign it
-        part_tree_hash = tree_hash(chunk_hashes(part_data, self.chunk_size))
+        linear_hash, part_tree_hash = compute_hashes_from_part(
+            part_data, self.chunk_size, self.hash_pool)
         self._insert_tree_hash(part_index, part_tree_hash)
 
         hex_tree_hash = bytes_to_hex(part_tree_hash)
-        linear_hash = hashlib.sha256(part_data).hexdigest()
         start = self.part_size * part_index
         content_range = (start,
                          (start + len(part_data)) - 1)
@@ -169,7 +173,7 @@ def generate_parts_from_fobj(fobj, part_size):
 
 
 def resume_file_upload(vault, upload_id, part_size, fobj, part_hash_map,
-                       chunk_size=_ONE_MEGABYTE):
+                       chunk_size=_ONE_MEGABYTE, hash_pool=None):
     """Resume upload of a file already part-uploaded to Glacier.
 
     The resumption of an upload where the part-uploaded section is empty is a
@@ -187,12 +191,15 @@ def resume_file_upload(vault, upload_id, part_size, fobj, part_hash_map,
         re-uploaded if there is a mismatch.
     :param chunk_size: chunk size of tree hash calculation. This must be
         1 MiB for Amazon.
+    :param hash_pool: optional thread pool used to hash the chunks of each
+        part concurrently.
 
     """
-    uploader = _Uploader(vault, upload_id, part_size, chunk_size)
+    uploader = _Uploader(vault, upload_id, part_size, chunk_size, hash_pool)
     for part_index, part_data in enumerate(
             generate_parts_from_fobj(fobj, part_size)):
-        part_tree_hash = tree_hash(chunk_hashes(part_data, chunk_size))
+        part_tree_hash = tree_hash(chunk_hashes(part_data, chunk_size,
+                                                hash_pool))
         if (part_index not in part_hash_map or
                 part_hash_map[part_index] != part_tree_hash):
             uploader.upload_part(part_index, part_data)
@@ -206,9 +213,14 @@ class Writer(object):
     """
     Presents a file-like object for writing to a Amazon Glacier
     Archive. The data is written using the multi-part upload API.
+
+    Pass a hash_pool (such as a ``multiprocessing.pool.ThreadPool``) to
+    hash the chunks of each part concurrently.
     """
-    def __init__(self, vault, upload_id, part_size, chunk_size=_ONE_MEGABYTE):
-        self.uploader = _Uploader(vault, upload_id, part_size, chunk_size)
+    def __init__(self, vault, upload_id, part_size, chunk_size=_ONE_MEGABYTE,
+                 hash_pool=None):
+        self.uploader = _Uploader(vault, upload_id, part_size, chunk_size,
+                                  hash_pool)
         self.partitioner = _Partitioner(part_size, self._upload_part)
         self.closed = False
         self.next_part_index = 0
@@ -55,6 +55,10 @@ class Plugin(object):
         return True
 
 def get_plugin(cls, requested_capability=None):
+    # Plugins are loaded when first needed rather than when boto is
+    # imported, since loading them scans the plugin directory.
+    import boto
+    load_plugins(boto.config)
     if not requested_capability:
         requested_capability = []
     result = []
@@ -20,11 +20,21 @@
 # IN THE SOFTWARE.
 #
 import boto
+from boto.exception import StorageResponseError
 from boto.pyami.scriptbase import ScriptBase
-import os, StringIO
+import os, StringIO, Queue, threading
 
 class CopyBot(ScriptBase):
 
+    # Largest key that can be copied with a single server-side copy
+    MaxCopySize = 5 * 1024 * 1024 * 1024
+    # Part size of server-side multipart copies
+    CopyPartSize = 512 * 1024 * 1024
+    # Smallest part size, and so memory use per thread, when streaming keys
+    StreamPartSize = 16 * 1024 * 1024
+    # Largest number of parts in a multipart upload
+    MaxParts = 10000
+
     def __init__(self):
         ScriptBase.__init__(self)
         self.wdir = boto.config.get('Pyami', 'working_dir')
@@ -34,14 +44,19 @@ class CopyBot(ScriptBase):
         self.src_name = boto.config.get(self.name, 'src_bucket')
         self.dst_name = boto.config.get(self.name, 'dst_bucket')
         self.replace = boto.config.getbool(self.name, 'replace_dst', True)
+        self.num_threads = boto.config.getint(self.name, 'num_threads', 10)
         s3 = boto.connect_s3()
         self.src = s3.lookup(self.src_name)
         if not self.src:
             boto.log.error('Source bucket does not exist: %s' % self.src_name)
         dest_access_key = boto.config.get(self.name, 'dest_aws_access_key_id', None)
-        if dest_access_key:
+        dest_host = boto.config.get(self.name, 'dest_host', None)
+        if dest_access_key or dest_host:
             dest_secret_key = boto.config.get(self.name, 'dest_aws_secret_access_key', None)
-            s3 = boto.connect(dest_access_key, dest_secret_key)
+            kwargs = {}
+            if dest_host:
+                kwargs['host'] = dest_host
+            s3 = boto.connect_s3(dest_access_key, dest_secret_key, **kwargs)
         self.dst = s3.lookup(self.dst_name)
         if not self.dst:
             self.dst = s3.create_bucket(self.dst_name)
@@ -59,23 +74,126 @@ class CopyBot(ScriptBase):
     def copy_keys(self):
         boto.log.info('src=%s' % self.src.name)
         boto.log.info('dst=%s' % self.dst.name)
+        existing = set()
+        if not self.replace:
+            # one listing of the destination instead of a lookup per key
+            existing = set(key.name for key in self.dst)
+        queue = Queue.Queue(self.num_threads * 2)
+        threads = []
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._copy_worker, args=(queue,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
         try:
             for key in self.src:
-                if not self.replace:
-                    exists = self.dst.lookup(key.name)
-                    if exists:
-                        boto.log.info('key=%s already exists in %s, skipping' % (key.name, self.dst.name))
-                        continue
-                boto.log.info('copying %d bytes from key=%s' % (key.size, key.name))
-                prefix, base = os.path.split(key.name)
-                path = os.path.join(self.wdir, base)
-                key.get_contents_to_filename(path)
-                new_key = self.dst.new_key(key.name)
-                new_key.set_contents_from_filename(path)
-                self.copy_key_acl(key, new_key)
-                os.unlink(path)
+                if key.name in existing:
+                    boto.log.info('key=%s already exists in %s, skipping' % (key.name, self.dst.name))
+                    continue
+                queue.put(key)
+        except:
+            boto.log.exception('Error listing keys in: %s' % self.src.name)
+        for thread in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _copy_worker(self, queue):
+        for key in iter(queue.get, None):
+            try:
+                self.copy_key(key)
+            except:
+                boto.log.exception('Error copying key: %s' % key.name)
+
+    def copy_key(self, key):
+        boto.log.info('copying %d bytes from key=%s' % (key.size, key.name))
+        if self.same_service():
+            try:
+                new_key = self.copy_key_server_side(key)
+            except StorageResponseError, e:
+                # the destination credentials may not be able to read
+                # the source bucket
+                if e.status != 403:
+                    raise
+                boto.log.info('server-side copy of key=%s denied, streaming' % key.name)
+                new_key = self.copy_key_streaming(key)
+        else:
+            new_key = self.copy_key_streaming(key)
+        self.copy_key_acl(key, new_key)
+
+    def same_service(self):
+        # keys can only be copied server-side within one service, even
+        # if the buckets are accessed with different credentials
+        src_conn = self.src.connection
+        dst_conn = self.dst.connection
+        return (src_conn.provider.name == dst_conn.provider.name and
+                src_conn.host == dst_conn.host)
+
+    def part_size(self, size, min_part_size):
+        # parts grow beyond min_part_size for keys that would otherwise
+        # need more than MaxParts parts
+        return max(min_part_size, -(-size // self.MaxParts))
+
+    def copy_key_server_side(self, key):
+        if key.size <= self.MaxCopySize:
+            return self.dst.copy_key(key.name, self.src.name, key.name)
+        src_key = self.src.get_key(key.name)
+        mp = self.dst.initiate_multipart_upload(
+            key.name, headers={'Content-Type': src_key.content_type},
+            metadata=src_key.metadata)
+        part_size = self.part_size(key.size, self.CopyPartSize)
+        try:
+            for part_num, start in enumerate(xrange(0, key.size, part_size)):
+                end = min(start + part_size, key.size) - 1
+                mp.copy_part_from_key(self.src.name, key.name, part_num + 1,
+                                      start, end)
+        except:
+            mp.cancel_upload()
+            raise
+        mp.complete_upload()
+        return self.dst.new_key(key.name)
+
+    def _read_part(self, key, part_size):
+        # multipart parts other than the last must be full sized
+        data = []
+        remaining = part_size
+        while remaining > 0:
+            buf = key.read(remaining)
+            if not buf:
+                break
+            data.append(buf)
+            remaining -= len(buf)
+        return ''.join(data)
+
+    def copy_key_streaming(self, key):
+        # the data goes straight from the source to the destination, one
+        # part at a time, without a temporary file
+        key.open_read()
+        new_key = self.dst.new_key(key.name)
+        new_key.metadata.update(key.metadata)
+        headers = {'Content-Type': key.content_type}
+        part_size = self.part_size(key.size, self.StreamPartSize)
+        if key.size <= part_size:
+            new_key.set_contents_from_string(self._read_part(key, part_size),
+                                             headers)
+            key.close()
+            return new_key
+        mp = self.dst.initiate_multipart_upload(key.name, headers=headers,
+                                                metadata=key.metadata)
+        try:
+            part_num = 0
+            data = self._read_part(key, part_size)
+            while data:
+                part_num += 1
+                mp.upload_part_from_file(StringIO.StringIO(data), part_num)
+                data = self._read_part(key, part_size)
         except:
-            boto.log.exception('Error copying key: %s' % key.name)
+            mp.cancel_upload()
+            key.close()
+            raise
+        key.close()
+        mp.complete_upload()
+        return new_key
 
     def copy_log(self):
         key = self.dst.new_key(self.log_file)
@@ -376,6 +376,32 @@ class S3Connection(AWSAuthConnection):
                                                   self.server_name(port),
                                                   bucket, key) + query_part
 
+    def generate_urls(self, expires_in, method, bucket='', keys=(),
+                      headers=None, query_auth=True, force_http=False,
+                      response_headers=None, expires_in_absolute=False):
+        """
+        Generate a URL for each of many keys of a bucket, as
+        :meth:`generate_url` does for one.
+
+        The URLs all expire at the same time, and are generated as they
+        are iterated over, so that any number of them can be written out
+        without being held in memory at once.
+
+        :type keys: iterable
+        :param keys: The names of the keys to generate URLs for.
+
+        :rtype: generator
+        :return: The URLs, in the order of the keys.
+        """
+        if not expires_in_absolute:
+            expires_in = int(time.time() + expires_in)
+        for key in keys:
+            yield self.generate_url(expires_in, method, bucket, key,
+                                    headers=headers, query_auth=query_auth,
+                                    force_http=force_http,
+                                    response_headers=response_headers,
+                                    expires_in_absolute=True)
+
     def get_all_buckets(self, headers=None):
         response = self.make_request('GET', headers=headers)
         body = response.read()
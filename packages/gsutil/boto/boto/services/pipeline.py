@@ -0,0 +1,193 @@
+# Copyright (c) 2013 Amazon.com, Inc. or its affiliates.
+# All Rights Reserved
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import boto
+from boto.services.message import ServiceMessage
+import threading
+import time
+import Queue
+
+_END_SENTINEL = object()
+
+# SQS acts on at most 10 messages per batch request.
+_MAX_BATCH_SIZE = 10
+
+
+class ServicePipeline(object):
+    """
+    Runs a :class:`boto.services.service.Service` with the stages of
+    each message overlapped instead of in sequence:
+
+    * a reader thread reads input messages from the input queue;
+    * fetcher threads download the input file of each message;
+    * worker threads call the service's process_file;
+    * uploader threads save the results, write the output message
+      and delete the input message.
+
+    The stages are connected by bounded queues, so at most ``prefetch``
+    messages wait between two stages.  While a message is anywhere in
+    the pipeline its visibility timeout is extended every
+    ``visibility_interval`` seconds, so long tasks are not handed to
+    another reader.  A message whose processing fails is left in the
+    input queue and becomes visible again once it stops being extended.
+    """
+
+    def __init__(self, service, num_workers=2, num_fetchers=2,
+                 num_uploaders=1, prefetch=None, visibility_interval=None):
+        self.service = service
+        self.num_workers = num_workers
+        self.num_fetchers = num_fetchers
+        self.num_uploaders = num_uploaders
+        self.prefetch = prefetch or num_workers
+        if visibility_interval is None:
+            visibility_interval = max(1, service.processing_time / 2)
+        self.visibility_interval = visibility_interval
+        self._messages = Queue.Queue(self.prefetch)
+        self._fetched = Queue.Queue(self.prefetch)
+        self._processed = Queue.Queue(self.prefetch)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self):
+        """
+        Process messages until the service's retry_count of
+        consecutive empty reads is reached, then wait for all messages
+        already read to go through the pipeline.
+        """
+        self._stopped.clear()
+        extender = self._start_threads(self._extend_visibility, 1)
+        stages = [(self._read, 1, None),
+                  (self._fetch, self.num_fetchers, self._messages),
+                  (self._work, self.num_workers, self._fetched),
+                  (self._upload, self.num_uploaders, self._processed)]
+        running = [(self._start_threads(target, count), count, queue)
+                   for target, count, queue in stages]
+        # Each stage is shut down once the stage feeding it has exited.
+        for threads, count, queue in running:
+            if queue is not None:
+                for _ in xrange(count):
+                    queue.put(_END_SENTINEL)
+            for thread in threads:
+                thread.join()
+        self._stopped.set()
+        for thread in extender:
+            thread.join()
+
+    def _start_threads(self, target, count):
+        threads = []
+        for _ in xrange(count):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _track(self, message):
+        self._lock.acquire()
+        try:
+            self._in_flight[message.id] = message
+        finally:
+            self._lock.release()
+
+    def _untrack(self, message):
+        self._lock.acquire()
+        try:
+            self._in_flight.pop(message.id, None)
+        finally:
+            self._lock.release()
+        self.service.remove_working_dir(message)
+
+    def _read(self):
+        service = self.service
+        empty_reads = 0
+        num_messages = min(self.prefetch, _MAX_BATCH_SIZE)
+        while service.retry_count < 0 or empty_reads < service.retry_count:
+            try:
+                messages = service.read_messages(num_messages)
+            except Exception:
+                boto.log.exception('Service Failed')
+                messages = []
+            if not messages:
+                empty_reads += 1
+                time.sleep(service.loop_delay)
+                continue
+            empty_reads = 0
+            for message in messages:
+                self._track(message)
+                self._messages.put(message)
+
+    def _fetch(self):
+        for message in iter(self._messages.get, _END_SENTINEL):
+            try:
+                input_file = self.service.get_file(message)
+            except Exception:
+                boto.log.exception('Service Failed')
+                self._untrack(message)
+                continue
+            self._fetched.put((message, input_file))
+
+    def _work(self):
+        for work in iter(self._fetched.get, _END_SENTINEL):
+            input_message, input_file = work
+            try:
+                output_message = ServiceMessage(None,
+                                                input_message.get_body())
+                results = self.service.process_file(input_file,
+                                                    output_message)
+            except Exception:
+                boto.log.exception('Service Failed')
+                self._untrack(input_message)
+                continue
+            self._processed.put((input_message, output_message, results))
+
+    def _upload(self):
+        service = self.service
+        for work in iter(self._processed.get, _END_SENTINEL):
+            input_message, output_message, results = work
+            try:
+                service.save_results(results, input_message, output_message)
+                service.write_message(output_message)
+                service.delete_message(input_message)
+                service.cleanup()
+            except Exception:
+                boto.log.exception('Service Failed')
+            self._untrack(input_message)
+
+    def _extend_visibility(self):
+        while not self._stopped.isSet():
+            self._stopped.wait(self.visibility_interval)
+            if self._stopped.isSet():
+                return
+            self._lock.acquire()
+            try:
+                messages = self._in_flight.values()
+            finally:
+                self._lock.release()
+            timeout = self.service.processing_time
+            for i in xrange(0, len(messages), _MAX_BATCH_SIZE):
+                batch = messages[i:i + _MAX_BATCH_SIZE]
+                try:
+                    self.service.input_queue.change_message_visibility_batch(
+                        [(message, timeout) for message in batch])
+                except Exception:
+                    boto.log.exception('Failed to extend message visibility')
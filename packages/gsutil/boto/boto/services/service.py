@@ -22,10 +22,12 @@
 import boto
 from boto.services.message import ServiceMessage
 from boto.services.servicedef import ServiceDef
+from boto.services.pipeline import ServicePipeline
 from boto.pyami.scriptbase import ScriptBase
 from boto.utils import get_ts
 import time
 import os
+import shutil
 import mimetypes
 
 
@@ -42,6 +44,12 @@ class Service(ScriptBase):
         self.retry_count = self.sd.getint('retry_count', 5)
         self.loop_delay = self.sd.getint('loop_delay', 30)
         self.processing_time = self.sd.getint('processing_time', 60)
+        # with more than one worker, messages are processed by a
+        # ServicePipeline that overlaps S3/SQS I/O with processing
+        self.num_workers = self.sd.getint('num_workers', 1)
+        self.num_fetchers = self.sd.getint('num_fetchers', 2)
+        self.num_uploaders = self.sd.getint('num_uploaders', 1)
+        self.prefetch = self.sd.getint('prefetch', self.num_workers)
         self.input_queue = self.sd.get_obj('input_queue')
         self.output_queue = self.sd.get_obj('output_queue')
         self.output_domain = self.sd.get_obj('output_domain')
@@ -66,15 +74,41 @@ class Service(ScriptBase):
             message[key] = get_ts()
         return message
 
+    # read up to num_messages messages at once
+    def read_messages(self, num_messages):
+        boto.log.info('read_messages')
+        messages = self.input_queue.get_messages(num_messages,
+                                                 self.processing_time)
+        for message in messages:
+            boto.log.info(message.get_body())
+            message['Service-Read'] = get_ts()
+        return messages
+
+    # directory holding the files of a message, which is private to
+    # the message when several messages are processed at once
+    def get_working_dir(self, message):
+        if self.num_workers <= 1:
+            return self.working_dir
+        path = os.path.join(self.working_dir, message.id)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def remove_working_dir(self, message):
+        path = self.get_working_dir(message)
+        if path != self.working_dir:
+            shutil.rmtree(path, ignore_errors=True)
+
     # retrieve the source file from S3
     def get_file(self, message):
         bucket_name = message['Bucket']
         key_name = message['InputKey']
-        file_name = os.path.join(self.working_dir, message.get('OriginalFileName', 'in_file'))
+        file_name = os.path.join(self.get_working_dir(message),
+                                 message.get('OriginalFileName', 'in_file'))
         boto.log.info('get_file: %s/%s to %s' % (bucket_name, key_name, file_name))
         bucket = boto.lookup('s3', bucket_name)
         key = bucket.new_key(key_name)
-        key.get_contents_to_filename(os.path.join(self.working_dir, file_name))
+        key.get_contents_to_filename(file_name)
         return file_name
 
     # process source file, return list of output files
@@ -136,6 +170,8 @@ class Service(ScriptBase):
                 c.terminate_instances([self.instance_id])
 
     def main(self, notify=False):
+        if self.num_workers > 1:
+            return self.main_pipelined()
         self.notify('Service: %s Starting' % self.name)
         empty_reads = 0
         while self.retry_count < 0 or empty_reads < self.retry_count:
@@ -159,3 +195,12 @@ class Service(ScriptBase):
         self.notify('Service: %s Shutting Down' % self.name)
         self.shutdown()
 
+    def main_pipelined(self):
+        self.notify('Service: %s Starting' % self.name)
+        pipeline = ServicePipeline(self, num_workers=self.num_workers,
+                                   num_fetchers=self.num_fetchers,
+                                   num_uploaders=self.num_uploaders,
+                                   prefetch=self.prefetch)
+        pipeline.run()
+        self.notify('Service: %s Shutting Down' % self.name)
+        self.shutdown()
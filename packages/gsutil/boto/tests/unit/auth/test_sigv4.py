@@ -71,3 +71,26 @@ class TestSigV4Handler(unittest.TestCase):
         auth.service_name = 'sqs'
         scope = auth.credential_scope(self.request)
         self.assertEqual(scope, '20121121/us-west-2/sqs/aws4_request')
+
+    def test_signing_key_is_derived_once_per_scope(self):
+        auth = HmacAuthV4Handler('glacier.us-east-1.amazonaws.com',
+                                 Mock(), self.provider)
+        self.request.headers['X-Amz-Date'] = '20121121T000000Z'
+        string_to_sign = auth.string_to_sign(self.request, '')
+
+        k_date = auth._sign('AWS4secret_key', '20121121')
+        k_region = auth._sign(k_date, 'us-east-1')
+        k_service = auth._sign(k_region, 'glacier')
+        k_signing = auth._sign(k_service, 'aws4_request')
+        expected = auth._sign(k_signing, string_to_sign, hex=True)
+        self.assertEqual(auth.signature(self.request, string_to_sign),
+                         expected)
+        self.assertEqual(auth.signature(self.request, string_to_sign),
+                         expected)
+        self.assertEqual(len(auth._signing_keys), 1)
+
+        # A new secret key is signed with a key of its own.
+        self.provider.secret_key = 'other_secret_key'
+        self.assertNotEqual(auth.signature(self.request, string_to_sign),
+                            expected)
+        self.assertEqual(len(auth._signing_keys), 2)
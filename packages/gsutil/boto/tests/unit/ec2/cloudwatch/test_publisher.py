@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# Copyright (c) 2013 Amazon.com, Inc. or its affiliates.  All Rights Reserved
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+import mock
+from tests.unit import unittest
+
+from boto.ec2.cloudwatch import CloudWatchConnection
+from boto.ec2.cloudwatch.publisher import MetricPublisher
+
+
+class TestMetricPublisher(unittest.TestCase):
+    def setUp(self):
+        self.connection = mock.Mock(spec=CloudWatchConnection)
+        self.publisher = MetricPublisher(self.connection)
+
+    def test_values_are_aggregated_into_statistic_sets(self):
+        for value in (3, 1, 2):
+            self.publisher.put('ns', 'Latency', value, unit='Seconds',
+                               dimensions={'Op': 'Get'})
+        self.publisher.flush()
+        self.connection.put_metric_data.assert_called_once_with(
+            'ns', ['Latency'], timestamp=mock.ANY, unit=['Seconds'],
+            dimensions=[{'Op': 'Get'}],
+            statistics=[{'samplecount': 3, 'sum': 6, 'minimum': 1,
+                         'maximum': 3}])
+        self.assertEqual(self.publisher.requests_sent, 1)
+
+    def test_dimensions_are_part_of_the_metric_key(self):
+        self.publisher.put('ns', 'Latency', 1, dimensions={'Op': 'Get'})
+        self.publisher.put('ns', 'Latency', 1, dimensions={'Op': 'Put'})
+        self.publisher.put('ns', 'Latency', 1)
+        self.publisher.flush()
+        args, kwargs = self.connection.put_metric_data.call_args
+        self.assertEqual(len(args[1]), 3)
+        self.assertEqual(kwargs['unit'], ['None'] * 3)
+        self.assertIn({}, kwargs['dimensions'])
+
+    def test_requests_are_split_by_size_and_namespace(self):
+        for i in xrange(45):
+            self.publisher.put('ns1', 'metric%d' % i, 1)
+        self.publisher.put('ns2', 'metric', 1)
+        self.publisher.flush()
+        calls = self.connection.put_metric_data.call_args_list
+        sizes = sorted((c[0][0], len(c[0][1])) for c in calls)
+        self.assertEqual(sizes, [('ns1', 5), ('ns1', 20), ('ns1', 20),
+                                 ('ns2', 1)])
+
+    def test_flush_with_nothing_to_send(self):
+        self.publisher.flush()
+        self.assertFalse(self.connection.put_metric_data.called)
+
+    def test_new_metrics_over_the_limit_are_dropped(self):
+        publisher = MetricPublisher(self.connection, max_metrics=2)
+        self.assertTrue(publisher.put('ns', 'a', 1))
+        self.assertTrue(publisher.put('ns', 'b', 1))
+        self.assertFalse(publisher.put('ns', 'c', 1))
+        # Existing metrics can still be updated.
+        self.assertTrue(publisher.put('ns', 'a', 1))
+        self.assertEqual(publisher.dropped, 1)
+
+    def test_failed_request_is_counted(self):
+        self.connection.put_metric_data.side_effect = Exception('boom')
+        self.publisher.put('ns', 'a', 1)
+        self.publisher.put('ns', 'a', 1)
+        self.publisher.flush()
+        self.assertEqual(self.publisher.requests_failed, 1)
+        self.assertEqual(self.publisher.dropped, 2)
+
+    def test_stop_flushes_remaining_values(self):
+        self.publisher.start()
+        self.publisher.put('ns', 'a', 1)
+        self.publisher.stop()
+        self.assertEqual(self.connection.put_metric_data.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
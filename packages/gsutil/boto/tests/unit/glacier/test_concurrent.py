@@ -20,6 +20,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 #
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+from hashlib import sha256
 from Queue import Queue
 
 import mock
@@ -27,6 +32,8 @@ from tests.unit import unittest
 from tests.unit import AWSMockServiceTestCase
 
 from boto.glacier.concurrent import ConcurrentUploader, ConcurrentDownloader
+from boto.glacier.concurrent import DownloadWorkerThread
+from boto.glacier.utils import bytes_to_hex, chunk_hashes, tree_hash
 
 
 class FakeThreadedConcurrentUploader(ConcurrentUploader):
@@ -41,7 +48,7 @@ class FakeThreadedConcurrentUploader(ConcurrentUploader):
             hash_chunks[i] = 'foo'
 
 class FakeThreadedConcurrentDownloader(ConcurrentDownloader):
-    def _start_download_threads(self, results_queue, worker_queue):
+    def _start_download_threads(self, results_queue, worker_queue, filename):
         self.results_queue = results_queue
         self.worker_queue = worker_queue
 
@@ -58,9 +65,10 @@ class TestConcurrentUploader(unittest.TestCase):
         # Give a default value for tests that don't care
         # what the file size is.
         self.stat_mock.return_value.st_size = 1024 * 1024 * 8
+        self.stat_mock.return_value.st_mtime = 1000.0
 
     def tearDown(self):
-        self.stat_mock = self.stat_patch.start()
+        self.stat_patch.stop()
 
     def test_calculate_required_part_size(self):
         self.stat_mock.return_value.st_size = 1024 * 1024 * 8
@@ -107,7 +115,9 @@ class TestConcurrentUploader(unittest.TestCase):
         job = mock.MagicMock()
         job.archive_size = 8 * 1024 * 1024
         downloader = FakeThreadedConcurrentDownloader(job)
-        downloader.download('foofile')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        downloader.download(os.path.join(tmpdir, 'foofile'))
         q = downloader.worker_queue
         items = [q.get() for i in xrange(q.qsize())]
         self.assertEqual(items[0], (0, 4 * 1024 * 1024))
@@ -115,6 +125,152 @@ class TestConcurrentUploader(unittest.TestCase):
         # 2 for the parts, 10 for the end sentinels (10 threads).
         self.assertEqual(len(items), 12)
 
+    def test_upload_tracker_file_resumes_upload(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tracker_file_name = os.path.join(tmpdir, 'tracker')
+        api_mock = mock.MagicMock()
+        api_mock.initiate_multipart_upload.return_value = {
+            'UploadId': 'upload_id'}
+        uploader = ConcurrentUploader(api_mock, 'vault_name',
+                                      tracker_file_name=tracker_file_name)
+        # Simulate a crash after the first part has been uploaded.
+        uploader._tracker.start(vault_name='vault_name',
+                                upload_id='upload_id',
+                                part_size=4 * 1024 * 1024,
+                                total_size=8 * 1024 * 1024,
+                                file_name=os.path.abspath('foofile'),
+                                file_size=8 * 1024 * 1024,
+                                file_mtime=1000.0)
+        uploader._tracker.record(0, 'a' * 32)
+        uploader._tracker.close()
+
+        uploader = FakeThreadedConcurrentUploader(
+            api_mock, 'vault_name', tracker_file_name=tracker_file_name)
+        api_mock.reset_mock()
+        uploader.upload('foofile')
+        self.assertFalse(api_mock.initiate_multipart_upload.called)
+        api_mock.complete_multipart_upload.assert_called_with(
+            'vault_name', 'upload_id', mock.ANY, 8 * 1024 * 1024)
+        q = uploader.worker_queue
+        items = [q.get() for i in xrange(q.qsize())]
+        # Only the second part is left, plus the 10 end sentinels.
+        self.assertEqual(items[0], (1, 4 * 1024 * 1024))
+        self.assertEqual(len(items), 11)
+        # The tracker file is removed once the upload completes.
+        self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_upload_tracker_file_for_other_upload_is_ignored(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tracker_file_name = os.path.join(tmpdir, 'tracker')
+        with open(tracker_file_name, 'w') as f:
+            f.write('{"vault_name": "vault_name", "upload_id": "old", '
+                    '"part_size": 4194304, "total_size": 1}\n')
+        api_mock = mock.MagicMock()
+        api_mock.initiate_multipart_upload.return_value = {
+            'UploadId': 'upload_id'}
+        uploader = FakeThreadedConcurrentUploader(
+            api_mock, 'vault_name', tracker_file_name=tracker_file_name)
+        uploader.upload('foofile')
+        self.assertTrue(api_mock.initiate_multipart_upload.called)
+        self.assertEqual(uploader.worker_queue.qsize(), 12)
+
+    def test_upload_tracker_file_for_other_file_is_ignored(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tracker_file_name = os.path.join(tmpdir, 'tracker')
+        api_mock = mock.MagicMock()
+        api_mock.initiate_multipart_upload.return_value = {
+            'UploadId': 'upload_id'}
+        uploader = FakeThreadedConcurrentUploader(
+            api_mock, 'vault_name', tracker_file_name=tracker_file_name)
+        # Another file, then the same file after it was modified.
+        for other_file, mtime in (('otherfile', 1000.0), ('foofile', 2000.0)):
+            uploader._tracker.start(vault_name='vault_name',
+                                    upload_id='old',
+                                    part_size=4 * 1024 * 1024,
+                                    total_size=8 * 1024 * 1024,
+                                    file_name=os.path.abspath('foofile'),
+                                    file_size=8 * 1024 * 1024,
+                                    file_mtime=1000.0)
+            uploader._tracker.close()
+            self.stat_mock.return_value.st_mtime = mtime
+            api_mock.reset_mock()
+            uploader.upload(other_file)
+            self.assertTrue(api_mock.initiate_multipart_upload.called)
+
+    def test_upload_error_with_tracker_file_does_not_abort(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        tracker_file_name = os.path.join(tmpdir, 'tracker')
+        api_mock = mock.MagicMock()
+        api_mock.initiate_multipart_upload.return_value = {
+            'UploadId': 'upload_id'}
+        uploader = ConcurrentUploader(api_mock, 'vault_name',
+                                      tracker_file_name=tracker_file_name)
+        uploader._start_upload_threads = mock.Mock()
+        results = Queue()
+        results.put((0, 'a' * 32))
+        results.put(Exception('part upload failed'))
+
+        def start_threads(result_queue, *args):
+            while not results.empty():
+                result_queue.put(results.get())
+        uploader._start_upload_threads.side_effect = start_threads
+        uploader._shutdown_threads = mock.Mock()
+        self.assertRaises(Exception, uploader.upload, 'foofile')
+        self.assertFalse(api_mock.abort_multipart_upload.called)
+        with open(tracker_file_name) as f:
+            lines = f.readlines()
+        self.assertEqual(lines[1], '0 %s\n' % bytes_to_hex('a' * 32))
+
+
+class TestDownloadWorkerThread(unittest.TestCase):
+
+    def setUp(self):
+        super(TestDownloadWorkerThread, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, 'archive')
+        with open(self.filename, 'wb') as f:
+            f.truncate(12)
+
+    def create_worker(self, job):
+        worker = DownloadWorkerThread(job, self.filename, Queue(), Queue(),
+                                      chunk_size=2)
+        self.addCleanup(worker._cleanup)
+        return worker
+
+    def test_part_is_written_at_its_offset(self):
+        data = 'abcd'
+        response = mock.MagicMock()
+        response.__getitem__.return_value = bytes_to_hex(
+            tree_hash(chunk_hashes(data, 2)))
+        # Short reads must not change the tree hash chunk boundaries.
+        body = StringIO(data)
+        response.read.side_effect = lambda amt: body.read(min(amt, 1))
+        job = mock.Mock(archive_size=12)
+        job.get_output.return_value = response
+        worker = self.create_worker(job)
+        result = worker._download_chunk((1, 4))
+        job.get_output.assert_called_with((4, 7))
+        self.assertEqual(result, (1, 4, tree_hash(chunk_hashes(data, 2))))
+        worker._cleanup()
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), '\0' * 4 + 'abcd' + '\0' * 4)
+
+    def test_last_part_range_is_clamped_to_archive_size(self):
+        response = mock.MagicMock()
+        response.__getitem__.return_value = bytes_to_hex(
+            tree_hash([sha256('xy').digest()]))
+        response.read.side_effect = ['xy', '']
+        job = mock.Mock(archive_size=10)
+        job.get_output.return_value = response
+        worker = self.create_worker(job)
+        worker._download_chunk((2, 4))
+        job.get_output.assert_called_with((8, 9))
+
 
 if __name__ == '__main__':
     unittest.main()
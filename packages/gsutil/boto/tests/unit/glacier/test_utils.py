@@ -21,11 +21,14 @@
 #
 import time
 import logging
+import tempfile
+from cStringIO import StringIO
 from hashlib import sha256
+from multiprocessing.pool import ThreadPool
 from tests.unit import unittest
 
 from boto.glacier.utils import minimum_part_size, chunk_hashes, tree_hash, \
-        bytes_to_hex
+        bytes_to_hex, compute_hashes_from_fileobj, compute_hashes_from_part
 
 
 class TestPartSizeCalculations(unittest.TestCase):
@@ -78,6 +81,13 @@ class TestChunking(unittest.TestCase):
         self.assertEqual(len(chunks), 1)
         self.assertEqual(chunks[0], sha256('aaaa').digest())
 
+    def test_chunk_hashes_with_pool(self):
+        pool = ThreadPool(4)
+        self.addCleanup(pool.terminate)
+        bytestring = ''.join(chr(i % 256) for i in xrange(1000))
+        self.assertEqual(chunk_hashes(bytestring, 64, pool),
+                         chunk_hashes(bytestring, 64))
+
 
 class TestTreeHash(unittest.TestCase):
     # For these tests, a set of reference tree hashes were computed.
@@ -114,3 +124,66 @@ class TestTreeHash(unittest.TestCase):
         self.assertEqual(
             self.calculate_tree_hash(''),
             'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855')
+
+    def test_odd_number_of_hashes(self):
+        hashes = [sha256(c).digest() for c in 'abcde']
+        level1 = [sha256(hashes[0] + hashes[1]).digest(),
+                  sha256(hashes[2] + hashes[3]).digest(), hashes[4]]
+        level2 = [sha256(level1[0] + level1[1]).digest(), level1[2]]
+        self.assertEqual(tree_hash(hashes),
+                         sha256(level2[0] + level2[1]).digest())
+
+
+class ShortReader(object):
+    """A file-like object that returns at most max_read bytes per read."""
+    def __init__(self, data, max_read):
+        self._fileobj = StringIO(data)
+        self._max_read = max_read
+
+    def read(self, size):
+        return self._fileobj.read(min(size, self._max_read))
+
+
+class TestComputeHashes(unittest.TestCase):
+    def setUp(self):
+        self.data = ''.join(chr(i % 251) for i in xrange(10000))
+        self.linear_hash = sha256(self.data).hexdigest()
+        self.tree_hash = tree_hash(chunk_hashes(self.data, 128))
+
+    def test_compute_hashes_from_part(self):
+        self.assertEqual(compute_hashes_from_part(self.data, 128),
+                         (self.linear_hash, self.tree_hash))
+
+    def test_compute_hashes_from_part_with_pool(self):
+        pool = ThreadPool(4)
+        self.addCleanup(pool.terminate)
+        self.assertEqual(compute_hashes_from_part(self.data, 128, pool),
+                         (self.linear_hash, self.tree_hash))
+
+    def test_compute_hashes_from_empty_part(self):
+        self.assertEqual(compute_hashes_from_part(''),
+                         (sha256('').hexdigest(), sha256('').digest()))
+
+    def test_compute_hashes_from_fileobj(self):
+        self.assertEqual(
+            compute_hashes_from_fileobj(StringIO(self.data), 128),
+            (self.linear_hash, bytes_to_hex(self.tree_hash)))
+
+    def test_compute_hashes_from_fileobj_with_short_reads(self):
+        fileobj = ShortReader(self.data, 100)
+        self.assertEqual(
+            compute_hashes_from_fileobj(fileobj, 128),
+            (self.linear_hash, bytes_to_hex(self.tree_hash)))
+
+    def test_compute_hashes_from_real_file(self):
+        pool = ThreadPool(4)
+        self.addCleanup(pool.terminate)
+        fileobj = tempfile.TemporaryFile()
+        self.addCleanup(fileobj.close)
+        fileobj.write('prefix' + self.data)
+        fileobj.flush()
+        fileobj.seek(len('prefix'))
+        self.assertEqual(
+            compute_hashes_from_fileobj(fileobj, 128, pool),
+            (self.linear_hash, bytes_to_hex(self.tree_hash)))
+        self.assertEqual(fileobj.tell(), len('prefix') + len(self.data))
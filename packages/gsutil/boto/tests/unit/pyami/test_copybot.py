@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Copyright (c) 2013 Amazon.com, Inc. or its affiliates.  All Rights Reserved
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+from StringIO import StringIO
+
+import mock
+from tests.unit import unittest
+
+from boto.exception import S3ResponseError
+from boto.pyami.copybot import CopyBot
+
+
+def make_key(name, size=10, data=None):
+    key = mock.Mock()
+    key.name = name
+    key.size = size
+    key.metadata = {}
+    key.content_type = 'text/plain'
+    if data is not None:
+        key.read.side_effect = StringIO(data).read
+    return key
+
+
+def make_bucket(name, provider, keys=(), host='s3.amazonaws.com'):
+    bucket = mock.MagicMock()
+    bucket.name = name
+    bucket.connection.provider.name = provider
+    bucket.connection.host = host
+    bucket.__iter__.return_value = iter(keys)
+    return bucket
+
+
+class TestCopyBot(unittest.TestCase):
+    def setUp(self):
+        # Skip __init__, which reads the pyami configuration and
+        # connects to S3.
+        with mock.patch.object(CopyBot, '__init__', return_value=None):
+            self.bot = CopyBot()
+        self.bot.name = 'CopyBot'
+        self.bot.replace = True
+        self.bot.num_threads = 3
+        self.bot.copy_key_acl = mock.Mock()
+
+    def test_same_provider_copies_server_side(self):
+        keys = [make_key('k%d' % i) for i in xrange(5)]
+        self.bot.src = make_bucket('src', 'aws', keys)
+        self.bot.dst = make_bucket('dst', 'aws')
+        self.bot.copy_keys()
+        self.assertEqual(self.bot.dst.copy_key.call_count, 5)
+        self.bot.dst.copy_key.assert_any_call('k3', 'src', 'k3')
+        self.assertFalse(self.bot.dst.new_key.called)
+
+    def test_existing_keys_are_skipped_with_one_listing(self):
+        self.bot.replace = False
+        self.bot.src = make_bucket('src', 'aws',
+                                   [make_key('a'), make_key('b')])
+        self.bot.dst = make_bucket('dst', 'aws', [make_key('a')])
+        self.bot.copy_keys()
+        self.bot.dst.copy_key.assert_called_once_with('b', 'src', 'b')
+        self.assertFalse(self.bot.dst.lookup.called)
+
+    def test_large_key_is_copied_in_parts(self):
+        self.bot.CopyPartSize = 4
+        self.bot.MaxCopySize = 8
+        self.bot.src = make_bucket('src', 'aws')
+        self.bot.dst = make_bucket('dst', 'aws')
+        mp = self.bot.dst.initiate_multipart_upload.return_value
+        self.bot.copy_key(make_key('big', size=10))
+        self.assertEqual(mp.copy_part_from_key.call_args_list, [
+            mock.call('src', 'big', 1, 0, 3),
+            mock.call('src', 'big', 2, 4, 7),
+            mock.call('src', 'big', 3, 8, 9)])
+        self.assertTrue(mp.complete_upload.called)
+
+    def test_other_provider_is_streamed_in_parts(self):
+        self.bot.StreamPartSize = 4
+        self.bot.src = make_bucket('src', 'google')
+        self.bot.dst = make_bucket('dst', 'aws')
+        mp = self.bot.dst.initiate_multipart_upload.return_value
+        uploaded = []
+        mp.upload_part_from_file.side_effect = (
+            lambda fp, part_num: uploaded.append((part_num, fp.read())))
+        self.bot.copy_key(make_key('big', size=10, data='0123456789'))
+        self.assertFalse(self.bot.dst.copy_key.called)
+        self.assertEqual(uploaded, [(1, '0123'), (2, '4567'), (3, '89')])
+        self.assertTrue(mp.complete_upload.called)
+
+    def test_other_host_is_streamed(self):
+        self.bot.src = make_bucket('src', 'aws')
+        self.bot.dst = make_bucket('dst', 'aws', host='objects.example.com')
+        self.bot.copy_key(make_key('small', size=3, data='abc'))
+        self.assertFalse(self.bot.dst.copy_key.called)
+        new_key = self.bot.dst.new_key.return_value
+        new_key.set_contents_from_string.assert_called_once_with(
+            'abc', {'Content-Type': 'text/plain'})
+
+    def test_streamed_parts_grow_to_stay_within_max_parts(self):
+        self.bot.StreamPartSize = 2
+        self.bot.MaxParts = 3
+        self.bot.src = make_bucket('src', 'google')
+        self.bot.dst = make_bucket('dst', 'aws')
+        mp = self.bot.dst.initiate_multipart_upload.return_value
+        uploaded = []
+        mp.upload_part_from_file.side_effect = (
+            lambda fp, part_num: uploaded.append((part_num, fp.read())))
+        self.bot.copy_key(make_key('big', size=10, data='0123456789'))
+        self.assertEqual(uploaded, [(1, '0123'), (2, '4567'), (3, '89')])
+
+    def test_denied_server_side_copy_falls_back_to_streaming(self):
+        self.bot.src = make_bucket('src', 'aws')
+        self.bot.dst = make_bucket('dst', 'aws')
+        self.bot.dst.copy_key.side_effect = S3ResponseError(403, 'Forbidden')
+        self.bot.copy_key(make_key('small', size=3, data='abc'))
+        new_key = self.bot.dst.new_key.return_value
+        new_key.set_contents_from_string.assert_called_once_with(
+            'abc', {'Content-Type': 'text/plain'})
+
+
+if __name__ == '__main__':
+    unittest.main()
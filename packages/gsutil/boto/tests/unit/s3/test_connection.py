@@ -0,0 +1,33 @@
+from tests.unit import unittest
+
+from boto.s3.connection import S3Connection
+
+
+class TestGenerateUrls(unittest.TestCase):
+    def setUp(self):
+        self.conn = S3Connection('access_key', 'secret_key')
+
+    def test_urls_match_those_generated_one_at_a_time(self):
+        urls = self.conn.generate_urls(1000000000, 'GET', 'mybucket',
+                                       ['a', 'b/c', 'd e'],
+                                       expires_in_absolute=True)
+        self.assertEqual(
+            list(urls),
+            [self.conn.generate_url(1000000000, 'GET', 'mybucket', key,
+                                    expires_in_absolute=True)
+             for key in ['a', 'b/c', 'd e']])
+
+    def test_urls_expire_together(self):
+        urls = list(self.conn.generate_urls(3600, 'GET', 'mybucket',
+                                            ['a', 'b']))
+        expires = set(url.split('Expires=')[1].split('&')[0] for url in urls)
+        self.assertEqual(len(expires), 1)
+
+    def test_sign_string_is_unchanged_by_earlier_signatures(self):
+        first = self.conn._auth_handler.sign_string('one')
+        self.conn._auth_handler.sign_string('two')
+        self.assertEqual(self.conn._auth_handler.sign_string('one'), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# Copyright (c) 2013 Amazon.com, Inc. or its affiliates.  All Rights Reserved
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+import threading
+import time
+
+import mock
+from tests.unit import unittest
+
+from boto.services.message import ServiceMessage
+from boto.services.pipeline import ServicePipeline
+
+
+class FakeService(object):
+    """Implements the Service hooks used by ServicePipeline."""
+
+    def __init__(self, messages, process_time=0):
+        self.retry_count = 1
+        self.loop_delay = 0
+        self.processing_time = 60
+        self.input_queue = mock.Mock()
+        self.process_time = process_time
+        self._batches = [messages]
+        self.lock = threading.Lock()
+        self.processing = 0
+        self.max_processing = 0
+        self.deleted = []
+        self.removed = []
+
+    def read_messages(self, num_messages):
+        if self._batches:
+            return self._batches.pop(0)
+        return []
+
+    def get_file(self, message):
+        if message.get('InputKey') == 'missing':
+            raise Exception('no such key')
+        return '/tmp/%s' % message.id
+
+    def process_file(self, in_file_name, output_message):
+        self.lock.acquire()
+        self.processing += 1
+        self.max_processing = max(self.max_processing, self.processing)
+        self.lock.release()
+        time.sleep(self.process_time)
+        self.lock.acquire()
+        self.processing -= 1
+        self.lock.release()
+        return [(in_file_name + '.out', 'text/plain')]
+
+    def save_results(self, results, input_message, output_message):
+        output_message['OutputKey'] = results[0][0]
+
+    def write_message(self, message):
+        pass
+
+    def delete_message(self, message):
+        self.lock.acquire()
+        self.deleted.append(message.id)
+        self.lock.release()
+
+    def cleanup(self):
+        pass
+
+    def remove_working_dir(self, message):
+        self.lock.acquire()
+        self.removed.append(message.id)
+        self.lock.release()
+
+
+def make_message(message_id, input_key='key'):
+    message = ServiceMessage(body={'Bucket': 'bucket', 'InputKey': input_key})
+    message.id = message_id
+    return message
+
+
+class TestServicePipeline(unittest.TestCase):
+    def test_all_messages_are_processed_and_deleted(self):
+        messages = [make_message('m%d' % i) for i in xrange(6)]
+        service = FakeService(messages)
+        ServicePipeline(service, num_workers=3).run()
+        self.assertEqual(sorted(service.deleted),
+                         sorted(m.id for m in messages))
+        self.assertEqual(sorted(service.removed), sorted(service.deleted))
+
+    def test_messages_are_processed_concurrently(self):
+        messages = [make_message('m%d' % i) for i in xrange(4)]
+        service = FakeService(messages, process_time=0.2)
+        ServicePipeline(service, num_workers=4).run()
+        self.assertEqual(service.max_processing, 4)
+
+    def test_failed_message_is_not_deleted(self):
+        messages = [make_message('good'), make_message('bad', 'missing')]
+        service = FakeService(messages)
+        ServicePipeline(service).run()
+        self.assertEqual(service.deleted, ['good'])
+        self.assertEqual(sorted(service.removed), ['bad', 'good'])
+
+    def test_visibility_is_extended_for_messages_in_flight(self):
+        messages = [make_message('slow')]
+        service = FakeService(messages, process_time=0.3)
+        ServicePipeline(service, visibility_interval=0.1).run()
+        self.assertTrue(
+            service.input_queue.change_message_visibility_batch.called)
+        args = service.input_queue.change_message_visibility_batch.call_args
+        self.assertEqual(args[0][0], [(messages[0], 60)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,8 +19,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 #
+import threading
+import time
+
+from mock import Mock
 from tests.unit import unittest
-from boto.connection import AWSQueryConnection
+from boto.connection import AWSQueryConnection, ConnectionPool
 
 
 class TestListParamsSerialization(unittest.TestCase):
@@ -56,5 +60,184 @@ class TestListParamsSerialization(unittest.TestCase):
         }, params)
 
 
+class TestConnectionPool(unittest.TestCase):
+
+    def make_conn(self, ready=True):
+        conn = Mock()
+        if ready:
+            conn._HTTPConnection__response = None
+        else:
+            conn._HTTPConnection__response.isclosed.return_value = False
+        return conn
+
+    def check_out(self, pool, host, conn=None):
+        """Gets a new connection from the pool, as AWSAuthConnection does."""
+        self.assertEqual(pool.get_http_connection(host, True), None)
+        conn = conn or self.make_conn()
+        pool.connection_created(host, True, conn)
+        return conn
+
+    def test_most_recently_returned_ready_connection_is_reused(self):
+        pool = ConnectionPool(wait_timeout=0)
+        old, busy, new = (self.make_conn(), self.make_conn(ready=False),
+                          self.make_conn())
+        for conn in (old, busy, new):
+            pool.put_http_connection('host', True, conn)
+        self.assertTrue(pool.get_http_connection('host', True) is new)
+        self.assertTrue(pool.get_http_connection('host', True) is old)
+        self.assertEqual(pool.in_use('host', True), 2)
+        self.assertEqual(pool.get_http_connection('host', True), None)
+        self.assertEqual(pool.get_http_connection('other', True), None)
+        self.assertEqual(pool.size(), 1)
+        self.assertEqual(pool.stats()['reused'], 2)
+
+    def test_connections_beyond_the_maximum_evict_the_oldest(self):
+        pool = ConnectionPool(max_connections_per_host=2, wait_timeout=0)
+        conns = [self.make_conn() for _ in range(3)]
+        for conn in conns:
+            pool.put_http_connection('host', True, conn)
+        pool.put_http_connection('other', True, self.make_conn())
+        self.assertEqual(pool.size(), 3)
+        self.assertEqual(pool.stats()['evicted'], 1)
+        self.assertTrue(conns[0].close.called)
+        self.assertTrue(pool.get_http_connection('host', True) is conns[2])
+        self.assertTrue(pool.get_http_connection('host', True) is conns[1])
+        self.assertFalse(conns[1].close.called)
+
+    def test_stale_connections_are_evicted(self):
+        pool = ConnectionPool(wait_timeout=0)
+        stale = self.make_conn()
+        pool.put_http_connection('host', True, self.make_conn())
+        pool.host_to_pool[('host', True)].queue[0] = (
+            stale, time.time() - pool.STALE_DURATION - 1)
+        pool.clean()
+        self.assertEqual(pool.size(), 0)
+        self.assertEqual(pool.host_to_pool, {})
+        self.assertEqual(pool.stats()['evicted'], 1)
+        self.assertTrue(stale.close.called)
+
+    def test_evicted_connections_are_closed_once_ready(self):
+        pool = ConnectionPool(max_connections_per_host=1, wait_timeout=0)
+        busy = self.make_conn(ready=False)
+        pool.put_http_connection('host', True, busy)
+        pool.put_http_connection('host', True, self.make_conn())
+        pool.clean()
+        self.assertFalse(busy.close.called)
+        busy._HTTPConnection__response = None
+        pool.last_clean_time = 0
+        pool.clean()
+        self.assertTrue(busy.close.called)
+
+    def test_connections_evicted_by_get_are_counted(self):
+        pool = ConnectionPool(wait_timeout=0)
+        for _ in range(3):
+            pool.put_http_connection('host', True,
+                                     self.make_conn(ready=False))
+        pool.host_to_pool[('host', True)].max_size = 1
+        self.assertEqual(pool.get_http_connection('host', True), None)
+        self.assertEqual(pool.size(), 1)
+        self.assertEqual(pool.stats()['evicted'], 2)
+
+    def test_get_below_the_maximum_does_not_wait(self):
+        pool = ConnectionPool(max_connections_per_host=2, wait_timeout=2.0)
+        # The connections are kept, as dropped ones stop counting.
+        conns = [self.check_out(pool, 'host') for _ in range(2)]
+        self.assertEqual(pool.stats()['wait_time'], 0)
+        self.assertEqual(pool.stats()['created'], 2)
+        self.assertEqual(pool.in_use('host', True), 2)
+
+        # At the maximum, a connection is created anyway once the wait
+        # times out.
+        self.assertEqual(pool.get_http_connection('host', True, 0.05), None)
+        self.assertTrue(pool.stats()['wait_time'] >= 0.05)
+        self.assertEqual(pool.in_use('host', True), 3)
+
+    def test_get_waits_for_a_connection_to_be_returned(self):
+        pool = ConnectionPool(max_connections_per_host=1, wait_timeout=0)
+        conn = self.check_out(pool, 'host')
+        timer = threading.Timer(
+            0.05, pool.put_http_connection, ('host', True, conn))
+        timer.start()
+        self.assertTrue(pool.get_http_connection('host', True, 5) is conn)
+        timer.join()
+        self.assertTrue(0 < pool.stats()['wait_time'] < 5)
+        self.assertEqual(pool.in_use('host', True), 1)
+
+    def test_closed_connections_stop_counting(self):
+        pool = ConnectionPool(max_connections_per_host=1, wait_timeout=5)
+        conn = self.check_out(pool, 'host')
+        pool.connection_closed('host', True, conn)
+        self.assertEqual(pool.in_use('host', True), 0)
+
+        # As do connections that could not be created, and connections
+        # dropped without being returned or closed.
+        self.assertEqual(pool.get_http_connection('host', True), None)
+        pool.connection_closed('host', True)
+        self.check_out(pool, 'host', Mock())
+        self.assertEqual(pool.in_use('host', True), 0)
+        self.assertEqual(pool.stats()['wait_time'], 0)
+
+    def test_returned_connection_wakes_the_waiters_for_its_host(self):
+        pool = ConnectionPool(max_connections_per_host=1, wait_timeout=0)
+        results = {}
+        conn = self.check_out(pool, 'host')
+        other_conn = self.check_out(pool, 'other')
+
+        def wait(host):
+            start = time.time()
+            waited_conn = pool.get_http_connection(host, True, 1)
+            results[host] = (waited_conn, time.time() - start)
+
+        # The waiter for the other host waits first, so that it would be
+        # the only one woken if a single waiter were.
+        waiters = []
+        for host in ('other', 'host'):
+            waiter = threading.Thread(target=wait, args=(host,))
+            waiter.start()
+            waiters.append(waiter)
+            time.sleep(0.05)
+        pool.put_http_connection('host', True, conn)
+        for waiter in waiters:
+            waiter.join()
+        self.assertTrue(results['host'][0] is conn)
+        self.assertTrue(results['host'][1] < 0.5)
+        self.assertEqual(results['other'][0], None)
+        self.assertEqual(pool.in_use('other', True), 2)
+
+    def test_created_connections_are_counted(self):
+        connection = AWSQueryConnection('access_key', 'secret_key')
+        http_connection = connection.new_http_connection('host', True)
+        self.assertEqual(connection._pool.stats()['created'], 1)
+        self.assertEqual(connection._pool.in_use('host', True), 1)
+        connection.close_http_connection('host', True, http_connection)
+        self.assertEqual(connection._pool.in_use('host', True), 0)
+
+    def test_mexe_returns_or_closes_its_connection(self):
+        connection = AWSQueryConnection('access_key', 'secret_key',
+                                        host='example.com')
+        connection._pool = ConnectionPool(wait_timeout=0)
+        host = connection.host
+        request = connection.build_base_http_request('GET', '/', None)
+
+        def ok_sender(http_connection, *unused_args):
+            response = Mock()
+            response.status = 200
+            response.getheader.return_value = None
+            return response
+
+        connection._mexe(request, sender=ok_sender)
+        self.assertEqual(connection._pool.in_use(host, True), 0)
+        self.assertEqual(connection._pool.size(), 1)
+
+        def failing_sender(http_connection, *unused_args):
+            self.assertEqual(connection._pool.in_use(host, True), 1)
+            raise ValueError('failed')
+
+        request = connection.build_base_http_request('GET', '/', None)
+        self.assertRaises(ValueError, connection._mexe, request,
+                          sender=failing_sender)
+        self.assertEqual(connection._pool.in_use(host, True), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -17,7 +17,6 @@
 """Class that runs a named gsutil command."""
 
 import boto
-import os
 
 from boto.storage_uri import BucketStorageUri
 from gslib.command import Command
@@ -25,6 +24,71 @@ from gslib.command import COMMAND_NAME
 from gslib.command import COMMAND_NAME_ALIASES
 from gslib.exception import CommandException
 
+# The names and aliases of the gsutil commands, each mapped to the name of the
+# module in gslib/commands that implements the command. Only the module of the
+# command being run is imported, rather than every module in gslib/commands.
+# When adding a command or alias, add it here too; test_command_runner checks
+# that this agrees with the command_spec of each command.
+COMMAND_MODULES = {
+    'cat': 'cat',
+    'chacl': 'chacl',
+    'config': 'config',
+    'cfg': 'config',
+    'conf': 'config',
+    'configure': 'config',
+    'cp': 'cp',
+    'copy': 'cp',
+    'disablelogging': 'disablelogging',
+    'enablelogging': 'enablelogging',
+    'getacl': 'getacl',
+    'getcors': 'getcors',
+    'getdefacl': 'getdefacl',
+    'getlogging': 'getlogging',
+    'getversioning': 'getversioning',
+    'getwebcfg': 'getwebcfg',
+    'help': 'help',
+    '?': 'help',
+    'man': 'help',
+    'ls': 'ls',
+    'dir': 'ls',
+    'list': 'ls',
+    'mb': 'mb',
+    'makebucket': 'mb',
+    'createbucket': 'mb',
+    'md': 'mb',
+    'mkdir': 'mb',
+    'mv': 'mv',
+    'move': 'mv',
+    'ren': 'mv',
+    'rename': 'mv',
+    'perfdiag': 'perfdiag',
+    'diag': 'perfdiag',
+    'diagnostic': 'perfdiag',
+    'perf': 'perfdiag',
+    'performance': 'perfdiag',
+    'rb': 'rb',
+    'deletebucket': 'rb',
+    'removebucket': 'rb',
+    'removebuckets': 'rb',
+    'rmdir': 'rb',
+    'rm': 'rm',
+    'del': 'rm',
+    'delete': 'rm',
+    'remove': 'rm',
+    'setacl': 'setacl',
+    'setcors': 'setcors',
+    'setdefacl': 'setdefacl',
+    'setmeta': 'setmeta',
+    'setheader': 'setmeta',
+    'setversioning': 'setversioning',
+    'setwebcfg': 'setwebcfg',
+    'test': 'test',
+    'update': 'update',
+    'refresh': 'update',
+    'version': 'version',
+    'ver': 'version',
+}
+
 
 class CommandRunner(object):
 
@@ -44,24 +108,30 @@ class CommandRunner(object):
     self.config_file_list = config_file_list
     self.gsutil_ver = gsutil_ver
     self.bucket_storage_uri_class = bucket_storage_uri_class
-    self.command_map = self._LoadCommandMap()
-
-  def _LoadCommandMap(self):
-    """Returns dict mapping each command_name to implementing class."""
-    # Walk gslib/commands and find all commands.
-    commands_dir = os.path.join(self.gsutil_bin_dir, 'gslib', 'commands')
-    for f in os.listdir(commands_dir):
-      # Handles no-extension files, etc.
-      (module_name, ext) = os.path.splitext(f)
-      if ext == '.py':
-        __import__('gslib.commands.%s' % module_name)
-    command_map = {}
-    # Only include Command subclasses in the dict.
-    for command in Command.__subclasses__():
-      command_map[command.command_spec[COMMAND_NAME]] = command
-      for command_name_aliases in command.command_spec[COMMAND_NAME_ALIASES]:
-        command_map[command_name_aliases] = command
-    return command_map
+
+  def _LoadCommandClass(self, command_name):
+    """Imports the module implementing the named command.
+
+    Args:
+      command_name: The name or an alias of the command.
+
+    Returns:
+      The Command subclass implementing the command.
+
+    Raises:
+      CommandException: if there is no such command.
+    """
+    if command_name not in COMMAND_MODULES:
+      raise CommandException('Invalid command "%s".' % command_name)
+    module_name = 'gslib.commands.%s' % COMMAND_MODULES[command_name]
+    module = __import__(module_name, fromlist=['*'])
+    for value in vars(module).itervalues():
+      if (isinstance(value, type) and issubclass(value, Command)
+          and value.__module__ == module_name):
+        if (command_name == value.command_spec[COMMAND_NAME] or
+            command_name in value.command_spec[COMMAND_NAME_ALIASES]):
+          return value
+    raise CommandException('Invalid command "%s".' % command_name)
 
   def RunNamedCommand(self, command_name, args=None, headers=None, debug=0,
                       parallel_operations=False, test_method=None):
@@ -90,9 +160,7 @@ class CommandRunner(object):
       headers = {}
     headers['x-goog-api-version'] = api_version
 
-    if command_name not in self.command_map:
-      raise CommandException('Invalid command "%s".' % command_name)
-    command_class = self.command_map[command_name]
+    command_class = self._LoadCommandClass(command_name)
     command_inst = command_class(self, args, headers, debug,
                                  parallel_operations, self.gsutil_bin_dir,
                                  self.boto_lib_dir, self.config_file_list,
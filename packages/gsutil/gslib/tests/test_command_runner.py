@@ -0,0 +1,103 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish, dis-
+# tribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the fol-
+# lowing conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABIL-
+# ITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT
+# SHALL THE AUTHOR BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Unit tests for gsutil command loading."""
+
+import json
+import os
+import subprocess
+import sys
+
+from gslib.command import Command
+from gslib.command import COMMAND_NAME
+from gslib.command import COMMAND_NAME_ALIASES
+from gslib.command_runner import COMMAND_MODULES
+from gslib.exception import CommandException
+import gslib.tests.testcase as testcase
+from gslib.tests.testcase.unit_testcase import BOTO_DIR
+from gslib.tests.testcase.unit_testcase import GSUTIL_DIR
+import gslib.tests.util as util
+
+# Measures, in a new interpreter, the start up of gsutil for one command, then
+# the import of the remaining commands as gsutil did before commands were
+# loaded lazily.
+BENCHMARK_SCRIPT = """
+import json, os, sys, time
+sys.path[:0] = [%(gsutil_dir)r, %(boto_dir)r]
+start = time.time()
+from gslib.command_runner import CommandRunner
+runner = CommandRunner(%(gsutil_dir)r, %(boto_dir)r, [], 'benchmark')
+runner._LoadCommandClass('version')
+startup_time = time.time() - start
+# Python 2 records failed relative imports as None in sys.modules.
+startup_modules = sorted(name for (name, module) in sys.modules.items()
+                         if name.startswith('gslib.commands.') and module)
+start = time.time()
+for f in os.listdir(os.path.join(%(gsutil_dir)r, 'gslib', 'commands')):
+  (module_name, ext) = os.path.splitext(f)
+  if ext == '.py':
+    __import__('gslib.commands.%%s' %% module_name)
+print json.dumps({'startup_time': startup_time,
+                  'startup_modules': startup_modules,
+                  'eager_time': startup_time + time.time() - start})
+"""
+
+
+class CommandRunnerTests(testcase.GsUtilUnitTestCase):
+  """gsutil command loading test suite."""
+
+  def testCommandModulesMatchCommandSpecs(self):
+    """Tests that the command index agrees with the commands."""
+    commands_dir = os.path.join(GSUTIL_DIR, 'gslib', 'commands')
+    for f in os.listdir(commands_dir):
+      (module_name, ext) = os.path.splitext(f)
+      if ext == '.py':
+        __import__('gslib.commands.%s' % module_name)
+    expected = {}
+    for command in Command.__subclasses__():
+      module_name = command.__module__.split('.')[-1]
+      expected[command.command_spec[COMMAND_NAME]] = module_name
+      for alias in command.command_spec[COMMAND_NAME_ALIASES]:
+        expected[alias] = module_name
+    self.assertEqual(expected, COMMAND_MODULES)
+
+  def testCommandsAreLoadedByNameOrAlias(self):
+    """Tests loading commands by their names and aliases."""
+    for name in ('ls', 'dir'):
+      command_class = self.command_runner._LoadCommandClass(name)
+      self.assertEqual('ls', command_class.command_spec[COMMAND_NAME])
+    self.assertRaises(CommandException,
+                      self.command_runner._LoadCommandClass, 'nosuchcommand')
+
+  def testStartupBenchmark(self):
+    """Tests that starting gsutil imports only the command it runs."""
+    script = BENCHMARK_SCRIPT % {'gsutil_dir': GSUTIL_DIR,
+                                 'boto_dir': BOTO_DIR}
+    process = subprocess.Popen([sys.executable, '-c', script],
+                               stdout=subprocess.PIPE)
+    (stdout, _) = process.communicate()
+    self.assertEqual(0, process.returncode)
+    results = json.loads(stdout)
+    if util.VERBOSE_OUTPUT:
+      sys.stderr.write('\nStartup took %.3fs, %.3fs with all commands.\n' % (
+          results['startup_time'], results['eager_time']))
+    self.assertEqual(['gslib.commands.version'], results['startup_modules'])
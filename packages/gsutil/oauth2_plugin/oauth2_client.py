@@ -68,6 +68,13 @@ token_exchange_lock = threading.Lock()
 # SHA1 sum of the CA certificates file imported from boto.
 CACERTS_FILE_SHA1SUM = 'ed024a78d9327f8669b3b117d9eac9e3c9460e9b'
 
+# Access tokens are refreshed once they expire within this many seconds
+# (see AccessToken.ShouldRefresh).  Until they expire within
+# ACCESS_TOKEN_MIN_LIFETIME seconds, other threads keep using them while
+# one thread refreshes them.
+ACCESS_TOKEN_REFRESH_MARGIN = 300
+ACCESS_TOKEN_MIN_LIFETIME = 60
+
 class Error(Exception):
   """Base exception for the OAuth2 module."""
   pass
@@ -293,6 +300,10 @@ class OAuth2Client(object):
     self._proxy = proxy
 
     self.access_token_cache = access_token_cache or InMemoryTokenCache()
+    # Access tokens by cache key, in front of access_token_cache. Reading
+    # a dict is atomic, so unexpired tokens are served from here without
+    # taking token_exchange_lock or reading the access_token_cache.
+    self._access_tokens = {}
 
     self.ca_certs_file = os.path.join(
         os.path.dirname(os.path.abspath(cacerts.__file__)), 'cacerts.txt')
@@ -357,10 +368,16 @@ class OAuth2Client(object):
   def GetAccessToken(self, refresh_token):
     """Given a RefreshToken, obtains a corresponding access token.
 
-    First, this client's access token cache is checked for an existing,
-    not-yet-expired access token for the provided refresh token.  If none is
-    found, the client obtains a fresh access token for the provided refresh
-    token from the OAuth2 provider's token endpoint.
+    An access token this client already holds is returned without locking
+    unless it is about to expire.  Otherwise, this client's access token
+    cache is checked for an existing, not-yet-expired access token for the
+    provided refresh token, which another process may have stored.  If
+    none is found, the client obtains a fresh access token for the provided
+    refresh token from the OAuth2 provider's token endpoint.
+
+    Only one thread at a time refreshes the access token.  While the held
+    token is still valid for ACCESS_TOKEN_MIN_LIFETIME seconds, other
+    threads keep using it meanwhile instead of waiting for the refresh.
 
     Args:
       refresh_token: The RefreshToken object which to get an access token for.
@@ -369,21 +386,40 @@ class OAuth2Client(object):
     Raises:
       AccessTokenRefreshError if an error occurs.
     """
+    cache_key = refresh_token.CacheKey()
+    access_token = self._access_tokens.get(cache_key)
+    if access_token is not None and not access_token.ShouldRefresh(
+        ACCESS_TOKEN_REFRESH_MARGIN):
+      return access_token
+
     # Ensure only one thread at a time attempts to get (and possibly refresh)
     # the access token. This doesn't prevent concurrent refresh attempts across
     # multiple gsutil instances, but at least protects against multiple threads
     # simultaneously attempting to refresh when gsutil -m is used.
-    token_exchange_lock.acquire()
+    if access_token is not None and not access_token.ShouldRefresh(
+        ACCESS_TOKEN_MIN_LIFETIME):
+      if not token_exchange_lock.acquire(False):
+        # Another thread is refreshing the token, which is still valid.
+        return access_token
+    else:
+      token_exchange_lock.acquire()
     try:
-      cache_key = refresh_token.CacheKey()
+      # Another thread may have refreshed the token while this one waited.
+      access_token = self._access_tokens.get(cache_key)
+      if access_token is not None and not access_token.ShouldRefresh(
+          ACCESS_TOKEN_REFRESH_MARGIN):
+        return access_token
+
       LOG.info('GetAccessToken: checking cache for key %s', cache_key)
       access_token = self.access_token_cache.GetToken(cache_key)
       LOG.debug('GetAccessToken: token from cache: %s', access_token)
-      if access_token is None or access_token.ShouldRefresh():
+      if access_token is None or access_token.ShouldRefresh(
+          ACCESS_TOKEN_REFRESH_MARGIN):
         LOG.info('GetAccessToken: fetching fresh access token...')
         access_token = self.FetchAccessToken(refresh_token)
         LOG.debug('GetAccessToken: fresh access token: %s', access_token)
         self.access_token_cache.PutToken(cache_key, access_token)
+      self._access_tokens[cache_key] = access_token
       return access_token
     finally:
       token_exchange_lock.release()
@@ -541,6 +577,7 @@ class OAuth2Client(object):
       if refresh_token_string:
         refresh_token = RefreshToken(self, refresh_token_string)
         self.access_token_cache.PutToken(refresh_token.CacheKey(), access_token)
+        self._access_tokens[refresh_token.CacheKey()] = access_token
     finally:
       token_exchange_lock.release()
 
@@ -585,7 +622,7 @@ class AccessToken(object):
       kv['expiry'] = ','.join([str(i) for i in tupl])
     return urllib.urlencode(kv)
 
-  def ShouldRefresh(self, time_delta=300):
+  def ShouldRefresh(self, time_delta=ACCESS_TOKEN_REFRESH_MARGIN):
     """Whether the access token needs to be refreshed.
 
     Args:
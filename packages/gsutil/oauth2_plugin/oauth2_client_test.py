@@ -177,6 +177,56 @@ class OAuth2ClientTest(unittest.TestCase):
     self.assertEquals(self.mock_datetime.mock_now + datetime.timedelta(minutes=60),
                       token_3.expiry)
 
+  def testGetAccessTokenServesHeldTokensWithoutTheCache(self):
+
+    class CountingTokenCache(oauth2_client.InMemoryTokenCache):
+      gets = 0
+
+      def GetToken(self, key):
+        self.gets += 1
+        return super(CountingTokenCache, self).GetToken(key)
+
+    self.client.access_token_cache = CountingTokenCache()
+    self.opener.open_result = '{"access_token":"abc123","expires_in":3600}'
+    cred = oauth2_client.RefreshToken(self.client, 'ref_token')
+
+    for _ in range(3):
+      self.assertEquals('abc123', self.client.GetAccessToken(cred).token)
+    self.assertEquals(1, self.client.access_token_cache.gets)
+
+  def testGetAccessTokenUsesTokensRefreshedByOtherProcesses(self):
+    self.opener.open_result = '{"access_token":"abc123","expires_in":3600}'
+    cred = oauth2_client.RefreshToken(self.client, 'ref_token')
+    self.client.GetAccessToken(cred)
+
+    # Another process sharing the cache refreshes the token.
+    self.mock_datetime.mock_now = (
+        self.start_time + datetime.timedelta(minutes=56))
+    refreshed_token = oauth2_client.AccessToken(
+        'zyx456', self.start_time + datetime.timedelta(minutes=116),
+        datetime_strategy=self.mock_datetime)
+    self.client.access_token_cache.PutToken(cred.CacheKey(), refreshed_token)
+
+    self.opener.reset()
+    self.assertEquals(refreshed_token, self.client.GetAccessToken(cred))
+    self.assertEquals(None, self.opener.open_capture_url)
+
+  def testOtherThreadsUseTheHeldTokenWhileItIsRefreshed(self):
+    self.opener.open_result = '{"access_token":"abc123","expires_in":3600}'
+    cred = oauth2_client.RefreshToken(self.client, 'ref_token')
+    token = self.client.GetAccessToken(cred)
+
+    # The token is due for a refresh, which another thread is doing.
+    self.mock_datetime.mock_now = (
+        self.start_time + datetime.timedelta(minutes=56))
+    self.opener.reset()
+    oauth2_client.token_exchange_lock.acquire()
+    try:
+      self.assertEquals(token, self.client.GetAccessToken(cred))
+    finally:
+      oauth2_client.token_exchange_lock.release()
+    self.assertEquals(None, self.opener.open_capture_url)
+
   def testGetAuthorizationUri(self):
     authn_uri = self.client.GetAuthorizationUri(
         'https://www.example.com/oauth/redir?mode=approve%20me',